@@ -1,86 +1,320 @@
+!If the ln likelihood is certainly smaller than loglike_min the
+!transit chi2 is not completed, and chi2_tr = huge
 subroutine get_loglike(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr, &
-           tlab,jrvlab,tff,flags,&
-           t_cad,n_cad,pars,rvs,ldc,trends,jrv,jtr, &
+           tlab,jrvlab,tff,flags,lin_pri,&
+           t_cad,n_cad,otab,cad_tol,pars,rvs,ldc,trends,jrv,jtr,loglike_min, &
            loglike,chi2_rv,chi2_tr,npl,n_tel,n_jrv,size_rv,size_tr)
 implicit none
 
 !In/Out variables
-  integer, intent(in) :: size_rv, size_tr, npl, n_tel,n_jrv,n_cad !size of RV and LC data
+  integer, intent(in) :: size_rv, size_tr, npl, n_tel,n_jrv !size of RV and LC data
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
   double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
   double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
   integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
 !pars = T0, P, e, w, b, a/R*, Rp/R*, K -> for each planet
   double precision, intent(in) :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1)
-  double precision, intent(in) :: t_cad
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
   double precision, intent(in) :: trends(0:1)
   double precision, dimension(0:n_jrv-1), intent(in) :: jrv
-  double precision, intent(in) :: jtr
-  logical, intent(in) :: flags(0:5)
+  double precision, intent(in) :: jtr, loglike_min
+  logical, intent(in) :: flags(0:7)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
   logical, intent(in) :: tff(0:1) !total_fit_flag
   double precision, intent(out) :: loglike, chi2_rv, chi2_tr
 !Local variables
-  double precision :: chi2_total
-  double precision :: log_errs
+  double precision :: chi2_total, chi2_max
+  double precision :: log_errs, lnl_lin
   double precision :: two_pi = 2.d0*3.1415926535897932384626d0
+  logical :: tf(0:1)
   integer :: m
   external:: get_total_chi2
 
-  !Calcualte the chi2
-  call get_total_chi2(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr, &
-           tlab,jrvlab,tff,flags,&
-           t_cad,n_cad,pars,rvs,ldc,trends,jrv,jtr, &
-           chi2_rv,chi2_tr,npl,n_tel,n_jrv,size_rv,size_tr)
-
-
   !Calculate the normalization term
     log_errs = 0.0
-    if ( tff(0)  .and. size_rv > 1) then
+    tf(0) = tff(0) .and. size_rv > 1
+    if ( tf(0) ) then
       do m = 0, size_rv - 1
         log_errs = log_errs + &
         log( 1.0d0/sqrt( two_pi * ( e_rv(m)**2 + jrv(jrvlab(m))**2 ) ) )
       end do
-    else
-      chi2_rv = 0.d0
     end if
 
-    if ( tff(1) .and. size_tr > 1 ) then
+    tf(1) = tff(1) .and. size_tr > 1
+    if ( tf(1) ) then
       log_errs = log_errs + &
       sum(log( 1.0d0/sqrt( two_pi * ( e_tr(:)**2 + jtr**2 ) ) ) )
-    else
-      chi2_tr = 0.d0
     end if
 
+  !Largest chi2 that can give loglike_min, the margin avoids to stop
+  !because of round-off differences
+  chi2_max = huge(0.d0)
+  if ( loglike_min > -huge(0.d0) ) then
+    chi2_max = 2.d0 * ( log_errs - loglike_min )
+    chi2_max = chi2_max + 1.d-6 * ( 1.d0 + abs(chi2_max) )
+  end if
+
+  !Calcualte the chi2
+  call get_total_chi2(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr, &
+           tlab,jrvlab,tf,flags,lin_pri,&
+           t_cad,n_cad,otab,cad_tol,pars,rvs,ldc,trends,jrv,jtr,chi2_max, &
+           chi2_rv,chi2_tr,lnl_lin,npl,n_tel,n_jrv,size_rv,size_tr)
+
     chi2_total = chi2_rv + chi2_tr
 
-    loglike = log_errs - 0.5d0 * chi2_total
+    !lnl_lin is not zero if linear RV parameters are marginalized
+    loglike = log_errs - 0.5d0 * chi2_total + lnl_lin
+
+end subroutine
+
+
+!ln posterior (ln prior + ln likelihood) of a set of parameters
+!The priors of the planet parameters include the prior on a/R*
+!from the stellar parameters (afk) of the planets that use it.
+!If the parameters are outside the prior limits (is_good = .false.)
+!the likelihood is not computed and chi2_rv, chi2_tr do not change
+!If log_prior + beta * ln likelihood is certainly smaller than lnp_min
+!the likelihood is not completed (see get_loglike), lnp_min = -huge
+!always gives the complete likelihood
+subroutine get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr, &
+           tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars, &
+           pars,rvs,ldc,trends,jrv,jtr,beta,lnp_min, &
+           priors,priors_ldc,log_prior,logpost,chi2_rv,chi2_tr,is_good, &
+           npl,n_tel,n_jrv,size_rv,size_tr)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: size_rv, size_tr, npl, n_tel,n_jrv !size of RV and LC data
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  character, intent(in) :: fit_all(0:8*npl-1), fit_ldc(0:1)
+  double precision, intent(in) :: lims(0:2*8*npl-1), lims_ldc(0:3)
+  logical, intent(in) :: afk(0:npl-1)
+  double precision, intent(in) :: stellar_pars(0:3)
+!pars = T0, P, e, w, b, a/R*, Rp/R*, K -> for each planet
+  double precision, intent(in) :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1)
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
+  double precision, intent(in) :: trends(0:1)
+  double precision, dimension(0:n_jrv-1), intent(in) :: jrv
+  double precision, intent(in) :: jtr, beta, lnp_min
+  logical, intent(in) :: flags(0:7)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  logical, intent(in) :: tff(0:1) !total_fit_flag
+  double precision, intent(out) :: priors(0:8*npl-1), priors_ldc(0:1)
+  double precision, intent(out) :: log_prior, logpost
+  double precision, intent(inout) :: chi2_rv, chi2_tr
+  logical, intent(out) :: is_good
+!Local variables
+  double precision :: a_mean, a_sigma, loglike, loglike_min
+  double precision :: P_pl(0:npl-1), a_pl(0:npl-1)
+  integer :: m
+
+  call get_priors(fit_all,lims,pars,priors,8*npl)
+  call get_priors(fit_ldc,lims_ldc,ldc,priors_ldc,2)
+
+  do m = 0, npl - 1
+    if ( afk(m) ) then
+      !The parameter comes from 3rd Kepler law
+      call get_a_err(stellar_pars(0),stellar_pars(1),stellar_pars(2),stellar_pars(3),&
+           pars(1+8*m),a_mean,a_sigma)
+      call gauss_prior(a_mean,a_sigma,pars(5+8*m),priors(5+8*m))
+    end if
+  end do
+
+  !Let us check if the parameters are inside the limits
+  is_good = .true.
+  if ( product(priors) * product(priors_ldc) < 1.d-100 ) is_good = .false.
+  if ( is_good ) then
+    if ( any( jrv < 0.0d0 ) .or. jtr < 0.0d0 ) is_good = .false.
+  end if
+  !The planet cannot orbit inside the star, a/R* < 1 is outside the priors
+  if ( is_good .and. tff(1) ) then
+    P_pl(:) = pars(1:8*npl-1:8)
+    if ( flags(0) ) P_pl(:) = 1.d1**P_pl(:)
+    a_pl(:) = pars(5:8*npl-1:8)
+    if ( flags(3) ) call rhotoa(pars(5),P_pl,a_pl,npl)
+    if ( any( a_pl < 1.d0 ) ) is_good = .false.
+  end if
+
+  loglike = -huge(0.e0)
+
+  log_prior = sum( log(priors) ) + sum( log(priors_ldc) )
+
+  if ( is_good ) then
+    loglike_min = -huge(0.d0)
+    if ( lnp_min > -huge(0.d0) ) loglike_min = ( lnp_min - log_prior ) / beta
+    call get_loglike(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab, &
+         tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol,pars,rvs,ldc,trends,jrv,jtr,loglike_min, &
+         loglike,chi2_rv,chi2_tr,npl,n_tel,n_jrv,size_rv,size_tr)
+  end if
+
+  logpost = log_prior + loglike
 
 end subroutine
 
+!get_logpost for npts points, the rows of x are the vectors of
+!pack_walker. The points are evaluated in parallel with OpenMP
+!loglike is the ln likelihood without the prior, it is -huge and
+!the chi2 are huge when the point is outside the priors
+subroutine get_logpost_batch(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr, &
+           tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars, &
+           x,log_prior,loglike,chi2_rv,chi2_tr,is_good, &
+           npts,npl,n_tel,n_jrv,size_rv,size_tr)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: npts, size_rv, size_tr, npl, n_tel,n_jrv
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  character, intent(in) :: fit_all(0:8*npl-1), fit_ldc(0:1)
+  double precision, intent(in) :: lims(0:2*8*npl-1), lims_ldc(0:3)
+  logical, intent(in) :: afk(0:npl-1)
+  double precision, intent(in) :: stellar_pars(0:3)
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
+  logical, intent(in) :: flags(0:7)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  logical, intent(in) :: tff(0:1) !total_fit_flag
+  double precision, intent(in) :: x(0:npts-1,0:8*npl+n_tel+n_jrv+4)
+  double precision, intent(out), dimension(0:npts-1) :: log_prior, loglike
+  double precision, intent(out), dimension(0:npts-1) :: chi2_rv, chi2_tr
+  logical, intent(out), dimension(0:npts-1) :: is_good
+!Local variables
+  double precision :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1), trends(0:1)
+  double precision :: jrv(0:n_jrv-1), jtr, priors(0:8*npl-1), priors_ldc(0:1)
+  double precision :: logpost
+  integer :: i
+  external :: unpack_walker
+
+  !$OMP PARALLEL DO SCHEDULE(DYNAMIC) &
+  !$OMP PRIVATE(pars,rvs,ldc,trends,jrv,jtr,priors,priors_ldc,logpost)
+  do i = 0, npts - 1
+    call unpack_walker(x(i,:),pars,ldc,rvs,trends,jrv,jtr,npl,n_tel,n_jrv)
+    chi2_rv(i) = huge(0.d0)
+    chi2_tr(i) = huge(0.d0)
+    call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+         fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,pars,rvs,ldc,trends,jrv,jtr,  &
+         1.d0,-huge(0.d0),                                                            &
+         priors,priors_ldc,log_prior(i),logpost,chi2_rv(i),chi2_tr(i),is_good(i),     &
+         npl,n_tel,n_jrv,size_rv,size_tr)
+    loglike(i) = -huge(0.d0)
+    if ( is_good(i) ) loglike(i) = logpost - log_prior(i)
+  end do
+  !$OMP END PARALLEL DO
+
+end subroutine
+
+!Draws of the linear parameters marginalized in the RV likelihood
+!(see rv_linear) for npts points, the rows of x are the vectors of
+!pack_walker. The marginalized parameters of x are replaced by draws
+!of their normal conditional posterior, z are normal random numbers
+subroutine linear_draws(x_rv,y_rv,e_rv,tlab,jrvlab,flags,lin_pri,x,z, &
+           npts,npl,n_tel,n_jrv,size_rv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: npts, size_rv, npl, n_tel, n_jrv
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  logical, intent(in) :: flags(0:7)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  double precision, intent(inout) :: x(0:npts-1,0:8*npl+n_tel+n_jrv+4)
+  double precision, intent(in) :: z(0:npts-1,0:n_tel+2+npl-1)
+!Local variables
+  double precision :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1), trends(0:1)
+  double precision :: jrv(0:n_jrv-1), jtr, chi2, lnl_lin
+  double precision :: pars_rv(0:7+n_tel-1,0:npl-1)
+  double precision :: theta(0:n_tel+2+npl-1), y(0:n_tel+2+npl-1)
+  double precision :: chol(0:n_tel+2+npl-1,0:n_tel+2+npl-1)
+  integer :: idx(0:n_tel+2+npl-1)
+  logical :: flag_rv(0:3)
+  integer :: i, j, m, na
+  external :: unpack_walker, rv_linear
+
+  na = 0
+  do j = 0, n_tel + 2 + npl - 1
+    if ( lin_pri(3*j) > 0.d0 ) then
+      idx(na) = j
+      na = na + 1
+    end if
+  end do
+
+  flag_rv(0:1) = flags(0:1)
+  flag_rv(2:3) = flags(4:5)
 
+  !$OMP PARALLEL DO SCHEDULE(DYNAMIC) &
+  !$OMP PRIVATE(pars,rvs,ldc,trends,jrv,jtr,chi2,lnl_lin,pars_rv,theta,y,chol,j,m)
+  do i = 0, npts - 1
+    call unpack_walker(x(i,:),pars,ldc,rvs,trends,jrv,jtr,npl,n_tel,n_jrv)
+    do m = 0, npl - 1
+      pars_rv(0:3,m) = pars(8*m:8*m+3)
+      pars_rv(4,m) = pars(8*m+7)
+      pars_rv(5:6,m) = trends(:)
+      pars_rv(7:7+n_tel-1,m) = rvs(:)
+    end do
+    call rv_linear(x_rv,y_rv,e_rv,tlab,jrvlab,pars_rv,jrv,flag_rv,lin_pri, &
+         theta,chol,chi2,lnl_lin,size_rv,n_tel,n_jrv,npl)
+    if ( chi2 >= huge(0.d0) ) cycle
+    !The covariance is (L L^T)^-1, L^T y = z gives y with this covariance
+    do j = na - 1, 0, -1
+      y(j) = ( z(i,j) - sum( chol(j+1:na-1,j) * y(j+1:na-1) ) ) / chol(j,j)
+    end do
+    do j = 0, na - 1
+      m = idx(j)
+      !rv0 and the trends follow the ldc in x, k is the last parameter of each planet
+      if ( m < n_tel + 2 ) then
+        x(i,8*npl+2+m) = theta(m) + y(j)
+      else
+        x(i,8*(m-n_tel-2)+7) = theta(m) + y(j)
+      end if
+    end do
+  end do
+  !$OMP END PARALLEL DO
+
+end subroutine
+
+!The RV chi2 is computed first, the transit chi2 is not completed
+!if chi2_rv - 2 lnl_lin + chi2_tr is certainly larger than chi2_max
 subroutine get_total_chi2(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr, &
-           tlab,jrvlab,tff,flags,&
-           t_cad,n_cad,pars,rvs,ldc,trends,jrv,jtr, &
-           chi2_rv,chi2_tr,npl,n_tel,n_jrv,size_rv,size_tr)
+           tlab,jrvlab,tff,flags,lin_pri,&
+           t_cad,n_cad,otab,cad_tol,pars,rvs,ldc,trends,jrv,jtr,chi2_max, &
+           chi2_rv,chi2_tr,lnl_lin,npl,n_tel,n_jrv,size_rv,size_tr)
 implicit none
 
 !In/Out variables
-  integer, intent(in) :: size_rv, size_tr, npl, n_tel,n_jrv,n_cad !size of RV and LC data
+  integer, intent(in) :: size_rv, size_tr, npl, n_tel,n_jrv !size of RV and LC data
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
   double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
   double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
   integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
 !pars = T0, P, e, w, b, a/R*, Rp/R*, K -> for each planet
   double precision, intent(in) :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1)
-  double precision, intent(in) :: t_cad
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
   double precision, intent(in) :: trends(0:1)
   double precision, dimension(0:n_jrv-1), intent(in) :: jrv
-  double precision, intent(in) :: jtr
-  logical, intent(in) :: flags(0:5)
+  double precision, intent(in) :: jtr, chi2_max
+  logical, intent(in) :: flags(0:7)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
   logical, intent(in) :: tff(0:1) !total_fit_flag
-  double precision, intent(out) :: chi2_rv, chi2_tr
+  double precision, intent(out) :: chi2_rv, chi2_tr, lnl_lin
 !Local variables
   double precision :: pars_rv(0:7+n_tel-1,0:npl-1)
   double precision :: pars_tr(0:6,0:npl-1)
-  logical :: flag_rv(0:3), flag_tr(0:3)
+  double precision :: chi2_tr_max
+  logical :: flag_rv(0:3), flag_tr(0:5)
   integer :: i, j
 
   !Create the parameter variables for rv and tr
@@ -94,20 +328,25 @@ implicit none
   end do
 
   !Put the correct flags
-  flag_tr(:)   = flags(0:3)
+  flag_tr(0:3) = flags(0:3)
+  flag_tr(4)   = flags(6)
+  flag_tr(5)   = flags(7)
   flag_rv(0:1) = flags(0:1)
   flag_rv(2:3) = flags(4:5)
 
   !Let us calculate chi2
   chi2_rv = 0.d0
   chi2_tr = 0.d0
+  lnl_lin = 0.d0
 
-  if (tff(1) ) &
-  call find_chi2_tr(x_tr,y_tr,e_tr,pars_tr,jtr,flag_tr,&
-                        ldc,n_cad,t_cad,chi2_tr,size_tr,npl)
   if (tff(0) ) &
   call find_chi2_rv(x_rv,y_rv,e_rv,tlab,jrvlab,pars_rv,jrv,&
-                    flag_rv,chi2_rv,size_rv,n_tel,n_jrv,npl)
+                    flag_rv,lin_pri,chi2_rv,lnl_lin,size_rv,n_tel,n_jrv,npl)
+  chi2_tr_max = huge(0.d0)
+  if ( chi2_max < huge(0.d0) ) chi2_tr_max = chi2_max - chi2_rv + 2.d0 * lnl_lin
+  if (tff(1) ) &
+  call find_chi2_tr(x_tr,y_tr,e_tr,pars_tr,jtr,flag_tr,&
+                        ldc,n_cad,t_cad,otab,cad_tol,chi2_tr_max,chi2_tr,size_tr,npl)
 
 
 end subroutine
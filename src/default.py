@@ -45,8 +45,10 @@ tstar_sigma = 100.
 #                     MCMC CONTROLS
 #----------------------------------------------------------------
 
-#method can be 'mcmc' or 'plot'
+#method can be 'mcmc', 'resume', 'nested' or 'plot'
 #'mcmc' fits the data while 'plot' creates the plots using data of a previous run
+#'resume' continues an interrupted 'mcmc' run from its last checkpoint file
+#'nested' samples the posterior and computes the evidence with nested sampling
 method = 'mcmc'
 #Number maximum of iterations
 maxi = int(1e8)
@@ -55,8 +57,81 @@ thin_factor = 10
 #Number of iterations to be used in the run
 #The code checks for convergence each niter \times thin_factor iterations
 niter   = 100
+#Convergence test done each niter \times thin_factor iterations
+#'gr'  -> Gelman-Rubin test of all the fitted parameters
+#'tau' -> the niter \times thin_factor iterations of the window are longer than
+#         tau_factor times the largest autocorrelation time of the fitted parameters
+convergence = 'gr'
+tau_factor  = 50.
+#Seed of the random numbers, each walker has its own stream of random numbers
+#and a run with the same seed gives the same chains for any number of threads
+#seed = 0 takes the seed from the clock, the seed of each run is printed on screen
+seed = 0
 #Number of chains or walkers to be used to exoplore parameter space
 nchains = 100
+#Proposal moves of the ensemble sampler, the move of each iteration is drawn with these weights
+#'stretch' -> stretch move, Goodman & Weare (2010)
+#'de'      -> differential evolution move, ter Braak (2006)
+#'walk'    -> walk move, Goodman & Weare (2010), slow from a wide initial ensemble, mix it with others
+#'snooker' -> snooker move, ter Braak & Vrugt (2008)
+#e.g. sampler_moves = { 'de' : 0.8, 'snooker' : 0.2 } helps with correlated parameters
+sampler_moves = { 'stretch' : 1.0 }
+#The scale a of the stretch move is tuned each convergence check during the burn-in
+#to get a mean acceptance rate inside acceptance_band, it is fixed once the chains converge
+is_adapt_stretch = True
+acceptance_band = [0.2,0.5]
+#During the burn-in, the walkers with a mean ln likelihood below Q1 - stuck_factor*(Q3 - Q1)
+#of the walkers are moved close to a random good walker, Hou et al. (2012).
+#stuck_factor = 0 does not replace the walkers
+stuck_factor = 3.
+#Before the MCMC, the Nelder-Mead simplex looks for the maximum of the posterior (MAP)
+#from the map_starts best initial walkers, the starts run in parallel. The walkers start
+#in a ball around the MAP with the width of the posterior from the curvature at the MAP,
+#this reduces the burn-in of well constrained fits, a walker that cannot be placed inside
+#the priors keeps its random values. map_starts = 0 starts the walkers from random values
+#of the priors
+map_starts = 0
+#The walkers start from the posterior of a previous run, init_from is the star of a
+#run in the same output directory or the name of its _all_data.bin file. The samples
+#are mapped by name onto the parameters of this fit (changes of parametrization are
+#handled), the new parameters and the ones outside the priors are drawn from the priors
+init_from = ''
+#Parallel tempering, ntemps ensembles of nchains walkers sample the likelihood^(1/T)
+#with T between 1 and t_max, only the walkers with T = 1 are saved.
+#If ntemps > 1 the evidence is computed by thermodynamic integration, the ladder
+#adapts during the first nconv window and it is fixed afterwards
+ntemps = 1
+t_max  = 1.e4
+#The state of the sampler is saved in outdir/star_checkpoint.dat each checkpoint_every
+#convergence checks (each niter \times thin_factor iterations), method = 'resume' restarts
+#the run from this file. checkpoint_every = 0 does not save the sampler state
+checkpoint_every = 1
+#If True, all the thinned iterations are saved in outdir/star_chains.bin while the code runs
+#Each row contains iteration, walker, ln likelihood, chi2_rv, chi2_tr, planet parameters,
+#ldc, systemic velocities, trends and jitter terms
+is_stream_chains = True
+#The posterior chains are saved in binary files (outdir/star_all_data.bin) with the name
+#of each column in the header, use read_chains(fname) to open them with numpy
+#chain_precision = 'double' (8 bytes) or 'single' (4 bytes, half the size)
+#WARNING: 'single' keeps only ~7 digits, not enough for T0 in BJD, use it with care
+chain_precision = 'double'
+#If True, the old text files all_data.dat, jitter_data.dat and trends_data.dat are also created
+is_text_chains = False
+
+#----------------------------------------------------------------
+#                     NESTED SAMPLING CONTROLS
+#----------------------------------------------------------------
+
+#Number of live points
+nlive = 500
+#Steps of the constrained random walk that replaces each dead point
+nested_walks = 25
+#Live points replaced at the same time, they run in parallel, use at least the number of threads
+nested_batch = 10
+#The run stops when the remaining live points can change ln Z less than dlogz
+#The posterior is saved in outdir/star_all_data.bin as nchains \times niter equally weighted
+#samples, outdir/star_nested.bin and outdir/star_nested.dat have all the points and their weights
+dlogz = 0.1
 
 #Indicate the number of planets to be fitted
 nplanets = 1
@@ -89,8 +164,18 @@ is_log_k    = False
 #NOT WORK NOW! If True, the code sample for log10(v0) instead of v0
 is_log_rv0  = False
 
+#Linear parameters of the RV model that are marginalized analytically in the likelihood
+#instead of sampled, 'rv0' (systemic velocities), 'trends' (alpha and beta) and 'K'.
+#Uniform priors are integrated as if they were infinite, the posterior has to be far
+#from the limits (not good for a K compatible with zero). Their posterior is drawn
+#for each sample of outdir/star_all_data.bin after the run (not in star_chains.bin).
+#It does not work with is_log_k or is_log_rv0. e.g. marginalize_linear = ['rv0','trends']
+marginalize_linear = []
+
 #flat to control paramter priors
 #For multiplanet fits, this variable has to have N elemens are N planets we are fitting
+#In transit fits, the samples with a/R* < 1 (the planet orbits inside the star) are
+#rejected as outside the priors, also when a/R* comes from the stellar density
 fit_t0  = ['f']
 fit_P   = ['f']
 fit_e   = ['f']
@@ -146,6 +231,14 @@ max_k   = [30.]     # a really big planet
 
 #TRANSIT FIT
 
+#Limb darkening law of the transit model
+#'quadratic' -> Mandel & Agol (2002) model, q1 and q2 of Kipping (2013)
+#'power2'    -> I(mu) = 1 - c (1 - mu^alpha) with the fast qpower2 model of Maxted & Gill (2019),
+#               ~3 times faster than 'quadratic' with errors up to ~1e-4 during ingress and egress
+#               for Rp/R* ~ 0.1. q1 and q2 are the parameters of Short et al. (2019), the physical
+#               solutions have q1 and q2 in [0,1]
+ld_law = 'quadratic'
+
 #Number of points to be used to integrate the data
 n_cad = 1
 #time of integrations in days
@@ -155,6 +248,33 @@ lc_data = 'free'
 #other options are:
 #'kepler_lc', with default n_cad = 10 and t_cad = 30 minutes
 #'kepler_sc', with default n_cad = 1 and t_cad = 1.5 minutes
+#'tess_sc', with default n_cad = 10 and t_cad = 2 minutes
+#lc_data, n_cad and t_cad can also be lists with one value for each file in
+#fname_tr, e.g., lc_data = ['kepler_lc','tess_sc'], then only the points of
+#each light curve are integrated with its own cadence
+#If cad_tol > 0, the n_cad > 5 sub-divisions are only used for the points with
+#contacts during the exposure, the points out of the transit need no model and the
+#ones inside the stellar disk use 5 evaluations if their estimated error is smaller
+#than cad_tol (normalized flux), e.g., cad_tol = 1e-6
+cad_tol = 0.0
+#Integration of the model over each exposure
+#'uniform' -> average of n_cad equally spaced sub-divisions
+#'gauss'   -> n_cad Gauss-Legendre nodes in each piece of the exposure between the
+#             contacts, the model is smooth in the pieces and n_cad = 2 (3) is as good
+#             as (~5 times better than) 10 uniform sub-divisions. The kepler_lc and
+#             tess_sc presets use n_cad = 3. cad_tol is not used
+#n_cad = 1 is the model at the time stamps without integration for both options
+#The maximum error of the integration against a model with 500 sub-divisions is
+#printed at startup for each light curve
+integration = 'uniform'
+
+#If occult_tol > 0, the transit model interpolates a table of the Mandel & Agol
+#functions instead of calling occultquad. The table is built for the range of
+#Rp/R* of the priors and refined until its maximum difference with occultquad in
+#the normalized flux is smaller than occult_tol (~1e-5 is reachable), out of the
+#narrow bands |z - Rp/R*| < 3e-4 (z + Rp/R*) and 1 - Rp/R* - 3e-4 < z < 1 - Rp/R*,
+#where occultquad itself is not accurate to ~1e-5 and the difference can be ~2e-5
+occult_tol = 0.0
 
 #If True, it will set a Gaussian prior for the scaled semi-major axis based
 #on the input stellar paramters
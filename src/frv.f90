@@ -72,10 +72,13 @@ end subroutine
 !         its size is the number of telescopes
 ! k, ec, w, t0, P -> typical planet parameters
 ! datas, nt -> sizes of xd,yd, errs (datas) and rv0(nt)  
+! lin_pri -> the linear parameters with lin_pri(3*j) > 0 are
+!            marginalized, see rv_linear
 !Output parameter:
 ! chi2 -> a double precision value with the chi2 value
+! lnl_lin -> term of the marginalization to add to ln likelihood
 !-----------------------------------------------------------
-subroutine find_chi2_rv(xd,yd,errs,tlab,jrvlab,params,jitter,flag,chi2,datas,nt,nj,npl)
+subroutine find_chi2_rv(xd,yd,errs,tlab,jrvlab,params,jitter,flag,lin_pri,chi2,lnl_lin,datas,nt,nj,npl)
 implicit none
 
 !In/Out variables
@@ -85,15 +88,26 @@ implicit none
   double precision, intent(in), dimension(0:6+nt,0:npl-1) :: params
   double precision, dimension(0:nj-1), intent(in) :: jitter
   logical, intent(in)  :: flag(0:3)
-  double precision, intent(out) :: chi2
+  double precision, intent(in), dimension(0:3*(nt+2+npl)-1) :: lin_pri
+  double precision, intent(out) :: chi2, lnl_lin
 !Local variables
   double precision, dimension(0:npl-1) :: t0, P, e, w, k
   double precision, dimension(0:nt-1)  :: rv0
   double precision  :: alpha, beta
   double precision, dimension(0:datas-1) :: model, res
+  double precision, dimension(0:nt+2+npl-1) :: theta
+  double precision, dimension(0:nt+2+npl-1,0:nt+2+npl-1) :: chol
   logical :: is_limit_good
 !External function
-  external :: rv_curve_mp
+  external :: rv_curve_mp, rv_linear
+
+  lnl_lin = 0.d0
+
+  if ( any( lin_pri(0::3) > 0.d0 ) ) then
+    call rv_linear(xd,yd,errs,tlab,jrvlab,params,jitter,flag,lin_pri, &
+         theta,chol,chi2,lnl_lin,datas,nt,nj,npl)
+    return
+  end if
 
   t0(:)  = params(0,:)
   P(:)   = params(1,:)
@@ -126,4 +140,162 @@ implicit none
 
   end if
 
-end subroutine
\ No newline at end of file
+end subroutine
+!-----------------------------------------------------------
+! rv_linear marginalizes the parameters of the RV model that
+! are linear, the systemic velocities rv0 (0:nt-1), the trends
+! alpha (nt) and beta (nt+1) and the semi-amplitudes k
+! (nt+2:nt+1+npl). The parameter j is marginalized if
+! lin_pri(3*j) is 1 (flat prior between lin_pri(3*j+1) and
+! lin_pri(3*j+2)) or 2 (normal prior with mean lin_pri(3*j+1)
+! and sigma lin_pri(3*j+2)). The flat priors are integrated as
+! if they were infinite, the likelihood has to be far from the
+! limits. Output parameters:
+! theta   -> all the linear parameters, the marginalized ones
+!            at the maximum of their conditional posterior
+! chol    -> Cholesky factor L of the inverse covariance of
+!            the marginalized parameters, in the order of theta
+! chi2    -> chi2 of the data with theta
+! lnl_lin -> ln likelihood marginalized - ( ln N - chi2 / 2 )
+!-----------------------------------------------------------
+subroutine rv_linear(xd,yd,errs,tlab,jrvlab,params,jitter,flag,lin_pri, &
+           theta,chol,chi2,lnl_lin,datas,nt,nj,npl)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: datas, nt, npl, nj
+  double precision, intent(in), dimension(0:datas-1)  :: xd, yd, errs
+  integer, intent(in), dimension(0:datas-1) :: tlab, jrvlab
+  double precision, intent(in), dimension(0:6+nt,0:npl-1) :: params
+  double precision, dimension(0:nj-1), intent(in) :: jitter
+  logical, intent(in)  :: flag(0:3)
+  double precision, intent(in), dimension(0:3*(nt+2+npl)-1) :: lin_pri
+  double precision, intent(out), dimension(0:nt+2+npl-1) :: theta
+  double precision, intent(out), dimension(0:nt+2+npl-1,0:nt+2+npl-1) :: chol
+  double precision, intent(out) :: chi2, lnl_lin
+!Local variables
+  double precision, dimension(0:npl-1) :: t0, P, e, w, k
+  double precision, dimension(0:nt-1)  :: rv0
+  double precision  :: alpha, beta
+  double precision, dimension(0:datas-1) :: model, wts, ta
+  double precision, dimension(0:datas-1,0:nt+2+npl-1) :: basis
+  double precision, dimension(0:nt+2+npl-1) :: b
+  integer, dimension(0:nt+2+npl-1) :: idx
+  double precision :: two_pi = 2.d0*3.1415926535897932384626d0
+  integer :: nl, na, i, j, m
+!External function
+  external :: rv_curve_mp, find_anomaly
+
+  t0(:)  = params(0,:)
+  P(:)   = params(1,:)
+  e(:)   = params(2,:)
+  w(:)   = params(3,:)
+  k(:)   = params(4,:)
+  alpha  = params(5,0)
+  beta   = params(6,0)
+  rv0(:) = params(7:6+nt,0)
+
+  if ( flag(0) ) P(:) = 1.d1**params(1,:)
+  if ( flag(1) ) call ewto(e,w,e,w,npl)
+  if ( flag(2) ) k(:) = 1.d1**params(4,:)
+  if ( flag(3) ) rv0(:) = 1.d1**params(7:6+nt,0)
+
+  nl = nt + 2 + npl
+  theta(0:nt-1) = rv0(:)
+  theta(nt) = alpha
+  theta(nt+1) = beta
+  theta(nt+2:nl-1) = k(:)
+  chol(:,:) = 0.d0
+  lnl_lin = 0.d0
+
+  if ( any (e > 1.0d0) ) then
+    chi2 = huge(0.d0)
+    return
+  end if
+
+  !The model without the marginalized parameters
+  na = 0
+  do j = 0, nl - 1
+    if ( lin_pri(3*j) > 0.d0 ) then
+      theta(j) = 0.d0
+      idx(na) = j
+      na = na + 1
+    end if
+  end do
+  call rv_curve_mp(xd,0.d0,t0,theta(nt+2:nl-1),P,e,w,theta(nt),theta(nt+1),model,datas,npl)
+  model(:) = model(:) + theta(tlab(:))
+
+  !and the derivatives of the model with respect to them
+  do i = 0, na - 1
+    j = idx(i)
+    if ( j < nt ) then
+      basis(:,i) = 0.d0
+      where ( tlab == j ) basis(:,i) = 1.d0
+    else if ( j == nt ) then
+      basis(:,i) = xd(:) - t0(0)
+    else if ( j == nt + 1 ) then
+      basis(:,i) = ( xd(:) - t0(0) )**2
+    else
+      m = j - nt - 2
+      call find_anomaly(xd,t0(m),e(m),w(m),P(m),ta,datas)
+      basis(:,i) = cos( ta(:) + w(m) ) + e(m) * cos(w(m))
+    end if
+  end do
+
+  wts(:) = 1.d0 / ( errs(:)**2 + jitter(jrvlab(:))**2 )
+  model(:) = yd(:) - model(:)
+
+  !Normal equations, with the normal priors
+  do i = 0, na - 1
+    do m = 0, i
+      chol(i,m) = sum( wts(:) * basis(:,i) * basis(:,m) )
+    end do
+    b(i) = sum( wts(:) * basis(:,i) * model(:) )
+    j = idx(i)
+    if ( lin_pri(3*j) > 1.d0 ) then
+      chol(i,i) = chol(i,i) + 1.d0 / lin_pri(3*j+2)**2
+      b(i) = b(i) + lin_pri(3*j+1) / lin_pri(3*j+2)**2
+    end if
+  end do
+
+  !Cholesky decomposition, the lower triangle of chol is L
+  do i = 0, na - 1
+    do m = 0, i
+      chol(i,m) = chol(i,m) - sum( chol(i,0:m-1) * chol(m,0:m-1) )
+      if ( m < i ) then
+        chol(i,m) = chol(i,m) / chol(m,m)
+      else
+        !A parameter without data (e.g. a telescope with a flat prior)
+        if ( chol(i,i) <= 0.d0 ) then
+          chi2 = huge(0.d0)
+          return
+        end if
+        chol(i,i) = sqrt( chol(i,i) )
+      end if
+    end do
+  end do
+
+  !Solve L L^T theta = b
+  do i = 0, na - 1
+    b(i) = ( b(i) - sum( chol(i,0:i-1) * b(0:i-1) ) ) / chol(i,i)
+  end do
+  do i = na - 1, 0, -1
+    b(i) = ( b(i) - sum( chol(i+1:na-1,i) * b(i+1:na-1) ) ) / chol(i,i)
+  end do
+
+  do i = 0, na - 1
+    j = idx(i)
+    theta(j) = b(i)
+    model(:) = model(:) - b(i) * basis(:,i)
+    if ( lin_pri(3*j) > 1.d0 ) then
+      lnl_lin = lnl_lin - 0.5d0 * ( b(i) - lin_pri(3*j+1) )**2 / lin_pri(3*j+2)**2 &
+                        - log( lin_pri(3*j+2) )
+    else
+      lnl_lin = lnl_lin + 0.5d0 * log(two_pi) - log( lin_pri(3*j+2) - lin_pri(3*j+1) )
+    end if
+    lnl_lin = lnl_lin - log( chol(i,i) )
+  end do
+
+  chi2 = sum( wts(:) * model(:)**2 )
+
+end subroutine
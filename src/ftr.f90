@@ -54,111 +54,436 @@ implicit none
 
 end subroutine
 
-subroutine flux_tr(xd,pars,ldc,&
-           n_cad,t_cad,datas,npl,muld)
+!-----------------------------------------------------------
+!                     transit_window
+!  This suborutine marks the time-stamps that can be in transit
+!  (is_tr = .true.) for one planet. z >= r |cos(w+f)| with
+!  r >= a(1-e), so z < 1 + rp needs a true anomaly f within
+!  dth = asin( (1+rp) / (a(1-e)) ) of the conjunction. The mean
+!  anomalies of these limits give the window in time, it is
+!  wider by half of t_cad at each side for the binned model.
+!------------------------------------------------------------
+subroutine transit_window(t,pars,rp,t_cad,is_tr,ts)
 implicit none
 
 !In/Out variables
-  integer, intent(in) :: datas, n_cad, npl
+  integer, intent(in) :: ts
+  double precision, intent(in), dimension(0:ts-1) :: t
+  double precision, intent(in), dimension(0:5) :: pars
+  double precision, intent(in) :: rp, t_cad
+  logical, intent(out), dimension(0:ts-1) :: is_tr
+!Local variables
+  double precision :: tp, P, e, w, a, dth, t1, dt
+  double precision :: f(0:1), ma(0:1), ea
+  double precision :: pi = 3.1415926535897932384626d0
+  integer :: k
+
+  tp  = pars(0)
+  P   = pars(1)
+  e   = pars(2)
+  w   = pars(3)
+  a   = pars(5)
+
+  is_tr(:) = .true.
+  if ( a * ( 1.d0 - e ) <= 1.d0 + rp ) return
+
+  !The small extra angle avoids round-off problems at the limits
+  dth = asin( ( 1.d0 + rp ) / ( a * ( 1.d0 - e ) ) ) + 1.d-6
+  f(0) = 0.5d0 * pi - w - dth
+  f(1) = 0.5d0 * pi - w + dth
+  do k = 0, 1
+    ea = 2.d0 * atan2( sqrt(1.d0 - e) * sin(0.5d0*f(k)), sqrt(1.d0 + e) * cos(0.5d0*f(k)) )
+    ma(k) = ea - e * sin(ea)
+  end do
+
+  t1 = tp + ma(0) * P / ( 2.d0 * pi ) - 0.5d0 * t_cad
+  dt = modulo( ma(1) - ma(0), 2.d0 * pi ) * P / ( 2.d0 * pi ) + t_cad
+  if ( dt >= P ) return
+
+  is_tr(:) = modulo( t(:) - t1, P ) <= dt
+
+end subroutine
+
+!If is_power2, ldc = c, alpha of the power-2 law and the model is qpower2,
+!if not, ldc = u1, u2 of the quadratic law. otab is a table from occult_table,
+!the interpolation is used instead of occultquad when otab(0) > 0 and Rp/R*
+!is inside the range of the table. n_cad and t_cad are given for each data
+!point, then each light curve can have its own cadence. If cad_tol > 0, the
+!points that do not need the n_cad sub-divisions are found by cad_sub.
+!If is_gauss, the exposure is integrated with the n_cad nodes and weights of
+!the Gauss-Legendre rule instead of the average of n_cad uniform sub-divisions,
+!in both cases n_cad = 1 is the model at xd without integration
+subroutine flux_tr(xd,pars,ldc,is_power2,is_gauss,&
+           n_cad,t_cad,otab,cad_tol,datas,npl,muld)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: datas, npl
   double precision, intent(in), dimension(0:datas-1)  :: xd
   double precision, intent(in), dimension(0:6,0:npl-1) :: pars
   !pars = T0, P, e, w, b, a/R*, Rp/R*
-  double precision, intent(in) :: t_cad
+  integer, intent(in), dimension(0:datas-1) :: n_cad
+  double precision, intent(in), dimension(0:datas-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
   double precision, intent(in), dimension (0:1) :: ldc
+  logical, intent(in) :: is_power2, is_gauss
   double precision, intent(out), dimension(0:datas-1) :: muld
 !Local variables
-  double precision, dimension(0:datas-1) :: muld_npl
-  double precision, dimension(0:datas-1) :: mu
-  double precision :: npl_dbl, small, u1, u2, rp(0:npl-1)
-  double precision, dimension(0:n_cad-1,0:npl-1)  :: flux_ub
-  double precision, dimension(0:n_cad-1)  :: xd_ub, z, fmultip
-  integer :: n, j, k(0:n_cad-1)
+  double precision, dimension(0:datas-1) :: muld_npl, fgauss
+  double precision, dimension(0:maxval(n_cad)-1) :: ug, wg
+  double precision :: npl_dbl, small, rp(0:npl-1), sb(0:5,0:datas-1)
+  double precision, dimension(0:maxval(n_cad)-1,0:datas-1)  :: flux_ub
+  double precision, allocatable, dimension(:)  :: xd_ub, z, wz, flux
+  double precision, dimension(0:datas-1) :: fcad
+  logical, dimension(0:datas-1) :: is_tr, is_done
+  integer :: n, j, k, l, m, nin, ntr, nz, ng, idx(0:datas-1), off(0:datas)
+  integer :: nb(0:datas-1), cnt(0:datas-1)
 !External function
-  external :: occultquad, find_z
+  external :: occult_flux, find_z, transit_window, cad_sub, gauss_legendre, contact_pieces
 
   small = 1.d-5
   npl_dbl = dble(npl)
 
-  u1 = ldc(0)
-  u2 = ldc(1)
-
   !Get planet radius
   rp(:) = pars(6,:)
 
-  do j = 0, n_cad - 1
-    k(j) = j
-  end do
-
   muld_npl(:) = 0.d0
   flux_ub(:,:) = 0.d0
-  do j = 0, datas - 1
-
-    !Calculate the time-stamps for the binned model
-    xd_ub(:) = xd(j) + t_cad*((k(:)+1.d0)-0.5d0*(n_cad+1.d0))/n_cad
-
-    !control the label of the planet
-    do n = 0, npl - 1
-
-      !Each z is independent for each planet
-      call find_z(xd_ub,pars(0:5,n),z,n_cad)
-
-      if ( ALL( z > 1.d0 + rp(n) ) .or. rp(n) < small ) then
-
+  fgauss(:) = 0.d0
+  !ng is the number of nodes of the Gauss-Legendre rule in ug, wg
+  ng = 0
+  !control the label of the planet
+  do n = 0, npl - 1
+
+    !Only the points that can be in transit need the Kepler equation
+    call transit_window(xd,pars(0:5,n),rp(n),maxval(t_cad),is_tr,datas)
+    if ( rp(n) < small ) is_tr(:) = .false.
+    nin = 0
+    do j = 0, datas - 1
+      if ( is_tr(j) ) then
+        idx(nin) = j
+        nin = nin + 1
+      else
         muld_npl(j) = muld_npl(j) + 1.d0 !This is not eclipse
-        flux_ub(:,n) = 0.d0
+      end if
+    end do
 
+    !The flux of the points done by cad_sub is fcad for all the sub-divisions
+    if ( cad_tol > 0.d0 .and. .not. is_gauss ) then
+      call cad_sub(xd,n_cad,t_cad,idx(0:nin-1),pars(0:5,n),rp(n),ldc,is_power2,otab,cad_tol, &
+                   is_done(0:nin-1),fcad(0:nin-1),nin,datas)
+      ntr = 0
+      do m = 0, nin - 1
+        j = idx(m)
+        if ( is_done(m) ) then
+          flux_ub(0:n_cad(j)-1,j) = flux_ub(0:n_cad(j)-1,j) + fcad(m)
+        else
+          idx(ntr) = j
+          ntr = ntr + 1
+        end if
+      end do
+      nin = ntr
+    end if
+
+    !The Gauss-Legendre rule is used in each piece of the exposure between the
+    !contacts, z at the start, middle and end of the exposure give the contacts
+    if ( is_gauss ) then
+      allocate(xd_ub(0:3*nin-1),z(0:3*nin-1))
+      do m = 0, nin - 1
+        xd_ub(3*m:3*m+2) = xd(idx(m)) + 0.5d0*t_cad(idx(m))*(/ -1.d0, 0.d0, 1.d0 /)
+      end do
+      call find_z(xd_ub,pars(0:5,n),z,3*nin)
+      do m = 0, nin - 1
+        if ( n_cad(idx(m)) == 1 ) then
+          !One node is the model at xd, as with the uniform sub-divisions
+          nb(m) = 2
+          sb(0:1,m) = (/ -1.d0, 1.d0 /)
+        else
+          call contact_pieces(z(3*m:3*m+2),rp(n),sb(:,m),nb(m))
+        end if
+      end do
+      deallocate(xd_ub,z)
+    end if
+
+    !z of all the binned time-stamps at once, the n_cad values (n_cad for each
+    !piece with is_gauss) of the data point idx(m) are in z(off(m):off(m+1)-1)
+    off(0) = 0
+    do m = 0, nin - 1
+      if ( is_gauss ) then
+        off(m+1) = off(m) + n_cad(idx(m)) * ( nb(m) - 1 )
       else
+        off(m+1) = off(m) + n_cad(idx(m))
+      end if
+    end do
+    allocate(xd_ub(0:off(nin)-1),z(0:off(nin)-1),wz(0:off(nin)-1))
+    do m = 0, nin - 1
+      j = idx(m)
+      if ( is_gauss ) then
+        if ( n_cad(j) /= ng ) then
+          ng = n_cad(j)
+          call gauss_legendre(ng,ug(0:ng-1),wg(0:ng-1))
+        end if
+        !wz are the weights of the nodes for the average over the exposure
+        do l = 0, nb(m) - 2
+          k = off(m) + l*ng
+          xd_ub(k:k+ng-1) = xd(j) + 0.25d0*t_cad(j)*( sb(l,m) + sb(l+1,m) + ( sb(l+1,m) - sb(l,m) )*ug(0:ng-1) )
+          wz(k:k+ng-1) = 0.25d0*( sb(l+1,m) - sb(l,m) )*wg(0:ng-1)
+        end do
+      else
+        do k = 0, n_cad(j) - 1
+          xd_ub(off(m)+k) = xd(j) + t_cad(j)*((k+1.d0)-0.5d0*(n_cad(j)+1.d0))/n_cad(j)
+        end do
+      end if
+    end do
+    call find_z(xd_ub,pars(0:5,n),z,off(nin))
+
+    !Keep only the points with a z inside the stellar disk
+    ntr = 0
+    nz = 0
+    do m = 0, nin - 1
+      if ( ALL( z(off(m):off(m+1)-1) > 1.d0 + rp(n) ) ) then
+        muld_npl(idx(m)) = muld_npl(idx(m)) + 1.d0 !This is not eclipse
+      else
+        k = off(m+1) - off(m)
+        z(nz:nz+k-1) = z(off(m):off(m+1)-1)
+        if ( is_gauss ) wz(nz:nz+k-1) = wz(off(m):off(m+1)-1)
+        idx(ntr) = idx(m)
+        cnt(ntr) = k
+        ntr = ntr + 1
+        nz = nz + k
+      end if
+    end do
 
-        !Now we have z, let us use Agol's routines
-        call occultquad(z,u1,u2,rp(n),flux_ub(:,n),mu,n_cad)
-        !call qpower2(z,rp(n),u1,u2,flux_ub(:,n),n_cad)
+    !Now we have z, let us use Agol's routines
+    allocate(flux(0:nz-1))
+    call occult_flux(z(0:nz-1),rp(n),ldc,is_power2,otab,flux,nz)
 
+    !Sum the flux of each sub-division of the model due to each planet
+    nz = 0
+    do m = 0, ntr - 1
+      k = cnt(m)
+      if ( is_gauss ) then
+        fgauss(idx(m)) = fgauss(idx(m)) + dot_product(wz(nz:nz+k-1),flux(nz:nz+k-1))
+      else
+        flux_ub(0:k-1,idx(m)) = flux_ub(0:k-1,idx(m)) + flux(nz:nz+k-1)
       end if
+      nz = nz + k
+    end do
 
-    end do !planets
+    deallocate(xd_ub,z,wz,flux)
 
-    fmultip(:) = 0.0
-    !Sum the flux of all each sub-division of the model due to each planet
-    do n = 0, n_cad - 1
-      fmultip(n) =  SUM(flux_ub(n,:))
-    end do
+  end do !planets
+
+  do j = 0, datas - 1
 
     !Re-bin the model
-    muld_npl(j) = muld_npl(j) +  sum(fmultip) / n_cad
+    if ( is_gauss ) then
+      muld_npl(j) = muld_npl(j) + fgauss(j)
+    else
+      muld_npl(j) = muld_npl(j) +  sum(flux_ub(0:n_cad(j)-1,j)) / n_cad(j)
+    end if
 
     !Calcualte the flux received taking into account the transit of all planets
     muld(j) =  1.0d0 + muld_npl(j) - npl_dbl
 
-    !Restart flux_ub
-    flux_ub(:,:) = 0.0
-
   end do !datas
 
 end subroutine
 
+!Breakpoints sb(0:nb-1) of an exposure in s = 2 (t - xd) / t_cad, from s = -1
+!to s = 1 with the contacts (z = 1 + rp or z = 1 - rp) in between. The contacts
+!are the roots of the parabola of z**2 given by z3 = z at s = -1, 0, 1, that is
+!exact for a planet moving in a straight line during the exposure
+subroutine contact_pieces(z3,rp,sb,nb)
+implicit none
+
+!In/Out variables
+  double precision, intent(in) :: z3(0:2), rp
+  double precision, intent(out) :: sb(0:5)
+  integer, intent(out) :: nb
+!Local variables
+  double precision :: c0, c1, c2, d, q, r(0:1), x
+  integer :: l, o, i
+
+  !z**2 = c0 + c1 s + c2 s**2
+  c0 = z3(1)**2
+  c1 = 0.5d0 * ( z3(2)**2 - z3(0)**2 )
+  c2 = 0.5d0 * ( z3(2)**2 + z3(0)**2 ) - c0
+
+  nb = 1
+  sb(0) = -1.d0
+  do l = 0, 1
+    d = c1*c1 - 4.d0 * c2 * ( c0 - ( 1.d0 + (1-2*l)*rp )**2 )
+    if ( d < 0.d0 ) cycle
+    q = - 0.5d0 * ( c1 + sign(sqrt(d),c1) )
+    r(:) = 2.d0
+    if ( c2 /= 0.d0 ) r(0) = q / c2
+    if ( q /= 0.d0 ) r(1) = ( c0 - ( 1.d0 + (1-2*l)*rp )**2 ) / q
+    do o = 0, 1
+      if ( abs(r(o)) >= 1.d0 ) cycle
+      !insert the root keeping sb sorted
+      x = r(o)
+      i = nb
+      do while ( sb(i-1) > x )
+        sb(i) = sb(i-1)
+        i = i - 1
+      end do
+      sb(i) = x
+      nb = nb + 1
+    end do
+  end do
+  sb(nb) = 1.d0
+  nb = nb + 1
+
+end subroutine
+
+!Flux for the z values of z0 with the model of flux_tr
+subroutine occult_flux(z0,p,ldc,is_power2,otab,flux,nz)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nz
+  double precision, intent(in) :: z0(0:nz-1), p, ldc(0:1)
+  double precision, intent(in) :: otab(0:*)
+  logical, intent(in) :: is_power2
+  double precision, intent(out) :: flux(0:nz-1)
+!Local variables
+  double precision, allocatable :: mu(:)
+!External function
+  external :: occultquad_vec, occult_interp, qpower2
+
+  if ( is_power2 ) then
+    call qpower2(z0,p,ldc(0),ldc(1),flux,nz)
+  else if ( otab(0) > 0.d0 .and. p >= otab(2) .and. p <= otab(3) ) then
+    call occult_interp(z0,ldc(0),ldc(1),p,otab,flux,nz)
+  else
+    allocate(mu(0:nz-1))
+    call occultquad_vec(z0,ldc(0),ldc(1),p,flux,mu,nz)
+    deallocate(mu)
+  end if
+
+end subroutine
+
+!-----------------------------------------------------------
+!                     cad_sub
+!  This subroutine finds the points idx of flux_tr that do not
+!  need the n_cad > 5 sub-divisions (is_done = .true.), fcad is
+!  then their flux averaged over the exposure. z is computed at
+!  5 equally spaced times from the start (z_0) to the end (z_4)
+!  of the exposure. z(t) is convex during the transit, then the
+!  exposure is out of the transit (fcad = 1) if
+!  min(z_2, 2 z_2 - z_0, 2 z_2 - z_4) > 1 + rp, and it is inside
+!  the stellar disk if max(z_0,z_4) <= 1 - rp. Inside the disk,
+!  fcad is the Simpson's rule with the 5 fluxes, S5, and the point
+!  is done if |S5 - S3| <= cad_tol, where S3 is the Simpson's rule
+!  with f_0, f_2 and f_4. |S5 - S3| is ~15 times the error of S5.
+!  The points with contacts during the exposure are never done.
+!------------------------------------------------------------
+subroutine cad_sub(xd,n_cad,t_cad,idx,pars,rp,ldc,is_power2,otab,cad_tol, &
+                   is_done,fcad,nin,datas)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nin, datas
+  double precision, intent(in), dimension(0:datas-1) :: xd, t_cad
+  integer, intent(in), dimension(0:datas-1) :: n_cad
+  integer, intent(in), dimension(0:nin-1) :: idx
+  double precision, intent(in), dimension(0:5) :: pars
+  double precision, intent(in) :: rp, ldc(0:1), otab(0:*), cad_tol
+  logical, intent(in) :: is_power2
+  logical, intent(out), dimension(0:nin-1) :: is_done
+  double precision, intent(out), dimension(0:nin-1) :: fcad
+!Local variables
+  double precision, allocatable, dimension(:) :: xs, zs, fs
+  double precision :: zlow, s3, s5
+  integer :: m, j, k, c, nc, ni, isub(0:nin-1)
+!External function
+  external :: find_z, occult_flux
+
+  is_done(:) = .false.
+  fcad(:) = 1.d0
+
+  !Only the points with n_cad > 5 need less evaluations
+  nc = 0
+  do m = 0, nin - 1
+    if ( n_cad(idx(m)) > 5 ) then
+      isub(nc) = m
+      nc = nc + 1
+    end if
+  end do
+  if ( nc == 0 ) return
+
+  allocate(xs(0:5*nc-1),zs(0:5*nc-1),fs(0:5*nc-1))
+  do c = 0, nc - 1
+    j = idx(isub(c))
+    do k = 0, 4
+      xs(5*c+k) = xd(j) + t_cad(j) * ( 0.25d0 * k - 0.5d0 )
+    end do
+  end do
+  call find_z(xs,pars,zs,5*nc)
+
+  !The z values of the points inside the disk are moved to zs(0:5*ni-1)
+  ni = 0
+  do c = 0, nc - 1
+    zlow = min( zs(5*c+2), 2.d0*zs(5*c+2) - zs(5*c), 2.d0*zs(5*c+2) - zs(5*c+4) )
+    if ( zlow > 1.d0 + rp ) then
+      is_done(isub(c)) = .true.
+    else if ( max(zs(5*c),zs(5*c+4)) <= 1.d0 - rp ) then
+      zs(5*ni:5*ni+4) = zs(5*c:5*c+4)
+      isub(ni) = isub(c)
+      ni = ni + 1
+    end if
+  end do
+
+  if ( ni > 0 ) then
+    call occult_flux(zs(0:5*ni-1),rp,ldc,is_power2,otab,fs(0:5*ni-1),5*ni)
+    do c = 0, ni - 1
+      s3 = ( fs(5*c) + 4.d0*fs(5*c+2) + fs(5*c+4) ) / 6.d0
+      s5 = ( fs(5*c) + 4.d0*fs(5*c+1) + 2.d0*fs(5*c+2) + 4.d0*fs(5*c+3) + fs(5*c+4) ) / 12.d0
+      if ( abs(s5 - s3) <= cad_tol ) then
+        is_done(isub(c)) = .true.
+        fcad(isub(c)) = s5
+      end if
+    end do
+  end if
+
+  deallocate(xs,zs,fs)
+
+end subroutine
+
 
+!The model is computed in chunks, the first one has n_chunk points and each
+!chunk doubles the previous one, then flux_tr is called log2(datas/n_chunk)
+!times. The calculation stops when the partial chi2 is larger than chi2_max
+!and chi2 = huge. chi2 is the sum of the chunks, it can differ in the last
+!bits from the sum of all the residuals at once
 subroutine find_chi2_tr(xd,yd,errs,pars,jitter,flag,ldc,&
-           n_cad,t_cad,chi2,datas,npl)
+           n_cad,t_cad,otab,cad_tol,chi2_max,chi2,datas,npl)
 implicit none
 
 !In/Out variables
-  integer, intent(in) :: datas, n_cad, npl
+  integer, intent(in) :: datas, npl
   double precision, intent(in), dimension(0:datas-1)  :: xd, yd, errs
   double precision, intent(in), dimension(0:6,0:npl-1) :: pars
   !pars = T0, P, e, w, b, a/R*, Rp/R*
-  double precision, intent(in) :: t_cad
-  double precision, intent(in) :: jitter
-  logical, intent(in), dimension(0:3) :: flag
+  integer, intent(in), dimension(0:datas-1) :: n_cad
+  double precision, intent(in), dimension(0:datas-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
+  double precision, intent(in) :: jitter, chi2_max
+  logical, intent(in), dimension(0:5) :: flag
   double precision, intent(in), dimension (0:1) :: ldc
   double precision, intent(out) :: chi2
 !Local variables
+  integer, parameter :: n_chunk = 64
   double precision, dimension(0:datas-1) :: res, muld
   double precision, dimension(0:6,0:npl-1) :: up_pars !updated parameters
   double precision, dimension(0:npl-1) :: t0, P, e, w, i, a, rp, tp
   double precision :: u1, u2, q1k, q2k
   double precision, dimension (0:1) :: up_ldc
   logical :: is_good
-  integer :: n
+  integer :: n, j, k, nc
 !External function
   external :: flux_tr
 
@@ -178,13 +503,19 @@ implicit none
   !Update limb darkening coefficients, pass from q's to u's
   q1k = ldc(0)
   q2k = ldc(1)
-  !re-transform the parameters to u1 and u2
-  u1 = sqrt(q1k)
-  u2 = u1*( 1.d0 - 2.d0*q2k)
-  u1 = 2.d0*u1*q2k
+  if ( flag(4) ) then
+    !power-2 law, q1 = (1-h2)^2 and q2 = (h1-h2)/(1-h2) of Short et al. (2019)
+    !with h1 = 1 - c (1 - 2^-alpha) and h2 = c 2^-alpha of Maxted (2018)
+    call qtoc_p2(q1k,q2k,u1,u2,is_good)
+  else
+    !re-transform the parameters to u1 and u2
+    u1 = sqrt(q1k)
+    u2 = u1*( 1.d0 - 2.d0*q2k)
+    u1 = 2.d0*u1*q2k
+   !are the u1 and u2 within a physical solution
+    call check_us(u1,u2,is_good)
+  end if
   up_ldc = (/ u1 , u2 /)
- !are the u1 and u2 within a physical solution
-  call check_us(u1,u2,is_good)
 
   if ( any( e > 1.d0 ) ) is_good = .false.
 
@@ -203,9 +534,19 @@ implicit none
     up_pars(5,:) = a
     up_pars(6,:) = rp
 
-    call flux_tr(xd,up_pars,up_ldc,n_cad,t_cad,datas,npl,muld)
-    res(:) = ( muld(:) - yd(:) ) / sqrt( errs(:)**2 + jitter**2 )
-    chi2 = dot_product(res,res)
+    chi2 = 0.d0
+    j = 0
+    nc = n_chunk
+    do while ( j < datas .and. chi2 <= chi2_max )
+      k = min(j + nc,datas) - 1
+      call flux_tr(xd(j:k),up_pars,up_ldc,flag(4),flag(5),n_cad(j:k),t_cad(j:k),otab,cad_tol,k-j+1,npl,muld(j:k))
+      res(j:k) = ( muld(j:k) - yd(j:k) ) / sqrt( errs(j:k)**2 + jitter**2 )
+      chi2 = chi2 + dot_product(res(j:k),res(j:k))
+      j = k + 1
+      nc = 2 * nc
+    end do
+
+    if ( chi2 > chi2_max ) chi2 = huge(0.e0)
 
   else
 
@@ -213,4 +554,194 @@ implicit none
 
   end if
 
-end subroutine
\ No newline at end of file
+end subroutine
+
+!-----------------------------------------------------------
+!                     occult_table
+!  This suborutine tabulates the occultation functions of
+!  Mandel & Agol (2002), lambda_e, lambda_d and eta_d, in a
+!  (z,p) grid for p in [pmin,pmax] (0 <= pmin < pmax < 0.5), the
+!  np values of p are equally spaced in sqrt(p), the absolute error
+!  of the interpolation is then similar for small and large p. For each p the
+!  z range is split at min(p,1-p), max(p,1-p) and 1+p, where the
+!  functions are not smooth, and each segment has ns nodes at
+!  z = z_0 + (z_1 - z_0) * ( 1 - cos(pi s) ) / 2 with s in [0,1].
+!  The nodes are dense at the limits of the segments, this removes
+!  the square-root behaviour of the functions there.
+!  otab(0:3) = ns, np, pmin, pmax and the nodes follow, see
+!  occult_interp
+!------------------------------------------------------------
+subroutine occult_table(pmin,pmax,ns,np,otab)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: ns, np
+  double precision, intent(in) :: pmin, pmax
+  double precision, intent(out) :: otab(0:4+9*ns*np-1)
+!Local variables
+  double precision, dimension(0:ns-1) :: zz, zl, zr, fz(0:ns-1,0:2), fl(0:ns-1,0:2), fr(0:ns-1,0:2)
+  double precision :: pi = 3.1415926535897932384626d0
+  double precision :: p, b(0:3)
+  logical :: is_band(0:ns-1)
+  integer :: j, g, k, c, o
+!External function
+  external :: occult_fun
+
+  otab(0:3) = (/ dble(ns), dble(np), pmin, pmax /)
+
+  do j = 0, np - 1
+    p = ( sqrt(pmin) + ( sqrt(pmax) - sqrt(pmin) ) * dble(j) / dble(np - 1) )**2
+    b = (/ 0.d0, min(p,1.d0-p), max(p,1.d0-p), 1.d0 + p /)
+    do g = 0, 2
+      do k = 0, ns - 1
+        zz(k) = b(g) + ( b(g+1) - b(g) ) * 0.5d0 * ( 1.d0 - cos( pi * dble(k) / dble(ns - 1) ) )
+      end do
+      !occultquad can take z = 1 - p as case III because of round-off,
+      !the nodes at b(1) and b(2) are moved a bit
+      if ( g > 0 ) zz(0) = b(g) * ( 1.d0 - 1.d-12 )
+      if ( g < 2 ) zz(ns-1) = b(g+1) * ( 1.d0 - 1.d-12 )
+      call occult_fun(zz,p,fz,ns)
+
+      !occultquad uses approximations for |z-p| < 1e-4 (z+p) and for
+      !1 - p - 1e-4 < z < 1 - p, the nodes there are interpolated with
+      !the values out of these bands
+      zl(:) = zz(:)
+      zr(:) = zz(:)
+      is_band(:) = .false.
+      do k = 0, ns - 1
+        if ( abs(zz(k) - p) < 2.d-4 * ( zz(k) + p ) ) then
+          zl(k) = p * ( 1.d0 - 4.d-4 )
+          zr(k) = p * ( 1.d0 + 4.d-4 )
+          is_band(k) = .true.
+        else if ( zz(k) > 1.d0 - p - 2.d-4 .and. zz(k) < ( 1.d0 - p ) * ( 1.d0 - 1.d-12 ) ) then
+          zl(k) = 1.d0 - p - 4.d-4
+          zr(k) = ( 1.d0 - p ) * ( 1.d0 - 1.d-12 )
+          is_band(k) = .true.
+        end if
+      end do
+      if ( any(is_band) ) then
+        call occult_fun(zl,p,fl,ns)
+        call occult_fun(zr,p,fr,ns)
+        do k = 0, ns - 1
+          if ( is_band(k) ) fz(k,:) = fl(k,:) + ( fr(k,:) - fl(k,:) ) * ( zz(k) - zl(k) ) / ( zr(k) - zl(k) )
+        end do
+      end if
+
+      do c = 0, 2
+        o = 4 + ns * ( j + np * ( g + 3 * c ) )
+        otab(o:o+ns-1) = fz(:,c)
+      end do
+    end do
+  end do
+
+end subroutine
+
+!lambda_e, lambda_d and eta_d (f(:,0:2)) of occultquad for the z values of z0
+subroutine occult_fun(z0,p,f,nz)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nz
+  double precision, intent(in) :: z0(0:nz-1), p
+  double precision, intent(out) :: f(0:nz-1,0:2)
+!Local variables
+  double precision, dimension(0:nz-1) :: mu1, mu2, mu0
+!External function
+  external :: occultquad
+
+  !The LDCs (1,0) and (0,1) give lambda_d and eta_d, see Eq. (33)
+  call occultquad(z0,1.d0,0.d0,p,mu1,mu0,nz)
+  call occultquad(z0,0.d0,1.d0,p,mu2,mu0,nz)
+  f(:,0) = 1.d0 - mu0(:)
+  f(:,1) = ( 1.d0 - mu1(:) ) * 2.d0 / 3.d0
+  f(:,2) = ( 1.d0 - mu2(:) ) * 5.d0 / 6.d0 + f(:,0) - 2.d0 * f(:,1)
+
+end subroutine
+
+!-----------------------------------------------------------
+!                     occult_interp
+!  Same as occultquad (muo1 only) with the table of occult_table,
+!  the occultation functions are interpolated with cubic Lagrange
+!  polynomials in s and p and combined with u1 and u2 as in
+!  Eq. (33) of Mandel & Agol (2002). p has to be in [pmin,pmax]
+!------------------------------------------------------------
+subroutine occult_interp(z0,u1,u2,p,otab,muo1,nz)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nz
+  double precision, intent(in) :: z0(0:nz-1), u1, u2, p
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(out) :: muo1(0:nz-1)
+!Local variables
+  double precision :: pi = 3.1415926535897932384626d0
+  double precision :: b(0:3), cld(0:2), wp(0:3), ws(0:3), x, s
+  double precision, allocatable :: fp(:,:)
+  integer :: ns, np, i, g, jp, k, jj, c, o
+!External function
+  external :: lagrange4
+
+  ns = nint(otab(0))
+  np = nint(otab(1))
+
+  !Coefficients of lambda_e, lambda_d and eta_d
+  cld(0) = 1.d0 - u1 - 2.d0 * u2
+  cld(1) = u1 + 2.d0 * u2
+  cld(2) = u2
+  cld(:) = cld(:) / ( 1.d0 - u1 / 3.d0 - u2 / 6.d0 )
+
+  !The interpolation in p and the sum of the three functions are the same
+  !for all z, fp(:,g) has the flux loss at the ns nodes of the segment g
+  x = ( sqrt(p) - sqrt(otab(2)) ) / ( sqrt(otab(3)) - sqrt(otab(2)) ) * dble(np - 1)
+  jp = min( max( int(x) - 1, 0 ), np - 4 )
+  call lagrange4(x - dble(jp),wp)
+
+  allocate(fp(0:ns-1,0:2))
+  fp(:,:) = 0.d0
+  do g = 0, 2
+    do c = 0, 2
+      do jj = 0, 3
+        o = 4 + ns * ( jp + jj + np * ( g + 3 * c ) )
+        fp(:,g) = fp(:,g) + cld(c) * wp(jj) * otab(o:o+ns-1)
+      end do
+    end do
+  end do
+
+  b = (/ 0.d0, min(p,1.d0-p), max(p,1.d0-p), 1.d0 + p /)
+
+  do i = 0, nz - 1
+
+    muo1(i) = 1.d0
+    if ( z0(i) >= b(3) ) cycle
+
+    g = 0
+    if ( z0(i) >= b(1) ) g = 1
+    if ( z0(i) >= b(2) ) g = 2
+    s = 1.d0 - 2.d0 * ( z0(i) - b(g) ) / ( b(g+1) - b(g) )
+    s = acos( min( max( s, -1.d0 ), 1.d0 ) ) / pi
+
+    x = s * dble(ns - 1)
+    k = min( max( int(x) - 1, 0 ), ns - 4 )
+    call lagrange4(x - dble(k),ws)
+
+    muo1(i) = 1.d0 - dot_product(ws,fp(k:k+3,g))
+
+  end do
+
+  deallocate(fp)
+
+end subroutine
+
+!Weights of the cubic Lagrange interpolation with nodes 0, 1, 2, 3 at x
+subroutine lagrange4(x,w)
+implicit none
+
+  double precision, intent(in) :: x
+  double precision, intent(out) :: w(0:3)
+
+  w(0) = - ( x - 1.d0 ) * ( x - 2.d0 ) * ( x - 3.d0 ) / 6.d0
+  w(1) =   x * ( x - 2.d0 ) * ( x - 3.d0 ) / 2.d0
+  w(2) = - x * ( x - 1.d0 ) * ( x - 3.d0 ) / 2.d0
+  w(3) =   x * ( x - 1.d0 ) * ( x - 2.d0 ) / 6.d0
+
+end subroutine
@@ -1,11 +1,20 @@
 subroutine mcmc_stretch_move( &
            x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab, &  !Data vars
+           out_prefix, &                                !output files name root
            stellar_pars,afk,&                           !Stellar parameters and flag|
            flags, total_fit_flag,is_jit, &              !flags
            fit_all, fit_rvs, fit_ldc,fit_trends, &      !fitting controls
            nwalks, maxi, thin_factor, nconv, &          !mcmc evolution controls
-           lims, lims_rvs, lims_ldc, &                  !prior limits
-           n_cad, t_cad, &                              !cadence cotrols
+           cvg_test, tau_n, &                           !convergence test
+           seed, &                                      !seed of the random streams
+           move_weights, is_adapt, acc_band, &          !proposal moves
+           stuck_c, &                                   !replacement of stuck walkers
+           n_map, x_init, w_init, &                     !initial walkers
+           ntemps, t_max, &                             !parallel tempering
+           nsave, is_resume, is_stream, &               !checkpoint and output controls
+           is_text, nbytes, &                           !chain files format
+           lims, lims_rvs, lims_ldc, lin_pri, &         !prior limits
+           n_cad, t_cad, otab, cad_tol, &               !cadence cotrols
            npl, n_tel, n_jrv, &                          !planets and telescopes
            size_rv, size_tr &                           !data sizes
            )
@@ -13,7 +22,20 @@ implicit none
 
 !In/Out variables
   integer, intent(in) :: size_rv, size_tr, npl, n_tel, n_jrv !size of RV and LC data
-  integer, intent(in) :: nwalks, maxi, thin_factor, nconv, n_cad
+  integer, intent(in) :: nwalks, maxi, thin_factor, nconv, nsave, nbytes
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  !number of temperatures and the hottest temperature of the ladder
+  integer, intent(in) :: ntemps
+  double precision, intent(in) :: t_max
+  !cvg_test = 0 -> Gelman-Rubin test, 1 -> the window of nconv*thin_factor
+  !iterations is longer than tau_n autocorrelation times
+  integer, intent(in) :: cvg_test
+  !seed <= 0 takes the seed from the clock
+  integer, intent(in) :: seed
+  double precision, intent(in) :: tau_n
+  logical, intent(in) :: is_resume, is_stream, is_text
+  !out_prefix has to be the first character argument, f2py only passes its length
+  character(len=*), intent(in) :: out_prefix
   double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
   double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
   integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
@@ -21,50 +43,162 @@ implicit none
   double precision, intent(in), dimension(0:2*8*npl - 1):: lims !, lims_p
   double precision, intent(in), dimension(0:2*n_tel - 1) :: lims_rvs !, lims_p_rvs
   double precision, intent(in), dimension(0:3) :: lims_ldc !, lims_p_ldc
-  double precision, intent(in) ::  t_cad
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) ::  otab(0:*)
+  double precision, intent(in) ::  cad_tol
+  !weights of the stretch, differential evolution, walk and snooker moves
+  double precision, intent(in), dimension(0:3) :: move_weights
+  !adapt the stretch scale to get an acceptance rate between acc_band(0) and acc_band(1)
+  logical, intent(in) :: is_adapt
+  double precision, intent(in), dimension(0:1) :: acc_band
+  !during the burn-in, the walkers with a mean ln likelihood below
+  !Q1 - stuck_c * (Q3 - Q1) of the ensemble are replaced, 0 does not replace them
+  double precision, intent(in) :: stuck_c
+  !the walkers start around the MAP found from the n_map best initial walkers,
+  !0 keeps the walkers drawn from the priors
+  integer, intent(in) :: n_map
+  !the parameters with w_init = 1 of the walkers of the cold ensemble start
+  !from x_init (e.g. a previous run), the others are drawn from the priors
+  double precision, intent(in), dimension(0:nwalks-1,0:8*npl+n_tel+n_jrv+4) :: x_init
+  integer, intent(in), dimension(0:nwalks-1,0:8*npl+n_tel+n_jrv+4) :: w_init
   character, intent(in) :: fit_trends(0:1)
   character, intent(in) :: fit_all(0:8*npl-1), fit_rvs(0:n_tel-1), fit_ldc(0:1)
-  logical, intent(in) :: flags(0:5), total_fit_flag(0:1) !CHECK THE SIZE
+  logical, intent(in) :: flags(0:7), total_fit_flag(0:1) !CHECK THE SIZE
+  !priors of the linear parameters marginalized in the RV likelihood, see rv_linear
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
   logical, intent(in) :: afk(0:npl-1), is_jit(0:1)
 !Local variables
-  double precision, dimension(0:nwalks-1,0:8*npl-1) :: pars_old, pars_new
-  double precision, dimension(0:nwalks-1,0:8*npl-1) :: priors_old, priors_new
-  double precision, dimension(0:nwalks-1,0:1) :: priors_ldc_old, priors_ldc_new
-  double precision, dimension(0:nwalks-1,0:n_tel-1) :: rvs_old, rvs_new
-  double precision, dimension(0:nwalks-1,0:1) :: ldc_old, ldc_new
-  double precision, dimension(0:nwalks-1) :: r_rand, z_rand, mstar, rstar
-  double precision, dimension(0:nwalks-1) :: chi2_old_total, chi2_new_total, chi2_red
-  double precision, dimension(0:nwalks-1) :: chi2_old_rv, chi2_old_tr
-  double precision, dimension(0:nwalks-1) :: chi2_new_rv, chi2_new_tr
-  double precision, dimension(0:nwalks-1) :: jitter_tr_old, jitter_tr_new
-  double precision, dimension(0:nwalks-1,0:n_jrv-1) :: jitter_rv_old, jitter_rv_new
-  double precision, dimension(0:nwalks-1,0:1) :: tds_old, tds_new !linear and quadratic terms
-  double precision, dimension(0:nwalks-1,0:8*npl-1,0:nconv-1) :: pars_chains
-  double precision, dimension(0:nwalks-1,0:nconv-1) :: chi2_rv_chains, chi2_tr_chains, loglike_chains
-  double precision, dimension(0:nwalks-1,0:nconv-1) :: jitter_tr_chains
-  double precision, dimension(0:nwalks-1,0:n_tel-1,0:nconv-1) :: jitter_rv_chains
-  double precision, dimension(0:nwalks-1,0:1,0:nconv-1) :: tds_chains, ldc_chains
-  double precision, dimension(0:nwalks-1,0:n_tel-1,0:nconv-1) :: rvs_chains
+!The arrays that scale with nwalks and nconv live in the heap,
+!as automatic arrays they overflow the stack of the OpenMP build
+  double precision, allocatable, dimension(:,:) :: pars_old, pars_new
+  double precision, allocatable, dimension(:,:) :: priors_old, priors_new
+  double precision, allocatable, dimension(:,:) :: priors_ldc_old, priors_ldc_new
+  double precision, allocatable, dimension(:,:) :: rvs_old, rvs_new
+  double precision, allocatable, dimension(:,:) :: ldc_old, ldc_new
+  double precision, allocatable, dimension(:) :: r_rand, z_rand, mstar, rstar
+  double precision, allocatable, dimension(:) :: chi2_old_total, chi2_new_total, chi2_red
+  double precision, allocatable, dimension(:) :: chi2_old_rv, chi2_old_tr
+  double precision, allocatable, dimension(:) :: chi2_new_rv, chi2_new_tr
+  double precision, allocatable, dimension(:) :: jitter_tr_old, jitter_tr_new
+  double precision, allocatable, dimension(:,:) :: jitter_rv_old, jitter_rv_new
+  double precision, allocatable, dimension(:,:) :: tds_old, tds_new !linear and quadratic terms
+  double precision, allocatable, dimension(:,:,:) :: pars_chains
+  double precision, allocatable, dimension(:,:) :: chi2_rv_chains, chi2_tr_chains, loglike_chains
+  double precision, allocatable, dimension(:,:) :: jitter_tr_chains
+  double precision, allocatable, dimension(:,:,:) :: jitter_rv_chains
+  double precision, allocatable, dimension(:,:,:) :: tds_chains, ldc_chains
+  double precision, allocatable, dimension(:,:,:) :: rvs_chains
+  integer, allocatable, dimension(:) :: iter_chains
   double precision, dimension(0:3) :: lims_trends
-  double precision, dimension(0:nwalks-1) :: log_prior_old, log_prior_new
-  double precision, dimension(0:nwalks-1) :: log_likelihood_old, log_likelihood_new
-  integer, dimension(0:nwalks/2-1) :: r_int
-  double precision  :: a_factor, dof, tds, qq
+  double precision, allocatable, dimension(:) :: log_prior_old, log_prior_new
+  double precision, allocatable, dimension(:) :: log_likelihood_old, log_likelihood_new
+  integer, allocatable, dimension(:) :: r_int
+  double precision, allocatable, dimension(:,:) :: x_old
+  double precision, allocatable, dimension(:) :: x_new, prop_factor
+  integer, allocatable, dimension(:) :: wtf_x
+  double precision :: mem_walkers, mem_chains, u_move(0:0)
+  integer :: ios, ndim, imove
+  !Parallel tempering, the walkers of temperature it are it*nwalks to (it+1)*nwalks-1
+  double precision, allocatable, dimension(:) :: betas, swap_rate
+  double precision, allocatable, dimension(:,:) :: ti_chains, swap_chains
+  integer :: nw_tot, it, nkk, n_init, i_best
+  !Acceptance telemetry, one stretch scale for each temperature
+  double precision, allocatable, dimension(:) :: a_factor, acc_str, prop_str
+  integer, allocatable, dimension(:) :: n_acc
+  logical, allocatable, dimension(:) :: is_acc
+  integer :: n_prop
+  !Autocorrelation time, in iterations, of the current and the last window
+  double precision, allocatable, dimension(:,:) :: x_chain
+  double precision :: tau, tau_max, tau_old
+  !Random streams, rng(:,nk) is the stream of the walker nk and
+  !rng(:,nw_tot) the one of the draws shared by all the walkers
+  integer(kind=8), allocatable, dimension(:,:) :: rng
+  integer :: seed_run
+  !Stuck walkers, x_sd is the spread of the ensemble
+  logical, allocatable, dimension(:) :: is_stuck
+  double precision, allocatable, dimension(:) :: x_sd, x_eps
+  integer :: ntry
+  !MAP of each start of the optimizer and the width of the posterior around it
+  double precision, allocatable, dimension(:,:) :: x_map, x_step
+  double precision, allocatable, dimension(:) :: f_map
+  logical, allocatable, dimension(:) :: is_start
+  double precision  :: dof, tds, qq, lnp_min
   double precision  :: lims_e_dynamic(0:1,0:npl-1)
   double precision  :: mstar_mean, mstar_sigma, rstar_mean, rstar_sigma
   double precision  :: a_mean(0:npl-1), a_sigma(0:npl-1)
-  double precision :: limit_prior
   logical :: continua, is_limit_good, is_cvg
   integer :: nk, j, n, m, o, n_burn, spar, spar1, iensemble, inverted(0:1)
+  integer :: ncycle
+  character(len=len(out_prefix)+15) :: chk_file
+  character(len=len(out_prefix)+11) :: stream_file
+  character(len=len(out_prefix)+13) :: all_file
+  character(len=len(out_prefix)+7) :: ti_file
+  integer(kind=8) :: stream_pos
   integer :: nks, nke
   integer :: wtf_trends(0:1)
   integer :: wtf_all(0:8*npl-1), wtf_rvs(0:n_tel-1), wtf_ldc(0:1)
 !external calls
-  external :: init_random_seed, find_chi2_tr, find_chi2_rv
+  external :: find_chi2_tr, find_chi2_rv
+
+  !Memory needed by the buffers, in MB
+  !the last term is the row buffer of write_chain_block
+  ndim = 8*npl + 2 + n_tel + 2 + n_jrv + 1
+  nw_tot = nwalks * ntemps
+  mem_walkers = 8.d0 * nw_tot * ( 4*8*npl + 6*2 + 2*n_tel + 2*n_jrv + 24 + ndim ) &
+              + 4.d0 * nwalks / 2 + 8.d0 * ntemps * ( 5 + 2*nconv ) + 8.d0 * nw_tot
+  mem_chains  = 8.d0 * nwalks * nconv * ( 8*npl + 2*2 + n_tel + n_jrv + 5 ) &
+              + 4.d0 * nconv + 8.d0 * nwalks * ( 10 + 8*npl + n_tel + n_jrv )
+  mem_walkers = mem_walkers / 1024.d0**2
+  mem_chains  = mem_chains / 1024.d0**2
+
+  allocate( pars_old(0:nw_tot-1,0:8*npl-1), pars_new(0:nw_tot-1,0:8*npl-1),        &
+            priors_old(0:nw_tot-1,0:8*npl-1), priors_new(0:nw_tot-1,0:8*npl-1),    &
+            priors_ldc_old(0:nw_tot-1,0:1), priors_ldc_new(0:nw_tot-1,0:1),        &
+            rvs_old(0:nw_tot-1,0:n_tel-1), rvs_new(0:nw_tot-1,0:n_tel-1),          &
+            ldc_old(0:nw_tot-1,0:1), ldc_new(0:nw_tot-1,0:1),                      &
+            tds_old(0:nw_tot-1,0:1), tds_new(0:nw_tot-1,0:1),                      &
+            jitter_rv_old(0:nw_tot-1,0:n_jrv-1), jitter_rv_new(0:nw_tot-1,0:n_jrv-1), &
+            r_rand(0:nw_tot-1), z_rand(0:nw_tot-1), mstar(0:nw_tot-1),             &
+            rstar(0:nw_tot-1), chi2_old_total(0:nw_tot-1),                         &
+            chi2_new_total(0:nw_tot-1), chi2_red(0:nw_tot-1),                      &
+            chi2_old_rv(0:nw_tot-1), chi2_old_tr(0:nw_tot-1),                      &
+            chi2_new_rv(0:nw_tot-1), chi2_new_tr(0:nw_tot-1),                      &
+            jitter_tr_old(0:nw_tot-1), jitter_tr_new(0:nw_tot-1),                  &
+            log_prior_old(0:nw_tot-1), log_prior_new(0:nw_tot-1),                  &
+            log_likelihood_old(0:nw_tot-1), log_likelihood_new(0:nw_tot-1),        &
+            r_int(0:nwalks/2-1), prop_factor(0:nw_tot-1), stat=ios )
+  if ( ios == 0 ) &
+  allocate( x_old(0:nw_tot-1,0:ndim-1), wtf_x(0:ndim-1), betas(0:ntemps-1),      &
+            swap_rate(0:ntemps-1), ti_chains(0:ntemps-1,0:nconv-1),              &
+            swap_chains(0:ntemps-1,0:nconv-1), a_factor(0:ntemps-1),             &
+            acc_str(0:ntemps-1), prop_str(0:ntemps-1), n_acc(0:nw_tot-1),        &
+            is_acc(0:nw_tot-1), rng(0:5,0:nw_tot), is_stuck(0:nwalks-1),         &
+            x_sd(0:ndim-1), x_eps(0:ndim-1), stat=ios )
+  if ( ios == 0 ) &
+  allocate( pars_chains(0:nwalks-1,0:8*npl-1,0:nconv-1),                           &
+            chi2_rv_chains(0:nwalks-1,0:nconv-1), chi2_tr_chains(0:nwalks-1,0:nconv-1), &
+            loglike_chains(0:nwalks-1,0:nconv-1), jitter_tr_chains(0:nwalks-1,0:nconv-1), &
+            jitter_rv_chains(0:nwalks-1,0:n_jrv-1,0:nconv-1),                      &
+            tds_chains(0:nwalks-1,0:1,0:nconv-1), ldc_chains(0:nwalks-1,0:1,0:nconv-1), &
+            rvs_chains(0:nwalks-1,0:n_tel-1,0:nconv-1), iter_chains(0:nconv-1),  &
+            x_chain(0:nwalks-1,0:nconv-1), stat=ios )
+  if ( ios /= 0 ) then
+    print *, 'I cannot allocate the memory for the chains!'
+    print *, 'walkers (MB)     = ', mem_walkers
+    print *, 'chain window (MB)= ', mem_chains
+    print *, 'Reduce nchains or niter'
+    stop
+  end if
 
   !call the random seed
   print *, 'CREATING RANDOM SEED'
-  call init_random_seed()
+  seed_run = seed
+  if ( seed_run <= 0 ) call system_clock(count=seed_run)
+
+  chk_file = trim(out_prefix)//'_checkpoint.dat'
+  stream_file = trim(out_prefix)//'_chains.bin'
+  all_file = trim(out_prefix)//'_all_data.bin'
+  ti_file = trim(out_prefix)//'_ti.dat'
 
   !Get the stellar parameters
   mstar_mean  = stellar_pars(0)
@@ -90,6 +224,20 @@ implicit none
     if ( fit_trends(o) .ne. 'f' ) wtf_trends(o) = 1
   end do
 
+  !The same for the vector of a walker used by the proposal moves
+  !(see pack_walker)
+  o = 8*npl
+  wtf_x(0:o-1) = wtf_all(:)
+  wtf_x(o:o+1) = wtf_ldc(:)
+  o = o + 2
+  wtf_x(o:o+n_tel-1) = wtf_rvs(:)
+  o = o + n_tel
+  wtf_x(o:o+1) = wtf_trends(:)
+  o = o + 2
+  wtf_x(o:o+n_jrv) = 0
+  if ( is_jit(0) ) wtf_x(o:o+n_jrv-1) = 1
+  if ( is_jit(1) ) wtf_x(o+n_jrv) = 1
+
   spar = sum(wtf_all) + sum(wtf_ldc) + sum(wtf_rvs) + sum(wtf_trends)
   !spar -> size of parameters, dof -> degrees of freedom
   if ( is_jit(0) ) spar = spar + 1*n_jrv
@@ -102,25 +250,6 @@ implicit none
   if ( total_fit_flag(1) ) dof = dof + size_tr
   dof  = dof - spar
 
-  !Jitter vars
-  jitter_rv_old(:,:) = 0.0d0
-  jitter_tr_old(:) = 0.0d0
-  jitter_rv_new(:,:) = 0.0d0
-  jitter_tr_new(:) = 0.0d0
-
-  if ( is_jit(0) ) then
-    do m = 0, n_jrv - 1
-      do nk = 0, nwalks - 1
-        call create_chains('u',(/0.d0,e_rv(0)/),jitter_rv_old(nk,m),1)
-      end do
-    end do
-  end if
-  if ( is_jit(1) ) then
-    do nk = 0, nwalks - 1
-      call create_chains('u',(/0.d0,e_tr(0)/),jitter_tr_old(nk),1)
-    end do
-  end if
-
   !Linear and quadratic terms
   lims_trends(:) = 0.0d0
   tds = 0.0d0
@@ -133,25 +262,82 @@ implicit none
     lims_trends(3) =  1.0d-1
   end if
 
+  jitter_rv_new(:,:) = 0.0d0
+  jitter_tr_new(:) = 0.0d0
+  priors_new(:,:) = 1.d0
+  priors_ldc_new(:,:) = 1.d0
+
+  !Initialize the values
+  j = 1
+  n = 0
+  continua = .true.
+  a_factor(:) = 2.d0
+  n_burn = 1
+  n_acc(:) = 0
+  n_prop = 0
+  acc_str(:) = 0.d0
+  prop_str(:) = 0.d0
+  tau_old = 0.d0
+  inverted = (/ 1 , 0 /)
+
+  !Geometric ladder of temperatures, betas = 1 / T
+  betas(0) = 1.d0
+  do it = 1, ntemps - 1
+    betas(it) = t_max**( - dble(it) / dble(ntemps - 1) )
+  end do
+  swap_rate(:) = 0.d0
+
+  if ( is_resume ) then
+
+  !Restart the walkers from the last saved state of a previous run
+  print *, 'RESUMING FROM ', trim(chk_file)
+  call load_checkpoint(chk_file,j,pars_old,rvs_old,ldc_old,tds_old, &
+       jitter_rv_old,jitter_tr_old,priors_old,priors_ldc_old,       &
+       log_likelihood_old,chi2_old_total,chi2_old_rv,chi2_old_tr,   &
+       log_prior_old,betas,a_factor,tau_old,seed_run,nw_tot,ntemps,npl,n_tel,n_jrv)
+  !The checkpoint is written once the iteration j has finished
+  j = j + 1
+
+  else
+
+  !The initial walkers use the iteration 0 of the streams
+  do nk = 0, nw_tot
+    call rng_init(rng(:,nk),seed_run,nk,0)
+  end do
+
+  !Jitter vars
+  jitter_rv_old(:,:) = 0.0d0
+  jitter_tr_old(:) = 0.0d0
+
+  if ( is_jit(0) ) then
+    do m = 0, n_jrv - 1
+      do nk = 0, nw_tot - 1
+        call create_chains('u',(/0.d0,e_rv(0)/),jitter_rv_old(nk,m),1,rng(:,nk))
+      end do
+    end do
+  end if
+  if ( is_jit(1) ) then
+    do nk = 0, nw_tot - 1
+      call create_chains('u',(/0.d0,e_tr(0)/),jitter_tr_old(nk),1,rng(:,nk))
+    end do
+  end if
 
   print *, 'CREATING CHAINS'
 
-  call gauss_random_bm(mstar_mean,mstar_sigma,mstar,nwalks)
-  call gauss_random_bm(rstar_mean,rstar_sigma,rstar,nwalks)
+  call gauss_random_bm(mstar_mean,mstar_sigma,mstar,nw_tot,rng(:,nw_tot))
+  call gauss_random_bm(rstar_mean,rstar_sigma,rstar,nw_tot,rng(:,nw_tot))
 
   priors_old(:,:) = 1.d0
-  priors_new(:,:) = 1.d0
   priors_ldc_old(:,:) = 1.d0
-  priors_ldc_new(:,:) = 1.d0
 
   !Let us create uniformative random priors
   is_limit_good = .false.
   !$OMP PARALLEL &
-  !$OMP PRIVATE(is_limit_good,m,limit_prior,a_mean,a_sigma)
+  !$OMP PRIVATE(is_limit_good,m,a_mean,a_sigma,lims_e_dynamic)
   !$OMP DO SCHEDULE(DYNAMIC)
-  do nk = 0, nwalks - 1
+  do nk = 0, nw_tot - 1
 
-      call create_chains(fit_all,lims,pars_old(nk,:),8*npl)
+      call create_chains(fit_all,lims,pars_old(nk,:),8*npl,rng(:,nk))
 
       !If we are using e and w parameterization, let us be sure we do not have e > 1
       if ( flags(1) ) then
@@ -159,19 +345,19 @@ implicit none
           lims_e_dynamic(:,m) = sqrt( 1.d0 - pars_old(nk,2+8*m)**2 )
           lims_e_dynamic(0,m) = - lims_e_dynamic(0,m)
           if ( fit_all(3+8*m) == 'f' ) lims_e_dynamic(0,m) = lims(3*2+8*m*2)
-          call create_chains(fit_all(3+8*m),lims_e_dynamic(:,m),pars_old(nk,3+8*m),1)
+          call create_chains(fit_all(3+8*m),lims_e_dynamic(:,m),pars_old(nk,3+8*m),1,rng(:,nk))
         end do
       end if
 
       call get_priors(fit_all,lims,pars_old(nk,:),priors_old(nk,:),8*npl)
 
-      call create_chains(fit_trends,lims_trends,tds_old(nk,:),2)
+      call create_chains(fit_trends,lims_trends,tds_old(nk,:),2,rng(:,nk))
       !call get_priors(fit_trends,lims_trends,tds_old(nk,:),priors_trends(nk,:),2)
 
-      call create_chains(fit_rvs,lims_rvs,rvs_old(nk,:),n_tel)
+      call create_chains(fit_rvs,lims_rvs,rvs_old(nk,:),n_tel,rng(:,nk))
       !call get_priors(fit_rvs,lims_rvs,rvs_old(nk,:),priors_rvs(nk,:),n_tel)
 
-      call create_chains(fit_ldc,lims_ldc,ldc_old(nk,:),2)
+      call create_chains(fit_ldc,lims_ldc,ldc_old(nk,:),2,rng(:,nk))
       call get_priors(fit_ldc,lims_ldc,ldc_old(nk,:),priors_ldc_old(nk,:),2)
 
       !Will we use spectroscopic priors for some planets?
@@ -188,8 +374,8 @@ implicit none
       log_prior_old(nk) = sum( log(priors_old(nk,:) ) + sum( log(priors_ldc_old(nk,:) ) ) )
 
       call get_loglike(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab, &
-           total_fit_flag,flags,t_cad,n_cad,pars_old(nk,:),rvs_old(nk,:), &
-           ldc_old(nk,:),tds_old(nk,:),jitter_rv_old(nk,:),jitter_tr_old(nk),&
+           total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol,pars_old(nk,:),rvs_old(nk,:), &
+           ldc_old(nk,:),tds_old(nk,:),jitter_rv_old(nk,:),jitter_tr_old(nk),-huge(0.d0), &
            log_likelihood_old(nk),chi2_old_rv(nk),chi2_old_tr(nk),npl,n_tel,n_jrv,size_rv,size_tr)
 
       chi2_old_total(nk) = chi2_old_rv(nk) + chi2_old_tr(nk)
@@ -198,6 +384,111 @@ implicit none
   end do
   !$OMP END PARALLEL
 
+  !Walkers from x_init, a walker outside the priors keeps its random values
+  if ( any( w_init == 1 ) ) then
+    n_init = 0
+    !$OMP PARALLEL DO SCHEDULE(DYNAMIC) PRIVATE(x_new,is_limit_good) REDUCTION(+:n_init)
+    do nk = 0, nwalks - 1
+      if ( all( w_init(nk,:) * wtf_x(:) == 0 ) ) cycle
+      allocate(x_new(0:ndim-1))
+      call pack_walker(pars_old(nk,:),ldc_old(nk,:),rvs_old(nk,:),tds_old(nk,:), &
+           jitter_rv_old(nk,:),jitter_tr_old(nk),x_old(nk,:),npl,n_tel,n_jrv)
+      x_new(:) = x_old(nk,:)
+      where ( w_init(nk,:) * wtf_x(:) == 1 ) x_new = x_init(nk,:)
+      call unpack_walker(x_new,pars_new(nk,:),ldc_new(nk,:),rvs_new(nk,:), &
+           tds_new(nk,:),jitter_rv_new(nk,:),jitter_tr_new(nk),npl,n_tel,n_jrv)
+      call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,             &
+           total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol,fit_all,fit_ldc,lims,lims_ldc,     &
+           afk,stellar_pars,pars_new(nk,:),rvs_new(nk,:),ldc_new(nk,:),        &
+           tds_new(nk,:),jitter_rv_new(nk,:),jitter_tr_new(nk),                &
+           1.d0,-huge(0.d0),                                                   &
+           priors_new(nk,:),priors_ldc_new(nk,:),log_prior_new(nk),            &
+           log_likelihood_new(nk),chi2_new_rv(nk),chi2_new_tr(nk),             &
+           is_limit_good,npl,n_tel,n_jrv,size_rv,size_tr)
+      if ( is_limit_good ) then
+        n_init = n_init + 1
+        pars_old(nk,:)      = pars_new(nk,:)
+        rvs_old(nk,:)       = rvs_new(nk,:)
+        ldc_old(nk,:)       = ldc_new(nk,:)
+        tds_old(nk,:)       = tds_new(nk,:)
+        jitter_rv_old(nk,:) = jitter_rv_new(nk,:)
+        jitter_tr_old(nk)   = jitter_tr_new(nk)
+        priors_old(nk,:)     = priors_new(nk,:)
+        priors_ldc_old(nk,:) = priors_ldc_new(nk,:)
+        log_prior_old(nk)      = log_prior_new(nk)
+        log_likelihood_old(nk) = log_likelihood_new(nk)
+        chi2_old_rv(nk)    = chi2_new_rv(nk)
+        chi2_old_tr(nk)    = chi2_new_tr(nk)
+        chi2_old_total(nk) = chi2_old_rv(nk) + chi2_old_tr(nk)
+      end if
+      deallocate(x_new)
+    end do
+    !$OMP END PARALLEL DO
+    print *, n_init, ' WALKERS START FROM THE INITIAL VALUES'
+  end if
+
+  end if !is_resume
+
+  !Optimize the best initial walkers in parallel, the walkers of the
+  !cold ensemble start in a ball with the width of the posterior at the MAP
+  if ( n_map > 0 .and. .not. is_resume ) then
+    m = min(n_map,nwalks)
+    print *, 'SEARCHING THE MAP FROM ', m, ' STARTS'
+    allocate( x_map(0:ndim-1,0:m-1), x_step(0:ndim-1,0:m-1), f_map(0:m-1), is_start(0:nwalks-1) )
+    do nk = 0, nwalks - 1
+      call pack_walker(pars_old(nk,:),ldc_old(nk,:),rvs_old(nk,:),tds_old(nk,:), &
+           jitter_rv_old(nk,:),jitter_tr_old(nk),x_old(nk,:),npl,n_tel,n_jrv)
+    end do
+    do o = 0, ndim - 1
+      x_sd(o) = sum(x_old(0:nwalks-1,o)) / nwalks
+      x_sd(o) = sqrt( sum( ( x_old(0:nwalks-1,o) - x_sd(o) )**2 ) / nwalks )
+    end do
+    is_start(:) = .false.
+    do nkk = 0, m - 1
+      nk = maxloc(log_likelihood_old(0:nwalks-1),1,mask=.not. is_start) - 1
+      is_start(nk) = .true.
+      x_map(:,nkk) = x_old(nk,:)
+      x_step(:,nkk) = 1.d-1 * x_sd(:)
+    end do
+    !$OMP PARALLEL DO SCHEDULE(DYNAMIC)
+    do nkk = 0, m - 1
+      call find_map(x_map(:,nkk),f_map(nkk),x_step(:,nkk),wtf_x, &
+           x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,ndim,npl,n_tel,n_jrv,size_rv,size_tr)
+    end do
+    !$OMP END PARALLEL DO
+    i_best = maxloc(f_map,1) - 1
+    print *, 'MAP ln posterior = ', f_map(i_best), ' (worst start = ', minval(f_map), ')'
+    !If a walker of the ball is outside the priors, the ball shrinks for it,
+    !if it is still outside after 20 tries the walker keeps its prior draw
+    !$OMP PARALLEL DO SCHEDULE(DYNAMIC) PRIVATE(x_eps,x_new,ntry,qq,is_limit_good)
+    do nk = 0, nwalks - 1
+      allocate(x_new(0:ndim-1))
+      x_new(:) = x_old(nk,:)
+      call gauss_random_bm(0.d0,1.d0,x_eps,ndim,rng(:,nk))
+      do ntry = 0, 20
+        qq = 0.5d0**ntry
+        x_old(nk,:) = x_map(:,i_best) + qq * wtf_x(:) * x_step(:,i_best) * x_eps(:)
+        if ( ntry == 20 ) x_old(nk,:) = x_new(:)
+        call unpack_walker(x_old(nk,:),pars_old(nk,:),ldc_old(nk,:),rvs_old(nk,:), &
+             tds_old(nk,:),jitter_rv_old(nk,:),jitter_tr_old(nk),npl,n_tel,n_jrv)
+        call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,             &
+             total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol,fit_all,fit_ldc,lims,lims_ldc,     &
+             afk,stellar_pars,pars_old(nk,:),rvs_old(nk,:),ldc_old(nk,:),        &
+             tds_old(nk,:),jitter_rv_old(nk,:),jitter_tr_old(nk),                &
+             1.d0,-huge(0.d0),                                                   &
+             priors_old(nk,:),priors_ldc_old(nk,:),log_prior_old(nk),            &
+             log_likelihood_old(nk),chi2_old_rv(nk),chi2_old_tr(nk),             &
+             is_limit_good,npl,n_tel,n_jrv,size_rv,size_tr)
+        if ( is_limit_good ) exit
+      end do
+      chi2_old_total(nk) = chi2_old_rv(nk) + chi2_old_tr(nk)
+      deallocate(x_new)
+    end do
+    !$OMP END PARALLEL DO
+    deallocate( x_map, x_step, f_map, is_start )
+  end if
+
   chi2_red(:) = chi2_old_total(:) / dof
 
   !Print the initial cofiguration
@@ -209,53 +500,103 @@ implicit none
   print *, 'TR datapoints  = ', size_tr
   print *, 'No. parameters = ', int(spar)
   print *, 'dof            = ', int(dof)
+  print *, 'Random seed    = ', seed_run
+  print *, 'Memory (MB)    = ', real(mem_walkers+mem_chains), &
+           '(walkers:', real(mem_walkers), ', chains:', real(mem_chains), ')'
+  if ( ntemps > 1 ) &
+  print *, 'Temperatures   = ', ntemps, '(T_max =', real(t_max), ')'
   call print_chain_data(chi2_red,nwalks)
 
-  !Initialize the values
-  j = 1
-  n = 0
-  continua = .true.
-  a_factor = 2.d0
-  n_burn = 1
-  inverted = (/ 1 , 0 /)
+  !All the thinned iterations are appended to the stream file
+  stream_pos = 1
+  if ( is_stream ) then
+    if ( is_resume ) then
+      open(unit=601,file=trim(stream_file),status='unknown',access='stream', &
+           form='unformatted',position='append')
+    else
+      open(unit=601,file=trim(stream_file),status='replace',access='stream', &
+           form='unformatted')
+    end if
+    inquire(unit=601,pos=stream_pos)
+    if ( stream_pos == 1 ) call write_chain_header(601,nbytes,flags,npl,n_tel,n_jrv)
+  end if
 
   !The infinite cycle starts!
   print *, 'STARTING INFINITE LOOP!'
+  n = 0
   do while ( continua )
 
-    !Creating the random variables
-    !Do the work for all the walkers
-    call random_number(r_rand)
+    !The random streams of this iteration
+    do nk = 0, nw_tot
+      call rng_init(rng(:,nk),seed_run,nk,j)
+    end do
+
+    !Choose the proposal move of this iteration
+    imove = maxloc(move_weights,dim=1) - 1
+    if ( count(move_weights > 0.d0) > 1 ) then
+      call rng_uniform(rng(:,nw_tot),u_move,1)
+      u_move(0) = u_move(0) * sum(move_weights)
+      do imove = 0, 2
+        if ( u_move(0) < sum(move_weights(0:imove)) ) exit
+      end do
+    end if
 
     !Perform the paralelization following Foreman-Mackey, 2013
+    is_acc(:) = .false.
+
+    !Each temperature is an independent ensemble
     do iensemble = 0, 1
 
-      nks = iensemble * nwalks/2
-      nke = (iensemble + 1) * nwalks/2 - 1
+      do it = 0, ntemps - 1
+
+      nks = it * nwalks + iensemble * nwalks/2
+      nke = nks + nwalks/2 - 1
+      o   = it * nwalks
 
       !Create random integers to be the index of the walks
       !Note that r_ink(i) != i (avoid copy the same walker)
-      call random_int(r_int,inverted(iensemble)*nwalks/2,(inverted(iensemble)+1)*nwalks/2 - 1)
+      call random_int(r_int,inverted(iensemble)*nwalks/2,(inverted(iensemble)+1)*nwalks/2 - 1, &
+           rng(:,nw_tot))
 
 
       !Pick a random walker from the complementary ensemble
       do nk = nks, nke
-        pars_new(nk,:)      = pars_old(r_int(nk-nks),:)
-        rvs_new(nk,:)       = rvs_old(r_int(nk-nks),:)
-        ldc_new(nk,:)       = ldc_old(r_int(nk-nks),:)
-        tds_new(nk,:)       = tds_old(r_int(nk-nks),:)
-        jitter_rv_new(nk,:) = jitter_rv_old(r_int(nk-nks),:)
-        jitter_tr_new(nk)   = jitter_tr_old(r_int(nk-nks))
+        pars_new(nk,:)      = pars_old(o+r_int(nk-nks),:)
+        rvs_new(nk,:)       = rvs_old(o+r_int(nk-nks),:)
+        ldc_new(nk,:)       = ldc_old(o+r_int(nk-nks),:)
+        tds_new(nk,:)       = tds_old(o+r_int(nk-nks),:)
+        jitter_rv_new(nk,:) = jitter_rv_old(o+r_int(nk-nks),:)
+        jitter_tr_new(nk)   = jitter_tr_old(o+r_int(nk-nks))
       end do
 
+      end do !temperatures
+
+      !The moves different to stretch work with the walkers as vectors
+      if ( imove > 0 ) then
+        do nk = 0, nw_tot - 1
+          call pack_walker(pars_old(nk,:),ldc_old(nk,:),rvs_old(nk,:),tds_old(nk,:), &
+               jitter_rv_old(nk,:),jitter_tr_old(nk),x_old(nk,:),npl,n_tel,n_jrv)
+        end do
+      end if
+
     !Paralellization calls
     !$OMP PARALLEL &
-    !$OMP PRIVATE(is_limit_good,qq,m,limit_prior,a_mean,a_sigma)
+    !$OMP PRIVATE(is_limit_good,qq,lnp_min,x_new,nk,it,o)
+    allocate(x_new(0:ndim-1))
     !$OMP DO SCHEDULE(DYNAMIC)
-    do nk = nks, nke
+    do nkk = 0, ntemps * nwalks/2 - 1
+
+      !Walker nk of the temperature it
+      it = nkk / ( nwalks/2 )
+      nk = it * nwalks + iensemble * nwalks/2 + mod(nkk,nwalks/2)
+
+      !Random number of the acceptance test
+      call rng_uniform(rng(:,nk),r_rand(nk),1)
+
+      if ( imove == 0 ) then
 
       !Generate the random step to perform the stretch move
-      call find_gz(a_factor,z_rand(nk))
+      call find_gz(a_factor(it),z_rand(nk),rng(:,nk))
 
       !Perform the stretch move
       !Eq. (7), Goodman & Weare (2010)
@@ -272,60 +613,54 @@ implicit none
       jitter_tr_new(nk) = jitter_tr_new(nk) + z_rand(nk) *             &
                          ( jitter_tr_old(nk) - jitter_tr_new(nk) )
 
-      call get_priors(fit_all,lims,pars_new(nk,:),priors_new(nk,:),8*npl)
-      call get_priors(fit_ldc,lims_ldc,ldc_new(nk,:),priors_ldc_new(nk,:),2)
-
-      do m = 0, npl - 1
-        if ( afk(m) ) then
-          !The parameter comes from 3rd Kepler law
-          call get_a_err(mstar_mean,mstar_sigma,rstar_mean,rstar_sigma,&
-               pars_new(nk,1+8*m),a_mean(m),a_sigma(m))
-          call gauss_prior(a_mean(m),a_sigma(m),pars_new(nk,5+8*m),priors_new(nk,5+8*m))
-        end if
-      end do
-     ! pars_new(nk,1+8*4) = pars_new(nk,1+8*3)/2.0
-     ! print *, pars_new(nk,1+8*4), pars_new(nk,1+8*3)
-     ! stop
-
-
-      limit_prior = PRODUCT(priors_new(nk,:)) * PRODUCT(priors_ldc_new(nk,:) )
-
-      !Let us check if the new parameters are inside the limits
-      is_limit_good = .true.
-      if ( limit_prior < 1.d-100 ) is_limit_good = .false.
-      if ( is_limit_good ) then
-        if ( ANY( jitter_rv_new(nk,:) < 0.0d0 ) .or. jitter_tr_new(nk) < 0.0d0 ) is_limit_good = .false.
-      end if
-
-      chi2_new_total(nk) = huge(0.0d0) !A really big number!
-      log_likelihood_new(nk) = -huge(0.e0)
-
-      if ( is_limit_good ) then !If we are inside the limits, let us calculate chi^2
+      !z^(pars-1) normalization factor needed to perform the stretch move
+      !Goodman & Weare (2010)
+      prop_factor(nk) = z_rand(nk)**spar1
 
-      call get_loglike(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab, &
-           total_fit_flag,flags,t_cad,n_cad,pars_new(nk,:),rvs_new(nk,:), &
-           ldc_new(nk,:),tds_new(nk,:),jitter_rv_new(nk,:),jitter_tr_new(nk),&
-           log_likelihood_new(nk),chi2_new_rv(nk),chi2_new_tr(nk),npl,n_tel,&
-           n_jrv,size_rv,size_tr)
+      else
 
-      chi2_new_total(nk) = chi2_new_rv(nk) + chi2_new_tr(nk)
+      !The complementary ensemble is the other half of the walkers
+      o = it * nwalks + inverted(iensemble) * nwalks/2
+      call propose_move(imove,x_old(nk,:),x_old(o:o+nwalks/2-1,:),wtf_x,spar, &
+           x_new,prop_factor(nk),rng(:,nk),ndim,nwalks/2)
+      call unpack_walker(x_new,pars_new(nk,:),ldc_new(nk,:),rvs_new(nk,:), &
+           tds_new(nk,:),jitter_rv_new(nk,:),jitter_tr_new(nk),npl,n_tel,n_jrv)
 
       end if
 
-      log_prior_new(nk) = sum( log(priors_new(nk,:) ) ) + &
-                          sum( log(priors_ldc_new(nk,:) ) )
+      !The random numbers of the acceptance test are known, the proposal is
+      !rejected if ln prior + beta * ln likelihood < lnp_min, so the
+      !likelihood calculation stops as soon as this is certain
+      lnp_min = log_prior_old(nk) + betas(it) * ( log_likelihood_old(nk) - log_prior_old(nk) ) &
+              + log(r_rand(nk)) - log(prop_factor(nk))
+
+      !ln prior + ln likelihood of the proposed walker
+      call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,             &
+           total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol,fit_all,fit_ldc,lims,lims_ldc,     &
+           afk,stellar_pars,pars_new(nk,:),rvs_new(nk,:),ldc_new(nk,:),        &
+           tds_new(nk,:),jitter_rv_new(nk,:),jitter_tr_new(nk),                &
+           betas(it),lnp_min,                                                  &
+           priors_new(nk,:),priors_ldc_new(nk,:),log_prior_new(nk),            &
+           log_likelihood_new(nk),chi2_new_rv(nk),chi2_new_tr(nk),             &
+           is_limit_good,npl,n_tel,n_jrv,size_rv,size_tr)
 
-      log_likelihood_new(nk) = log_prior_new(nk) + log_likelihood_new(nk)
+      chi2_new_total(nk) = huge(0.0d0) !A really big number!
+      if ( is_limit_good ) chi2_new_total(nk) = chi2_new_rv(nk) + chi2_new_tr(nk)
 
       qq = log_likelihood_new(nk) - log_likelihood_old(nk)
-      !z^(pars-1) normalization factor needed to perform the stretch move
-      !Goodman & Weare (2010)
-      qq = z_rand(nk)**spar1 * exp(qq)
+      !Only the likelihood is tempered, the prior is the same for all temperatures
+      if ( it > 0 .and. is_limit_good ) &
+      qq = qq - ( 1.d0 - betas(it) ) * &
+           ( ( log_likelihood_new(nk) - log_prior_new(nk) ) - &
+             ( log_likelihood_old(nk) - log_prior_old(nk) ) )
+      qq = prop_factor(nk) * exp(qq)
 
       !Check if the new likelihood is better
       if ( qq > r_rand(nk) ) then
+        is_acc(nk) = .true.
         !If yes, let us save it as the old vectors
         log_likelihood_old(nk) = log_likelihood_new(nk)
+        log_prior_old(nk)      = log_prior_new(nk)
         chi2_old_total(nk)     = chi2_new_total(nk)
         chi2_old_rv(nk)        = chi2_new_rv(nk)
         chi2_old_tr(nk)        = chi2_new_tr(nk)
@@ -340,10 +675,35 @@ implicit none
       end if
 
     end do !walkers
+    !$OMP END DO
+    deallocate(x_new)
     !$OMP END PARALLEL
 
     end do !iensemble
 
+    !Count the accepted moves of each walker, the stretch scale
+    !is tuned with the moves of the iterations that used it
+    n_prop = n_prop + 1
+    where ( is_acc ) n_acc = n_acc + 1
+    if ( imove == 0 ) then
+      do it = 0, ntemps - 1
+        acc_str(it)  = acc_str(it) + count( is_acc(it*nwalks:(it+1)*nwalks-1) )
+        prop_str(it) = prop_str(it) + nwalks
+      end do
+    end if
+
+    !Swap walkers between adjacent temperatures
+    if ( ntemps > 1 ) then
+      call swap_temperatures(betas,swap_rate,pars_old,rvs_old,ldc_old,tds_old, &
+           jitter_rv_old,jitter_tr_old,priors_old,priors_ldc_old,              &
+           log_likelihood_old,log_prior_old,chi2_old_total,chi2_old_rv,        &
+           chi2_old_tr,rng(:,nw_tot),nwalks,ntemps,npl,n_tel,n_jrv)
+      !The spacing of the ladder adapts with a decaying rate during the first
+      !nconv window, which cannot pass the convergence test. The ladder is fixed
+      !afterwards, the window used for the evidence is sampled with its betas
+      if ( j <= thin_factor*nconv ) call adapt_temperatures(betas,swap_rate,j,ntemps)
+    end if
+
     !Compute the reduced chi square
     chi2_red(:) = chi2_old_total(:) / dof
 
@@ -351,33 +711,69 @@ implicit none
       !If the chains have not converged, let us check convergence
       !Let us save a 3D array with the informations of the parameters,
       !the nk and the iteration. This array is used to perform GR test
-      pars_chains(:,:,n)      = pars_old(:,:)
-      chi2_rv_chains(:,n)     = chi2_old_rv(:)
-      chi2_tr_chains(:,n)     = chi2_old_tr(:)
-      loglike_chains(:,n)     = log_likelihood_old(:)
-      ldc_chains(:,:,n)       = ldc_old(:,:)
-      rvs_chains(:,:,n)       = rvs_old(:,:)
-      tds_chains(:,:,n)       = tds_old(:,:)
-      jitter_rv_chains(:,:,n) = jitter_rv_old(:,:)
-      jitter_tr_chains(:,n)   = jitter_tr_old(:)
+      !Only the walkers with T = 1 are saved
+      pars_chains(:,:,n)      = pars_old(0:nwalks-1,:)
+      chi2_rv_chains(:,n)     = chi2_old_rv(0:nwalks-1)
+      chi2_tr_chains(:,n)     = chi2_old_tr(0:nwalks-1)
+      loglike_chains(:,n)     = log_likelihood_old(0:nwalks-1)
+      ldc_chains(:,:,n)       = ldc_old(0:nwalks-1,:)
+      rvs_chains(:,:,n)       = rvs_old(0:nwalks-1,:)
+      tds_chains(:,:,n)       = tds_old(0:nwalks-1,:)
+      jitter_rv_chains(:,:,n) = jitter_rv_old(0:nwalks-1,:)
+      jitter_tr_chains(:,n)   = jitter_tr_old(0:nwalks-1)
+      iter_chains(n)          = j
+      !Mean ln likelihood of each temperature for the thermodynamic integration
+      do it = 0, ntemps - 1
+        o = it * nwalks
+        ti_chains(it,n) = sum( log_likelihood_old(o:o+nwalks-1) - &
+                               log_prior_old(o:o+nwalks-1) ) / nwalks
+      end do
+      swap_chains(:,n) = swap_rate(:)
       n = n + 1
       !Is it time to check covergence=
       if ( n == nconv ) then
+        !The nconv window is the write buffer of the stream file
+        if ( is_stream ) then
+          call write_chain_block(601,nbytes,nconv,iter_chains,loglike_chains,      &
+               chi2_rv_chains,chi2_tr_chains,pars_chains,ldc_chains,rvs_chains,    &
+               tds_chains,jitter_rv_chains,jitter_tr_chains,nwalks,nconv,npl,n_tel,n_jrv)
+          inquire(unit=601,pos=stream_pos)
+        end if
         !Perform G-R test
         n = 0 !reinitilize n
         call print_chain_data(chi2_red,nwalks)
+        call print_acceptance(n_acc,n_prop,a_factor(0),nwalks)
         print *, '=================================='
-        print *, '     PERFOMING GELMAN-RUBIN'
+        if ( cvg_test == 0 ) then
+          print *, '     PERFOMING GELMAN-RUBIN'
+        else
+          print *, '   ESTIMATING AUTOCORRELATION'
+        end if
         print *, '      TEST FOR CONVERGENCE'
         print *, '=================================='
-        !Check convergence for all the parameters
+        !Check convergence for all the fitted parameters
         is_cvg = .true.
-        do o = 0, 8*npl-1
-          if (wtf_all(o) == 1 ) then !perform G-R test
-            call gr_test(pars_chains(:,o,:),nwalks,nconv,is_cvg)
+        tau_max = 0.d0
+        do o = 0, ndim - 1
+          if ( wtf_x(o) == 1 ) then
+            call get_chain_column(o,pars_chains,ldc_chains,rvs_chains,tds_chains, &
+                 jitter_rv_chains,jitter_tr_chains,x_chain,nwalks,nconv,npl,n_tel,n_jrv)
+            if ( cvg_test == 0 .and. is_cvg ) &
+            call gr_test(x_chain,nwalks,nconv,is_cvg)
+            call integrated_time(x_chain,nwalks,nconv,tau)
+            tau_max = max(tau_max,tau)
           end if
-          if ( .not. is_cvg ) exit
         end do
+        tau_max = tau_max * thin_factor
+        print *, 'MAX AUTOCORRELATION TIME = ', real(tau_max), ' ITERATIONS'
+        print *, 'INDEPENDENT SAMPLES/CHAIN= ', real(nconv*thin_factor/tau_max)
+
+        !The window has to contain tau_n autocorrelation times and the
+        !estimate of tau has to be stable, the walkers are not drifting
+        if ( cvg_test == 1 ) &
+        is_cvg = ( nconv*thin_factor >= tau_n*tau_max .and. &
+                   abs(tau_max - tau_old) < 0.1d0*tau_max )
+        tau_old = tau_max
 
         if ( j < thin_factor*nconv + 1 ) is_cvg = .False.
 
@@ -386,6 +782,61 @@ implicit none
           print *, 'CHAINS HAVE NOT CONVERGED YET!'
           print *,  nconv*thin_factor,' ITERATIONS MORE!'
           print *, '=================================='
+          !Replace the stuck walkers of the cold ensemble by copies of
+          !good walkers moved a small fraction of the ensemble spread
+          if ( stuck_c > 0.d0 ) then
+            call find_stuck(loglike_chains,stuck_c,is_stuck,nwalks,nconv)
+            if ( any(is_stuck) .and. .not. all(is_stuck) ) then
+              do nk = 0, nwalks - 1
+                call pack_walker(pars_old(nk,:),ldc_old(nk,:),rvs_old(nk,:),tds_old(nk,:), &
+                     jitter_rv_old(nk,:),jitter_tr_old(nk),x_old(nk,:),npl,n_tel,n_jrv)
+              end do
+              do o = 0, ndim - 1
+                x_sd(o) = sum(x_old(0:nwalks-1,o)) / nwalks
+                x_sd(o) = sqrt( sum( ( x_old(0:nwalks-1,o) - x_sd(o) )**2 ) / nwalks )
+              end do
+              do nk = 0, nwalks - 1
+                if ( .not. is_stuck(nk) ) cycle
+                m = nk
+                do while ( is_stuck(m) )
+                  call rng_uniform(rng(:,nw_tot),u_move,1)
+                  m = min( int( u_move(0) * nwalks ), nwalks - 1 )
+                end do
+                call gauss_random_bm(0.d0,1.d0,x_eps,ndim,rng(:,nw_tot))
+                !If the moved copy is outside the priors, use an exact copy
+                do ntry = 1, 0, -1
+                  x_old(nk,:) = x_old(m,:) + ntry * wtf_x(:) * 1.d-4 * x_sd(:) * x_eps(:)
+                  call unpack_walker(x_old(nk,:),pars_old(nk,:),ldc_old(nk,:),rvs_old(nk,:), &
+                       tds_old(nk,:),jitter_rv_old(nk,:),jitter_tr_old(nk),npl,n_tel,n_jrv)
+                  call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,             &
+                       total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol,fit_all,fit_ldc,lims,lims_ldc,     &
+                       afk,stellar_pars,pars_old(nk,:),rvs_old(nk,:),ldc_old(nk,:),        &
+                       tds_old(nk,:),jitter_rv_old(nk,:),jitter_tr_old(nk),                &
+                       1.d0,-huge(0.d0),                                                   &
+                       priors_old(nk,:),priors_ldc_old(nk,:),log_prior_old(nk),            &
+                       log_likelihood_old(nk),chi2_old_rv(nk),chi2_old_tr(nk),             &
+                       is_limit_good,npl,n_tel,n_jrv,size_rv,size_tr)
+                  if ( is_limit_good ) exit
+                end do
+                chi2_old_total(nk) = chi2_old_rv(nk) + chi2_old_tr(nk)
+                print *, 'STUCK WALKER ', nk, ' REPLACED BY WALKER ', m, &
+                         ' <ln L> = ', real(sum(loglike_chains(nk,:))/nconv)
+              end do
+              print *, count(is_stuck), ' STUCK WALKERS REPLACED'
+            end if
+          end if
+          !Tune the stretch scale for the next cycle, it stays
+          !fixed while the chains of a cycle are created
+          if ( is_adapt ) call adapt_stretch(a_factor,acc_str,prop_str,acc_band,ntemps)
+          !Save the state of the sampler, the nconv window is empty now
+          ncycle = j / ( thin_factor * nconv )
+          if ( nsave > 0 ) then
+            if ( mod(ncycle,nsave) == 0 ) &
+            call save_checkpoint(chk_file,j,pars_old,rvs_old,ldc_old,tds_old, &
+                 jitter_rv_old,jitter_tr_old,priors_old,priors_ldc_old,       &
+                 log_likelihood_old,chi2_old_total,chi2_old_rv,chi2_old_tr,   &
+                 log_prior_old,betas,a_factor,tau_old,seed_run,stream_pos-1,nw_tot,ntemps,npl,n_tel,n_jrv)
+          end if
         else
           print *, '=================================='
           print *, '      CHAINS HAVE CONVERGED'
@@ -395,6 +846,11 @@ implicit none
           !Let us start the otput file
           continua = .false.
         end if ! is_cvg
+        !The acceptance counters start again with the next cycle
+        n_acc(:) = 0
+        n_prop = 0
+        acc_str(:) = 0.d0
+        prop_str(:) = 0.d0
       end if !nconv
     end if !j/thin_factor
 
@@ -409,7 +865,37 @@ implicit none
   end do !infinite loop
   !the MCMC part has ended
 
-  !Let us create the output file
+  !Write the iterations that are still in the buffer
+  if ( is_stream ) then
+    if ( n > 0 ) &
+    call write_chain_block(601,nbytes,n,iter_chains,loglike_chains,chi2_rv_chains, &
+         chi2_tr_chains,pars_chains,ldc_chains,rvs_chains,tds_chains,             &
+         jitter_rv_chains,jitter_tr_chains,nwalks,nconv,npl,n_tel,n_jrv)
+    close(601)
+  end if
+
+  !The last nconv window is the posterior used by print_values.py
+  open(unit=701,file=trim(all_file),status='replace',access='stream',form='unformatted')
+  call write_chain_header(701,nbytes,flags,npl,n_tel,n_jrv)
+  call write_chain_block(701,nbytes,nconv,iter_chains,loglike_chains,chi2_rv_chains, &
+       chi2_tr_chains,pars_chains,ldc_chains,rvs_chains,tds_chains,               &
+       jitter_rv_chains,jitter_tr_chains,nwalks,nconv,npl,n_tel,n_jrv)
+  close(701)
+
+  !Mean ln likelihood of each temperature in the last nconv window,
+  !print_values.py integrates it over beta to get the evidence
+  if ( ntemps > 1 ) then
+    open(unit=801,file=trim(ti_file),status='replace')
+    write(801,*) '#beta  <ln likelihood>  swap acceptance'
+    do it = 0, ntemps - 1
+      write(801,*) betas(it), sum(ti_chains(it,:)) / nconv, sum(swap_chains(it,:)) / nconv
+    end do
+    close(801)
+  end if
+
+  !Legacy text output
+  if ( is_text ) then
+
   open(unit=101,file='all_data.dat',status='unknown')
   open(unit=201,file='jitter_data.dat',status='unknown')
   open(unit=301,file='trends_data.dat',status='unknown')
@@ -430,4 +916,849 @@ implicit none
   close(201)
   close(301)
 
+  end if !is_text
+
+  deallocate( pars_old, pars_new, priors_old, priors_new, priors_ldc_old,       &
+              priors_ldc_new, rvs_old, rvs_new, ldc_old, ldc_new, tds_old,       &
+              tds_new, jitter_rv_old, jitter_rv_new, r_rand, z_rand, mstar,      &
+              rstar, chi2_old_total, chi2_new_total, chi2_red, chi2_old_rv,      &
+              chi2_old_tr, chi2_new_rv, chi2_new_tr, jitter_tr_old,              &
+              jitter_tr_new, log_prior_old, log_prior_new, log_likelihood_old,   &
+              log_likelihood_new, r_int, prop_factor, x_old, wtf_x, betas,       &
+              swap_rate, ti_chains, swap_chains, a_factor, acc_str, prop_str,    &
+              n_acc, is_acc, rng, is_stuck, x_sd, x_eps )
+  deallocate( pars_chains, chi2_rv_chains, chi2_tr_chains, loglike_chains,      &
+              jitter_tr_chains, jitter_rv_chains, tds_chains, ldc_chains,        &
+              rvs_chains, iter_chains, x_chain )
+
+end subroutine
+
+!-----------------------------------------------------------
+! pack_walker and unpack_walker convert the parameters of a
+! walker to a single vector and back. The vector contains the
+! planet parameters, ldc, rvs, trends and jitter terms, in the
+! same order than the columns of the chain files.
+!-----------------------------------------------------------
+subroutine pack_walker(pars,ldc,rvs,tds,jitter_rv,jitter_tr,x,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: npl, n_tel, n_jrv
+  double precision, intent(in) :: pars(0:8*npl-1), ldc(0:1), rvs(0:n_tel-1)
+  double precision, intent(in) :: tds(0:1), jitter_rv(0:n_jrv-1), jitter_tr
+  double precision, intent(out) :: x(0:8*npl+n_tel+n_jrv+4)
+!Local variables
+  integer :: o
+
+  x(0:8*npl-1) = pars(:)
+  o = 8*npl
+  x(o:o+1) = ldc(:)
+  o = o + 2
+  x(o:o+n_tel-1) = rvs(:)
+  o = o + n_tel
+  x(o:o+1) = tds(:)
+  o = o + 2
+  x(o:o+n_jrv-1) = jitter_rv(:)
+  x(o+n_jrv) = jitter_tr
+
+end subroutine
+
+subroutine unpack_walker(x,pars,ldc,rvs,tds,jitter_rv,jitter_tr,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: npl, n_tel, n_jrv
+  double precision, intent(in) :: x(0:8*npl+n_tel+n_jrv+4)
+  double precision, intent(out) :: pars(0:8*npl-1), ldc(0:1), rvs(0:n_tel-1)
+  double precision, intent(out) :: tds(0:1), jitter_rv(0:n_jrv-1), jitter_tr
+!Local variables
+  integer :: o
+
+  pars(:) = x(0:8*npl-1)
+  o = 8*npl
+  ldc(:) = x(o:o+1)
+  o = o + 2
+  rvs(:) = x(o:o+n_tel-1)
+  o = o + n_tel
+  tds(:) = x(o:o+1)
+  o = o + 2
+  jitter_rv(:) = x(o:o+n_jrv-1)
+  jitter_tr = x(o+n_jrv)
+
+end subroutine
+
+!-----------------------------------------------------------
+! get_chain_column extracts the chains of the parameter d of
+! the vector of pack_walker from the nconv window
+!-----------------------------------------------------------
+subroutine get_chain_column(d,pars_chains,ldc_chains,rvs_chains,tds_chains, &
+           jitter_rv_chains,jitter_tr_chains,x_chain,nwalks,nconv,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: d, nwalks, nconv, npl, n_tel, n_jrv
+  double precision, intent(in) :: pars_chains(0:nwalks-1,0:8*npl-1,0:nconv-1)
+  double precision, intent(in) :: ldc_chains(0:nwalks-1,0:1,0:nconv-1)
+  double precision, intent(in) :: rvs_chains(0:nwalks-1,0:n_tel-1,0:nconv-1)
+  double precision, intent(in) :: tds_chains(0:nwalks-1,0:1,0:nconv-1)
+  double precision, intent(in) :: jitter_rv_chains(0:nwalks-1,0:n_jrv-1,0:nconv-1)
+  double precision, intent(in) :: jitter_tr_chains(0:nwalks-1,0:nconv-1)
+  double precision, intent(out) :: x_chain(0:nwalks-1,0:nconv-1)
+!Local variables
+  integer :: o
+
+  o = d
+  if ( o < 8*npl ) then
+    x_chain(:,:) = pars_chains(:,o,:)
+    return
+  end if
+  o = o - 8*npl
+  if ( o < 2 ) then
+    x_chain(:,:) = ldc_chains(:,o,:)
+    return
+  end if
+  o = o - 2
+  if ( o < n_tel ) then
+    x_chain(:,:) = rvs_chains(:,o,:)
+    return
+  end if
+  o = o - n_tel
+  if ( o < 2 ) then
+    x_chain(:,:) = tds_chains(:,o,:)
+    return
+  end if
+  o = o - 2
+  if ( o < n_jrv ) then
+    x_chain(:,:) = jitter_rv_chains(:,o,:)
+  else
+    x_chain(:,:) = jitter_tr_chains(:,:)
+  end if
+
+end subroutine
+
+!-----------------------------------------------------------
+! propose_move creates a new position for the walker x using
+! the walkers of the complementary ensemble, x_comp. Only the
+! fitted parameters (wtf == 1) move. imove selects the move
+!  1 -> differential evolution, ter Braak (2006)
+!  2 -> walk move, Goodman & Weare (2010)
+!  3 -> snooker move, ter Braak & Vrugt (2008)
+! factor is the ratio of the proposal densities that enters
+! in the acceptance probability, it is 1 for symmetric moves.
+!-----------------------------------------------------------
+subroutine propose_move(imove,x,x_comp,wtf,spar,x_new,factor,rng,ndim,ncomp)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: imove, ndim, ncomp, spar
+  double precision, intent(in) :: x(0:ndim-1), x_comp(0:ncomp-1,0:ndim-1)
+  integer, intent(in) :: wtf(0:ndim-1)
+  double precision, intent(out) :: x_new(0:ndim-1), factor
+  integer(kind=8), intent(inout) :: rng(0:5)
+!Local variables
+  double precision, dimension(0:ndim-1) :: x_mean, e_dir
+  double precision, dimension(0:ncomp-1) :: z_walk
+  double precision :: r_real(0:2), gamma, gnoise(0:0), norm_old, norm_new
+  integer :: ia, ib, iz, i
+
+  factor = 1.d0
+
+  select case ( imove )
+
+  case (1) !differential evolution
+    !Two different walkers of the complementary ensemble
+    call rng_uniform(rng,r_real,3)
+    ia = min( int( r_real(0) * ncomp ), ncomp - 1 )
+    ib = min( int( r_real(1) * (ncomp - 1) ), ncomp - 2 )
+    if ( ib >= ia ) ib = ib + 1
+    !Optimal scale, 10% of the time gamma = 1 helps to jump between modes
+    gamma = 2.38d0 / sqrt( 2.d0 * spar )
+    if ( r_real(2) < 0.1d0 ) gamma = 1.d0
+    call gauss_random_bm(1.d0,1.d-5,gnoise,1,rng)
+    x_new(:) = x(:) + wtf(:) * gamma * gnoise(0) * ( x_comp(ia,:) - x_comp(ib,:) )
+
+  case (2) !walk move
+    !Gaussian step with the covariance of the complementary ensemble
+    call gauss_random_bm(0.d0,1.d0,z_walk,ncomp,rng)
+    do i = 0, ndim - 1
+      x_mean(i) = sum(x_comp(:,i)) / ncomp
+    end do
+    x_new(:) = x(:)
+    do i = 0, ncomp - 1
+      x_new(:) = x_new(:) + wtf(:) * z_walk(i) * ( x_comp(i,:) - x_mean(:) )
+    end do
+    !Optimal scale of a Gaussian random walk, Gelman et al. (1996)
+    gamma = 2.38d0 / sqrt( dble(spar) )
+    x_new(:) = x(:) + gamma * ( x_new(:) - x(:) ) / sqrt( dble(ncomp - 1) )
+
+  case (3) !snooker move
+    !Three different walkers of the complementary ensemble
+    call rng_uniform(rng,r_real,3)
+    iz = min( int( r_real(0) * ncomp ), ncomp - 1 )
+    ia = min( int( r_real(1) * (ncomp - 1) ), ncomp - 2 )
+    if ( ia >= iz ) ia = ia + 1
+    ib = min( int( r_real(2) * (ncomp - 2) ), ncomp - 3 )
+    if ( ib >= min(ia,iz) ) ib = ib + 1
+    if ( ib >= max(ia,iz) ) ib = ib + 1
+    e_dir(:) = wtf(:) * ( x(:) - x_comp(iz,:) )
+    norm_old = sqrt( dot_product(e_dir,e_dir) )
+    if ( norm_old > 0.d0 ) then
+      e_dir(:) = e_dir(:) / norm_old
+      gamma = 1.7d0
+      x_new(:) = x(:) + gamma * dot_product( x_comp(ia,:) - x_comp(ib,:), e_dir ) * e_dir(:)
+      e_dir(:) = wtf(:) * ( x_new(:) - x_comp(iz,:) )
+      norm_new = sqrt( dot_product(e_dir,e_dir) )
+      factor = ( norm_new / norm_old )**(spar - 1)
+    else
+      x_new(:) = x(:)
+    end if
+
+  case default
+    x_new(:) = x(:)
+
+  end select
+
+end subroutine
+
+!-----------------------------------------------------------
+! swap_temperatures proposes to exchange the walker nk of each
+! temperature with the walker nk of the next colder one,
+! Earl & Deem (2005). loglike contains the ln prior, log_prior,
+! that is subtracted to get the ln likelihood. swap_rate(it)
+! is the fraction of accepted swaps between it and it+1.
+!-----------------------------------------------------------
+subroutine swap_temperatures(betas,swap_rate,pars,rvs,ldc,tds,jitter_rv,jitter_tr, &
+           priors,priors_ldc,loglike,log_prior,chi2_total,chi2_rv,chi2_tr,       &
+           rng,nwalks,ntemps,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nwalks, ntemps, npl, n_tel, n_jrv
+  double precision, intent(in), dimension(0:ntemps-1) :: betas
+  double precision, intent(out), dimension(0:ntemps-1) :: swap_rate
+  double precision, intent(inout), dimension(0:nwalks*ntemps-1,0:8*npl-1) :: pars, priors
+  double precision, intent(inout), dimension(0:nwalks*ntemps-1,0:n_tel-1) :: rvs
+  double precision, intent(inout), dimension(0:nwalks*ntemps-1,0:1) :: ldc, tds, priors_ldc
+  double precision, intent(inout), dimension(0:nwalks*ntemps-1,0:n_jrv-1) :: jitter_rv
+  double precision, intent(inout), dimension(0:nwalks*ntemps-1) :: jitter_tr, loglike, log_prior
+  double precision, intent(inout), dimension(0:nwalks*ntemps-1) :: chi2_total, chi2_rv, chi2_tr
+  integer(kind=8), intent(inout) :: rng(0:5)
+!Local variables
+  double precision, dimension(0:nwalks-1) :: r_swap
+  double precision :: qq
+  integer :: it, nk, nh, nc, nacc
+!External calls
+  external :: swap_rows, swap_values
+
+  swap_rate(:) = 0.d0
+
+  do it = ntemps - 1, 1, -1
+    call rng_uniform(rng,r_swap,nwalks)
+    nacc = 0
+    do nk = 0, nwalks - 1
+      nh = it * nwalks + nk
+      nc = ( it - 1 ) * nwalks + nk
+      qq = ( betas(it-1) - betas(it) ) * &
+           ( ( loglike(nh) - log_prior(nh) ) - ( loglike(nc) - log_prior(nc) ) )
+      if ( qq > log(r_swap(nk)) ) then
+        call swap_rows(pars,nh,nc,nwalks*ntemps,8*npl)
+        call swap_rows(priors,nh,nc,nwalks*ntemps,8*npl)
+        call swap_rows(rvs,nh,nc,nwalks*ntemps,n_tel)
+        call swap_rows(ldc,nh,nc,nwalks*ntemps,2)
+        call swap_rows(tds,nh,nc,nwalks*ntemps,2)
+        call swap_rows(priors_ldc,nh,nc,nwalks*ntemps,2)
+        call swap_rows(jitter_rv,nh,nc,nwalks*ntemps,n_jrv)
+        call swap_values(jitter_tr,nh,nc,nwalks*ntemps)
+        call swap_values(loglike,nh,nc,nwalks*ntemps)
+        call swap_values(log_prior,nh,nc,nwalks*ntemps)
+        call swap_values(chi2_total,nh,nc,nwalks*ntemps)
+        call swap_values(chi2_rv,nh,nc,nwalks*ntemps)
+        call swap_values(chi2_tr,nh,nc,nwalks*ntemps)
+        nacc = nacc + 1
+      end if
+    end do
+    swap_rate(it-1) = dble(nacc) / nwalks
+  end do
+
+end subroutine
+
+subroutine swap_rows(array,n1,n2,nrows,ncols)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: n1, n2, nrows, ncols
+  double precision, intent(inout), dimension(0:nrows-1,0:ncols-1) :: array
+!Local variables
+  double precision, dimension(0:ncols-1) :: dummy
+
+  dummy(:) = array(n1,:)
+  array(n1,:) = array(n2,:)
+  array(n2,:) = dummy(:)
+
+end subroutine
+
+subroutine swap_values(array,n1,n2,nrows)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: n1, n2, nrows
+  double precision, intent(inout), dimension(0:nrows-1) :: array
+!Local variables
+  double precision :: dummy
+
+  dummy = array(n1)
+  array(n1) = array(n2)
+  array(n2) = dummy
+
+end subroutine
+
+!-----------------------------------------------------------
+! adapt_temperatures changes the spacing of the ladder to
+! get the same swap acceptance between all the temperatures,
+! Vousden et al. (2016). The first and last temperatures are
+! fixed, the rate of change decays with the iteration j.
+! It is only called during the first nconv window (burn-in).
+!-----------------------------------------------------------
+subroutine adapt_temperatures(betas,swap_rate,j,ntemps)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: j, ntemps
+  double precision, intent(inout), dimension(0:ntemps-1) :: betas
+  double precision, intent(in), dimension(0:ntemps-1) :: swap_rate
+!Local variables
+  double precision, dimension(0:ntemps-1) :: temps
+  double precision :: kappa, dt
+  !Values suggested by Vousden et al. (2016)
+  double precision :: t_lag = 1.d4, t_adapt = 1.d2
+  integer :: it
+
+  if ( ntemps < 3 ) return
+
+  kappa = t_lag / ( dble(j) + t_lag ) / t_adapt
+
+  temps(0) = 1.d0 / betas(0)
+  do it = 0, ntemps - 3
+    dt = ( 1.d0 / betas(it+1) - 1.d0 / betas(it) ) * &
+         exp( kappa * ( swap_rate(it) - swap_rate(it+1) ) )
+    temps(it+1) = temps(it) + dt
+  end do
+
+  !The ladder has to stay below the hottest temperature
+  if ( temps(ntemps-2) < 1.d0 / betas(ntemps-1) ) &
+  betas(1:ntemps-2) = 1.d0 / temps(1:ntemps-2)
+
+end subroutine
+
+!-----------------------------------------------------------
+! find_stuck flags the walkers whose mean ln likelihood in the
+! nconv window is below Q1 - stuck_c * (Q3 - Q1) of the means
+! of the ensemble, the interquartile rule of Hou et al. (2012)
+!-----------------------------------------------------------
+subroutine find_stuck(loglike_chains,stuck_c,is_stuck,nwalks,nconv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nwalks, nconv
+  double precision, intent(in) :: loglike_chains(0:nwalks-1,0:nconv-1)
+  double precision, intent(in) :: stuck_c
+  logical, intent(out) :: is_stuck(0:nwalks-1)
+!Local variables
+  double precision, dimension(0:nwalks-1) :: l_mean, l_sort
+  double precision :: l_tmp, q1, q3
+  integer :: i, k
+
+  do i = 0, nwalks - 1
+    l_mean(i) = sum(loglike_chains(i,:)) / nconv
+  end do
+
+  !Insertion sort, nwalks is small
+  l_sort(:) = l_mean(:)
+  do i = 1, nwalks - 1
+    l_tmp = l_sort(i)
+    k = i - 1
+    do while ( k >= 0 )
+      if ( l_sort(k) <= l_tmp ) exit
+      l_sort(k+1) = l_sort(k)
+      k = k - 1
+    end do
+    l_sort(k+1) = l_tmp
+  end do
+
+  q1 = l_sort(nwalks/4)
+  q3 = l_sort((3*nwalks)/4)
+
+  is_stuck(:) = l_mean(:) < q1 - stuck_c * ( q3 - q1 )
+
+end subroutine
+
+!-----------------------------------------------------------
+! find_map maximizes the ln posterior from x with the
+! Nelder-Mead simplex, with the adaptive coefficients of
+! Gao & Han (2012), over the parameters with wtf_x = 1.
+! The simplex restarts from the best vertex until ln posterior
+! stops improving. x_step has the size of the initial simplex,
+! on exit it has the width of the posterior of each parameter
+! from the curvature of the ln posterior at the MAP
+!-----------------------------------------------------------
+subroutine find_map(x,logpost,x_step,wtf_x, &
+           x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars, &
+           ndim,npl,n_tel,n_jrv,size_rv,size_tr)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: ndim, size_rv, size_tr, npl, n_tel, n_jrv
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  double precision, intent(inout), dimension(0:ndim-1) :: x, x_step
+  double precision, intent(out) :: logpost
+  integer, intent(in), dimension(0:ndim-1) :: wtf_x
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  character, intent(in) :: fit_all(0:8*npl-1), fit_ldc(0:1)
+  double precision, intent(in) :: lims(0:2*8*npl-1), lims_ldc(0:3)
+  logical, intent(in) :: afk(0:npl-1), flags(0:7), tff(0:1)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  double precision, intent(in) :: stellar_pars(0:3)
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
+!Local variables
+  double precision, dimension(0:ndim-1,0:ndim) :: v
+  double precision, dimension(0:ndim) :: f
+  double precision, dimension(0:ndim-1) :: xc, xr, xe, xk
+  double precision :: fr, fe, fk, f_old, f0, fp, fm, h, c, alpha, beta, gamma, delta
+  double precision, parameter :: ftol = 1.d-8
+  integer :: idx(0:ndim-1), nf, i, d, lo, hi, nh, neval, npass, k
+  external :: map_objective
+
+  nf = 0
+  do d = 0, ndim - 1
+    if ( wtf_x(d) == 1 ) then
+      idx(nf) = d
+      nf = nf + 1
+    end if
+  end do
+  if ( nf == 0 ) return
+
+  alpha = 1.d0
+  beta  = 1.d0 + 2.d0 / nf
+  gamma = 0.75d0 - 0.5d0 / nf
+  delta = 1.d0 - 1.d0 / nf
+
+  call map_objective(x,f0,x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+       fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+  f_old = f0
+
+  do npass = 1, 10
+
+    !Initial simplex around x
+    v(:,0) = x(:)
+    f(0) = f0
+    do i = 1, nf
+      v(:,i) = x(:)
+      v(idx(i-1),i) = x(idx(i-1)) + x_step(idx(i-1))
+      call map_objective(v(:,i),f(i),x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+    end do
+    neval = nf
+
+    do while ( neval < 200 * nf )
+
+      lo = minloc(f(0:nf),1) - 1
+      hi = maxloc(f(0:nf),1) - 1
+      nh = lo
+      do i = 0, nf
+        if ( i /= hi .and. f(i) >= f(nh) ) nh = i
+      end do
+      if ( f(hi) - f(lo) <= ftol * ( abs(f(lo)) + 1.d0 ) ) exit
+
+      xc(:) = ( sum(v(:,0:nf),2) - v(:,hi) ) / nf
+
+      !Reflection
+      xr(:) = xc(:) + alpha * ( xc(:) - v(:,hi) )
+      call map_objective(xr,fr,x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+      neval = neval + 1
+
+      if ( fr < f(lo) ) then
+        !Expansion
+        xe(:) = xc(:) + beta * ( xr(:) - xc(:) )
+        call map_objective(xe,fe,x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+             fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+        neval = neval + 1
+        if ( fe < fr ) then
+          v(:,hi) = xe(:)
+          f(hi) = fe
+        else
+          v(:,hi) = xr(:)
+          f(hi) = fr
+        end if
+      else if ( fr < f(nh) ) then
+        v(:,hi) = xr(:)
+        f(hi) = fr
+      else
+        !Outside or inside contraction
+        if ( fr < f(hi) ) then
+          xk(:) = xc(:) + gamma * ( xr(:) - xc(:) )
+        else
+          xk(:) = xc(:) + gamma * ( v(:,hi) - xc(:) )
+        end if
+        call map_objective(xk,fk,x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+             fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+        neval = neval + 1
+        if ( fk < min(fr,f(hi)) ) then
+          v(:,hi) = xk(:)
+          f(hi) = fk
+        else
+          !Shrink towards the best vertex
+          do i = 0, nf
+            if ( i == lo ) cycle
+            v(:,i) = v(:,lo) + delta * ( v(:,i) - v(:,lo) )
+            call map_objective(v(:,i),f(i),x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+                 fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+          end do
+          neval = neval + nf
+        end if
+      end if
+
+    end do
+
+    lo = minloc(f(0:nf),1) - 1
+    x(:) = v(:,lo)
+    f0 = f(lo)
+    !The next simplex has the size of the last one
+    do k = 0, nf - 1
+      d = idx(k)
+      x_step(d) = max( maxval( abs( v(d,0:nf) - x(d) ) ), 1.d-12 * max( abs(x(d)), 1.d0 ) )
+    end do
+    if ( npass > 1 .and. f_old - f0 <= ftol * ( abs(f0) + 1.d0 ) ) exit
+    f_old = f0
+
+  end do
+
+  logpost = - f0
+
+  !Width of the posterior from the second derivative, the step is
+  !corrected once with the first estimate of the width
+  do k = 0, nf - 1
+    d = idx(k)
+    h = x_step(d)
+    do i = 1, 2
+      xk(:) = x(:)
+      xk(d) = x(d) + h
+      call map_objective(xk,fp,x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+      xk(d) = x(d) - h
+      call map_objective(xk,fm,x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+      !A side outside the priors, keep the last step
+      if ( fp >= huge(0.d0) .or. fm >= huge(0.d0) ) exit
+      c = ( fp + fm - 2.d0 * f0 ) / h**2
+      if ( c <= 0.d0 ) exit
+      h = 1.d0 / sqrt(c)
+    end do
+    x_step(d) = h
+  end do
+
+end subroutine
+
+!-----------------------------------------------------------
+! map_objective is - ln posterior of the vector x of
+! pack_walker, huge(0.d0) outside the priors
+!-----------------------------------------------------------
+subroutine map_objective(x,f, &
+           x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: size_rv, size_tr, npl, n_tel, n_jrv
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  double precision, intent(in), dimension(0:8*npl+n_tel+n_jrv+4) :: x
+  double precision, intent(out) :: f
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  character, intent(in) :: fit_all(0:8*npl-1), fit_ldc(0:1)
+  double precision, intent(in) :: lims(0:2*8*npl-1), lims_ldc(0:3)
+  logical, intent(in) :: afk(0:npl-1), flags(0:7), tff(0:1)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  double precision, intent(in) :: stellar_pars(0:3)
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
+!Local variables
+  double precision :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1), trends(0:1)
+  double precision :: jrv(0:n_jrv-1), jtr, priors(0:8*npl-1), priors_ldc(0:1)
+  double precision :: log_prior, logpost, chi2_rv, chi2_tr
+  logical :: is_good
+
+  call unpack_walker(x,pars,ldc,rvs,trends,jrv,jtr,npl,n_tel,n_jrv)
+  chi2_rv = huge(0.d0)
+  chi2_tr = huge(0.d0)
+  call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+       fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,pars,rvs,ldc,trends,jrv,jtr,  &
+       1.d0,-huge(0.d0),priors,priors_ldc,log_prior,logpost,chi2_rv,chi2_tr,is_good,npl,n_tel,n_jrv,size_rv,size_tr)
+  f = huge(0.d0)
+  if ( is_good ) f = - logpost
+
+end subroutine
+
+!-----------------------------------------------------------
+! adapt_stretch changes the scale a of the stretch move of
+! each temperature to get an acceptance rate inside acc_band.
+! A smaller a gives shorter steps and a higher acceptance.
+!-----------------------------------------------------------
+subroutine adapt_stretch(a_factor,acc_str,prop_str,acc_band,ntemps)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: ntemps
+  double precision, intent(inout), dimension(0:ntemps-1) :: a_factor
+  double precision, intent(in), dimension(0:ntemps-1) :: acc_str, prop_str
+  double precision, intent(in), dimension(0:1) :: acc_band
+!Local variables
+  double precision :: rate
+  double precision :: a_step = 1.5d0, a_min = 1.05d0, a_max = 10.d0
+  integer :: it
+
+  do it = 0, ntemps - 1
+    if ( prop_str(it) > 0.d0 ) then
+      rate = acc_str(it) / prop_str(it)
+      if ( rate < acc_band(0) ) a_factor(it) = 1.d0 + ( a_factor(it) - 1.d0 ) / a_step
+      if ( rate > acc_band(1) ) a_factor(it) = 1.d0 + ( a_factor(it) - 1.d0 ) * a_step
+      a_factor(it) = min( max( a_factor(it), a_min ), a_max )
+    end if
+  end do
+
+  print *, 'STRETCH SCALE a = ', real(a_factor(0))
+
+end subroutine
+
+!-----------------------------------------------------------
+! Binary chain files
+! The chains are saved in a self-describing binary file:
+!  8 characters   -> 'PTICHAIN'
+!  3 int32        -> format version, bytes per value (8 or 4)
+!                    and number of columns, ncols
+!  ncols*24 chars -> name of each column
+! followed by rows of ncols real values of the given size.
+! Each row has the iteration, the walker, ln likelihood,
+! chi2_rv, chi2_tr, the planet parameters, ldc, rvs, trends
+! and jitter terms. The number of rows follows from the file
+! size, so a file that is being written can be read at any
+! moment. Python opens them with read_chains (todo-py.py).
+!-----------------------------------------------------------
+subroutine write_chain_header(unit,nbytes,flags,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: unit, nbytes, npl, n_tel, n_jrv
+  logical, intent(in) :: flags(0:7)
+!Local variables
+  integer :: ncols, m, o, j
+  integer :: chain_version = 1
+  character(len=24), dimension(0:10+8*npl+n_tel+n_jrv-1) :: names
+  character(len=10), dimension(0:7) :: pnames
+  character(len=4) :: num
+
+  ncols = 10 + 8*npl + n_tel + n_jrv
+
+  pnames = (/ 'T0        ', 'P         ', 'e         ', 'w         ', &
+              'i         ', 'a         ', 'rp        ', 'K         ' /)
+  if ( flags(0) ) pnames(1) = 'log10P'
+  if ( flags(1) ) pnames(2) = 'sqrte_sinw'
+  if ( flags(1) ) pnames(3) = 'sqrte_cosw'
+  if ( flags(2) ) pnames(4) = 'b'
+  if ( flags(3) ) pnames(5) = 'rho^1/3'
+  if ( flags(4) ) pnames(7) = 'log10K'
+
+  names(0:4) = (/ 'iter    ', 'walker  ', 'loglike ', 'chi2_rv ', 'chi2_tr ' /)
+  o = 5
+  !The planet labels are b, c, d, ...
+  do m = 0, npl - 1
+    names(o:o+7) = pnames(:)
+    do j = o, o + 7
+      names(j) = trim(names(j))//'_'//achar(iachar('b')+m)
+    end do
+    o = o + 8
+  end do
+  names(o:o+1) = (/ 'q1', 'q2' /)
+  o = o + 2
+  do m = 0, n_tel - 1
+    write(num,'(I4)') m
+    names(o) = 'rv0_'//adjustl(num)
+    o = o + 1
+  end do
+  names(o:o+1) = (/ 'alpha', 'beta ' /)
+  o = o + 2
+  do m = 0, n_jrv - 1
+    write(num,'(I4)') m
+    names(o) = 'jrv_'//adjustl(num)
+    o = o + 1
+  end do
+  names(o) = 'jtr'
+
+  write(unit) 'PTICHAIN'
+  write(unit) chain_version, nbytes, ncols
+  write(unit) names
+
+end subroutine
+
+!-----------------------------------------------------------
+! write_chain_block writes the first nrows thinned steps of
+! the nconv window as rows of a binary chain file. Each
+! thinned step is written with a single write statement.
+!-----------------------------------------------------------
+subroutine write_chain_block(unit,nbytes,nrows,iters,loglike,chi2_rv,chi2_tr, &
+           pars,ldc,rvs,tds,jitter_rv,jitter_tr,nwalks,nconv,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: unit, nbytes, nrows, nwalks, nconv, npl, n_tel, n_jrv
+  integer, intent(in), dimension(0:nconv-1) :: iters
+  double precision, intent(in), dimension(0:nwalks-1,0:nconv-1) :: loglike, chi2_rv, chi2_tr
+  double precision, intent(in), dimension(0:nwalks-1,0:8*npl-1,0:nconv-1) :: pars
+  double precision, intent(in), dimension(0:nwalks-1,0:1,0:nconv-1) :: ldc, tds
+  double precision, intent(in), dimension(0:nwalks-1,0:n_tel-1,0:nconv-1) :: rvs
+  double precision, intent(in), dimension(0:nwalks-1,0:n_jrv-1,0:nconv-1) :: jitter_rv
+  double precision, intent(in), dimension(0:nwalks-1,0:nconv-1) :: jitter_tr
+!Local variables
+  double precision, allocatable, dimension(:,:) :: block
+  integer :: n, nk, o
+
+  allocate(block(0:10+8*npl+n_tel+n_jrv-1,0:nwalks-1))
+
+  do n = 0, nrows - 1
+    do nk = 0, nwalks - 1
+      block(0:4,nk) = (/ dble(iters(n)), dble(nk), loglike(nk,n), chi2_rv(nk,n), chi2_tr(nk,n) /)
+      o = 5
+      block(o:o+8*npl-1,nk) = pars(nk,:,n)
+      o = o + 8*npl
+      block(o:o+1,nk) = ldc(nk,:,n)
+      o = o + 2
+      block(o:o+n_tel-1,nk) = rvs(nk,:,n)
+      o = o + n_tel
+      block(o:o+1,nk) = tds(nk,:,n)
+      o = o + 2
+      block(o:o+n_jrv-1,nk) = jitter_rv(nk,:,n)
+      o = o + n_jrv
+      block(o,nk) = jitter_tr(nk,n)
+    end do
+    if ( nbytes == 4 ) then
+      write(unit) real(block,4)
+    else
+      write(unit) block
+    end if
+  end do
+
+  flush(unit)
+
+  deallocate(block)
+
+end subroutine
+
+!-----------------------------------------------------------
+! save_checkpoint writes the state of all the walkers (of all
+! the temperatures), the ladder of temperatures, the stretch
+! scales, the last tau of the convergence test, the iteration
+! counter, the seed of the random streams and the size of the
+! stream chain file (chain_size, in bytes) to a binary file. The counters of the streams only depend on
+! the iteration, so the resumed run draws the same numbers.
+! The state is written to a temporary file that replaces the
+! old checkpoint once it is complete, so a run killed while
+! saving keeps the previous checkpoint.
+!-----------------------------------------------------------
+subroutine save_checkpoint(chk_file,j,pars,rvs,ldc,tds,jitter_rv,jitter_tr, &
+           priors,priors_ldc,loglike,chi2_total,chi2_rv,chi2_tr,        &
+           log_prior,betas,a_factor,tau_old,seed,chain_size,nwalks,ntemps,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  character(len=*), intent(in) :: chk_file
+  integer, intent(in) :: j, seed, nwalks, ntemps, npl, n_tel, n_jrv
+  integer(kind=8), intent(in) :: chain_size
+  double precision, intent(in), dimension(0:nwalks-1) :: log_prior
+  double precision, intent(in), dimension(0:ntemps-1) :: betas, a_factor
+  double precision, intent(in) :: tau_old
+  double precision, intent(in), dimension(0:nwalks-1,0:8*npl-1) :: pars, priors
+  double precision, intent(in), dimension(0:nwalks-1,0:n_tel-1) :: rvs
+  double precision, intent(in), dimension(0:nwalks-1,0:1) :: ldc, tds, priors_ldc
+  double precision, intent(in), dimension(0:nwalks-1,0:n_jrv-1) :: jitter_rv
+  double precision, intent(in), dimension(0:nwalks-1) :: jitter_tr, loglike
+  double precision, intent(in), dimension(0:nwalks-1) :: chi2_total, chi2_rv, chi2_tr
+!Local variables
+  integer :: chk_version = 6
+
+  open(unit=501,file=trim(chk_file)//'.tmp',status='replace',access='stream',form='unformatted')
+  write(501) chk_version, nwalks, npl, n_tel, n_jrv
+  write(501) chain_size
+  write(501) ntemps
+  write(501) j
+  write(501) seed
+  write(501) pars, rvs, ldc, tds, jitter_rv, jitter_tr
+  write(501) priors, priors_ldc
+  write(501) loglike, chi2_total, chi2_rv, chi2_tr
+  write(501) log_prior, betas, a_factor, tau_old
+  close(501)
+
+  call rename(trim(chk_file)//'.tmp',trim(chk_file))
+
+  print *, 'CHECKPOINT SAVED AT ITERATION ', j
+
+end subroutine
+
+!-----------------------------------------------------------
+! load_checkpoint reads a file created by save_checkpoint and
+! restores the walkers and the seed of the random streams
+!-----------------------------------------------------------
+subroutine load_checkpoint(chk_file,j,pars,rvs,ldc,tds,jitter_rv,jitter_tr, &
+           priors,priors_ldc,loglike,chi2_total,chi2_rv,chi2_tr,        &
+           log_prior,betas,a_factor,tau_old,seed,nwalks,ntemps,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  character(len=*), intent(in) :: chk_file
+  integer, intent(in) :: nwalks, ntemps, npl, n_tel, n_jrv
+  integer, intent(out) :: seed
+  double precision, intent(out), dimension(0:nwalks-1) :: log_prior
+  double precision, intent(out), dimension(0:ntemps-1) :: betas, a_factor
+  double precision, intent(out) :: tau_old
+  integer, intent(out) :: j
+  double precision, intent(out), dimension(0:nwalks-1,0:8*npl-1) :: pars, priors
+  double precision, intent(out), dimension(0:nwalks-1,0:n_tel-1) :: rvs
+  double precision, intent(out), dimension(0:nwalks-1,0:1) :: ldc, tds, priors_ldc
+  double precision, intent(out), dimension(0:nwalks-1,0:n_jrv-1) :: jitter_rv
+  double precision, intent(out), dimension(0:nwalks-1) :: jitter_tr, loglike
+  double precision, intent(out), dimension(0:nwalks-1) :: chi2_total, chi2_rv, chi2_tr
+!Local variables
+  integer :: chk_version, chk_dims(0:4), ios
+  integer(kind=8) :: chain_size
+
+  open(unit=501,file=trim(chk_file),status='old',access='stream',form='unformatted',iostat=ios)
+  if ( ios /= 0 ) then
+    print *, 'I cannot open the checkpoint file ', trim(chk_file)
+    stop
+  end if
+  read(501) chk_version, chk_dims(0:3)
+  !The size of the stream file is only needed by todo-py.py
+  read(501) chain_size
+  read(501) chk_dims(4)
+  if ( chk_version /= 6 .or. chk_dims(0) /= nwalks .or. chk_dims(1) /= npl &
+       .or. chk_dims(2) /= n_tel .or. chk_dims(3) /= n_jrv                 &
+       .or. chk_dims(4) /= ntemps ) then
+    print *, 'The checkpoint file ', trim(chk_file)
+    print *, 'does not match the current configuration!'
+    stop
+  end if
+  read(501) j
+  read(501) seed
+  read(501) pars, rvs, ldc, tds, jitter_rv, jitter_tr
+  read(501) priors, priors_ldc
+  read(501) loglike, chi2_total, chi2_rv, chi2_tr
+  read(501) log_prior, betas, a_factor, tau_old
+  close(501)
+
 end subroutine
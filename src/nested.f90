@@ -0,0 +1,456 @@
+!-----------------------------------------------------------
+!                         nested.f90
+! Nested sampling, Skilling (2004), Bayesian Analysis 1, 833.
+! It computes the Bayesian evidence and samples the posterior
+! with the priors of get_priors and the likelihood of
+! get_loglike. The live points with the lowest likelihood are
+! replaced nbatch at a time, the new points are found with
+! constrained random walks that run in parallel with OpenMP.
+!------------------------------------------------------------
+subroutine nested_sampling( &
+           x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab, &  !Data vars
+           out_prefix, &                                !output files name root
+           stellar_pars,afk,&                           !Stellar parameters and flag|
+           flags, total_fit_flag,is_jit, &              !flags
+           fit_all, fit_rvs, fit_ldc,fit_trends, &      !fitting controls
+           nlive, nbatch, nwalk, dlogz, maxi, &         !nested sampling controls
+           seed, nbytes, nwalks, nconv, &               !output controls
+           lims, lims_rvs, lims_ldc, lin_pri, &         !prior limits
+           n_cad, t_cad, otab, cad_tol, &               !cadence cotrols
+           npl, n_tel, n_jrv, &                         !planets and telescopes
+           size_rv, size_tr &                           !data sizes
+           )
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: size_rv, size_tr, npl, n_tel, n_jrv !size of RV and LC data
+  integer, intent(in) :: nlive, nbatch, nwalk, maxi, seed, nbytes, nwalks, nconv
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  !the run stops when the live points can increase ln Z less than dlogz
+  double precision, intent(in) :: dlogz
+  !out_prefix has to be the first character argument, f2py only passes its length
+  character(len=*), intent(in) :: out_prefix
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  double precision, intent(in), dimension(0:3) :: stellar_pars
+  double precision, intent(in), dimension(0:2*8*npl - 1):: lims
+  double precision, intent(in), dimension(0:2*n_tel - 1) :: lims_rvs
+  double precision, intent(in), dimension(0:3) :: lims_ldc
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) ::  otab(0:*)
+  double precision, intent(in) ::  cad_tol
+  character, intent(in) :: fit_trends(0:1)
+  character, intent(in) :: fit_all(0:8*npl-1), fit_rvs(0:n_tel-1), fit_ldc(0:1)
+  logical, intent(in) :: flags(0:7), total_fit_flag(0:1)
+  !priors of the linear parameters marginalized in the RV likelihood, see rv_linear
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  logical, intent(in) :: afk(0:npl-1), is_jit(0:1)
+!Local variables
+  !Each point is u (unit cube), x (parameters) and pt = (ln posterior, chi2_rv, chi2_tr, ln L)
+  double precision, allocatable, dimension(:,:) :: u_live, x_live, p_live
+  !Dead points, x, pt and ln w of each one
+  double precision, allocatable, dimension(:,:) :: dead, dead_tmp
+  double precision, allocatable, dimension(:) :: l_kill
+  integer, allocatable, dimension(:) :: i_kill
+  integer(kind=8), allocatable, dimension(:,:) :: rng
+  character, dimension(0:8*npl+n_tel+n_jrv+4) :: ptype
+  double precision, dimension(0:8*npl+n_tel+n_jrv+4) :: plo, phi, sd
+  double precision, dimension(0:8*npl+n_tel+n_jrv+4) :: u_cur, u_try, x_cur, x_try, z
+  double precision, dimension(0:3) :: pt_cur, pt_try
+  integer, dimension(0:8*npl+n_tel+n_jrv+4) :: wtf
+  double precision :: log_z, log_z_new, log_x, log_w, h_info, l_min, l_max
+  double precision :: scale, acc, r(0:0), log_z_err, d_log_z
+  integer :: ndim, nfree, ndead, i, j, jj, k, ib, n, nacc, ios, i0, seed_run
+  integer, allocatable, dimension(:) :: nacc_j
+  character(len=len(out_prefix)+11) :: nested_file
+  character(len=len(out_prefix)+11) :: weight_file
+  character(len=len(out_prefix)+13) :: all_file
+  double precision, parameter :: l_floor = -1.d300
+
+  ndim = 8*npl + 2 + n_tel + 2 + n_jrv + 1
+
+  nested_file = trim(out_prefix)//'_nested.bin'
+  weight_file = trim(out_prefix)//'_nested.dat'
+  all_file = trim(out_prefix)//'_all_data.bin'
+
+  allocate( u_live(0:ndim-1,0:nlive-1), x_live(0:ndim-1,0:nlive-1), p_live(0:3,0:nlive-1), &
+            dead(0:ndim+4,0:10*nlive-1), l_kill(0:nbatch-1), i_kill(0:nbatch-1),        &
+            nacc_j(0:nbatch-1), rng(0:5,0:max(nlive,nbatch)), stat=ios )
+  if ( ios /= 0 ) then
+    print *, 'I cannot allocate the memory for the live points!'
+    print *, 'Reduce nlive'
+    stop
+  end if
+
+  print *, 'CREATING RANDOM SEED'
+  seed_run = seed
+  if ( seed_run <= 0 ) call system_clock(count=seed_run)
+
+  !The priors of all the parameters, in the order of pack_walker
+  call nested_priors(fit_all,fit_ldc,fit_rvs,fit_trends,lims,lims_ldc,lims_rvs, &
+       is_jit,e_rv(0),e_tr(0),ptype,plo,phi,npl,n_tel,n_jrv)
+  wtf(:) = 0
+  where ( ptype /= 'f' ) wtf = 1
+  nfree = sum(wtf)
+
+  print *, ''
+  print *, 'STARTING NESTED SAMPLING'
+  if ( total_fit_flag(0) ) &
+  print *, 'RV datapoints  = ', size_rv
+  if ( total_fit_flag(1) ) &
+  print *, 'TR datapoints  = ', size_tr
+  print *, 'No. parameters = ', nfree
+  print *, 'Live points    = ', nlive
+  print *, 'Random seed    = ', seed_run
+
+  !The live points are drawn from the prior
+  !$OMP PARALLEL DO SCHEDULE(DYNAMIC) PRIVATE(u_cur)
+  do i = 0, nlive - 1
+    call rng_init(rng(:,i),seed_run,i,0)
+    call rng_uniform(rng(:,i),u_cur,ndim)
+    u_live(:,i) = u_cur(:)
+    call nested_point(u_live(:,i),x_live(:,i),p_live(:,i),ptype,plo,phi,wtf,       &
+         x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+         fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+  end do
+  !$OMP END PARALLEL DO
+
+  p_live(3,:) = max( p_live(3,:), l_floor )
+
+  log_z  = - huge(0.d0)
+  log_x  = 0.d0
+  h_info = 0.d0
+  ndead  = 0
+  scale  = 2.38d0 / sqrt( dble(nfree) )
+  ib = 0
+
+  do while ( .true. )
+
+    ib = ib + 1
+
+    !The nbatch live points with the lowest likelihood die, the live points
+    !decrease from nlive to nlive - nbatch + 1 while they are removed
+    do j = 0, nbatch - 1
+      l_min = huge(0.d0)
+      do i = 0, nlive - 1
+        if ( any( i_kill(0:j-1) == i ) ) cycle
+        if ( p_live(3,i) < l_min ) then
+          l_min = p_live(3,i)
+          i_kill(j) = i
+        end if
+      end do
+      l_kill(j) = l_min
+      i = i_kill(j)
+      log_w = l_min + log_x + log( 1.d0 - exp( - 1.d0 / ( nlive - j ) ) )
+      log_x = log_x - 1.d0 / ( nlive - j )
+      !Evidence and information, Skilling (2006)
+      log_z_new = max(log_z,log_w) + log( 1.d0 + exp( - abs(log_z - log_w) ) )
+      h_info = exp( log_w - log_z_new ) * l_min + &
+               exp( log_z - log_z_new ) * ( h_info + log_z ) - log_z_new
+      log_z = log_z_new
+      if ( ndead == size(dead,2) ) then
+        allocate( dead_tmp(0:ndim+4,0:2*ndead-1) )
+        dead_tmp(:,0:ndead-1) = dead(:,0:ndead-1)
+        call move_alloc(dead_tmp,dead)
+      end if
+      dead(0:ndim-1,ndead) = x_live(:,i)
+      dead(ndim:ndim+3,ndead) = p_live(:,i)
+      dead(ndim+4,ndead) = log_w
+      ndead = ndead + 1
+    end do
+    l_min = l_kill(nbatch-1)
+
+    !Is the evidence of the live points still important? They can increase
+    !ln Z at most by d_log_z = log(1 + exp(l_max + log_x - log_z))
+    l_max = maxval(p_live(3,:))
+    d_log_z = max(l_max + log_x - log_z,0.d0) + log( 1.d0 + exp( - abs(l_max + log_x - log_z) ) )
+    if ( l_max + log_x - log_z < log( exp(dlogz) - 1.d0 ) ) exit
+    if ( ndead >= maxi ) then
+      print *, 'Maximum number of iteration reached!'
+      exit
+    end if
+
+    !Spread of the live points that survive
+    do n = 0, ndim - 1
+      sd(n) = 0.d0
+      if ( wtf(n) == 1 ) then
+        acc = sum(u_live(n,:)) / nlive
+        sd(n) = sqrt( sum( ( u_live(n,:) - acc )**2 ) / nlive )
+      end if
+    end do
+
+    !Constrained random walks from random live points that survive
+    !$OMP PARALLEL DO SCHEDULE(DYNAMIC) &
+    !$OMP PRIVATE(i0,k,r,z,u_cur,u_try,x_cur,x_try,pt_cur,pt_try)
+    do jj = 0, nbatch - 1
+      call rng_init(rng(:,jj),seed_run,jj,ib)
+      i0 = i_kill(0)
+      do while ( any( i_kill == i0 ) )
+        call rng_uniform(rng(:,jj),r,1)
+        i0 = min( int( r(0) * nlive ), nlive - 1 )
+      end do
+      u_cur(:)  = u_live(:,i0)
+      x_cur(:)  = x_live(:,i0)
+      pt_cur(:) = p_live(:,i0)
+      nacc_j(jj) = 0
+      do k = 1, nwalk
+        call gauss_random_bm(0.d0,1.d0,z,ndim,rng(:,jj))
+        u_try(:) = u_cur(:) + wtf(:) * scale * sd(:) * z(:)
+        if ( any( u_try <= 0.d0 .or. u_try >= 1.d0 ) ) cycle
+        call nested_point(u_try,x_try,pt_try,ptype,plo,phi,wtf,                        &
+             x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,total_fit_flag,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+             fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+        if ( pt_try(3) > l_min ) then
+          u_cur(:)  = u_try(:)
+          x_cur(:)  = x_try(:)
+          pt_cur(:) = pt_try(:)
+          nacc_j(jj) = nacc_j(jj) + 1
+        end if
+      end do
+      u_live(:,i_kill(jj)) = u_cur(:)
+      x_live(:,i_kill(jj)) = x_cur(:)
+      p_live(:,i_kill(jj)) = pt_cur(:)
+    end do
+    !$OMP END PARALLEL DO
+
+    !Keep the acceptance of the walks close to 50%
+    nacc = sum(nacc_j)
+    acc = dble(nacc) / dble( nbatch * nwalk )
+    scale = min( max( scale * exp( acc - 0.5d0 ), 1.d-4 ), 10.d0 )
+
+    if ( mod(ib,max(1,nlive/nbatch)) == 0 ) &
+    print *, 'DEAD POINTS = ', ndead, ' ln Z = ', real(log_z), &
+             ' d ln Z = ', real(d_log_z), ' ACCEPTANCE = ', real(acc)
+
+  end do
+
+  !The live points fill the rest of the prior volume
+  do i = 0, nlive - 1
+    log_w = p_live(3,i) + log_x - log( dble(nlive) )
+    log_z_new = max(log_z,log_w) + log( 1.d0 + exp( - abs(log_z - log_w) ) )
+    h_info = exp( log_w - log_z_new ) * p_live(3,i) + &
+             exp( log_z - log_z_new ) * ( h_info + log_z ) - log_z_new
+    log_z = log_z_new
+    if ( ndead == size(dead,2) ) then
+      allocate( dead_tmp(0:ndim+4,0:2*ndead-1) )
+      dead_tmp(:,0:ndead-1) = dead(:,0:ndead-1)
+      call move_alloc(dead_tmp,dead)
+    end if
+    dead(0:ndim-1,ndead) = x_live(:,i)
+    dead(ndim:ndim+3,ndead) = p_live(:,i)
+    dead(ndim+4,ndead) = log_w
+    ndead = ndead + 1
+  end do
+
+  !Skilling (2006), the error of ln Z is sqrt(H/nlive)
+  log_z_err = sqrt( max(h_info,0.d0) / nlive )
+
+  print *, '=================================='
+  print *, '   NESTED SAMPLING HAS FINISHED'
+  print *, '=================================='
+  print *, 'ln Z        = ', log_z, ' +- ', log_z_err
+  print *, 'Information = ', h_info
+  print *, 'Dead points = ', ndead
+  print *, '=================================='
+  print *, '   CREATING OUTPUT DATA FILES'
+  print *, '=================================='
+
+  !Weighted samples, the weights are in the _nested.dat file
+  open(unit=801,file=trim(nested_file),status='replace',access='stream',form='unformatted')
+  call write_chain_header(801,nbytes,flags,npl,n_tel,n_jrv)
+  call write_nested_rows(801,nbytes,dead,size(dead,2),(/ (i, i = 0, ndead - 1) /),1,ndead,ndim,npl,n_tel,n_jrv)
+  close(801)
+
+  open(unit=802,file=trim(weight_file),status='replace')
+  write(802,*) '# ln Z = ', log_z, ' +- ', log_z_err
+  write(802,*) '# H = ', h_info
+  write(802,*) '# ln L, ln w (normalized weight) of each row of ', trim(nested_file)
+  do i = 0, ndead - 1
+    write(802,*) dead(ndim+3,i), dead(ndim+4,i) - log_z
+  end do
+  close(802)
+
+  !Equally weighted samples with the shape of a chain file of nwalks and nconv
+  !systematic resampling of the weights
+  deallocate(i_kill)
+  allocate(i_kill(0:nwalks*nconv-1))
+  call rng_init(rng(:,0),seed_run,max(nlive,nbatch),0)
+  call rng_uniform(rng(:,0),r,1)
+  j = 0
+  acc = exp( dead(ndim+4,0) - log_z )
+  do n = 0, nwalks * nconv - 1
+    do while ( ( n + r(0) ) / ( nwalks * nconv ) > acc .and. j < ndead - 1 )
+      j = j + 1
+      acc = acc + exp( dead(ndim+4,j) - log_z )
+    end do
+    i_kill(n) = j
+  end do
+
+  open(unit=701,file=trim(all_file),status='replace',access='stream',form='unformatted')
+  call write_chain_header(701,nbytes,flags,npl,n_tel,n_jrv)
+  call write_nested_rows(701,nbytes,dead,size(dead,2),i_kill,nwalks,nconv,ndim,npl,n_tel,n_jrv)
+  close(701)
+
+  deallocate( u_live, x_live, p_live, dead, l_kill, i_kill, nacc_j, rng )
+
+end subroutine
+
+!-----------------------------------------------------------
+! nested_priors creates the prior of each parameter of the
+! vector of pack_walker, ptype is 'f' (fixed to plo), 'u'
+! (uniform between plo and phi) or 'g' (normal with mean plo
+! and sigma phi). The trends and jitter terms have the same
+! uniform ranges used to create the walkers of the MCMC
+!-----------------------------------------------------------
+subroutine nested_priors(fit_all,fit_ldc,fit_rvs,fit_trends,lims,lims_ldc,lims_rvs, &
+           is_jit,e_rv0,e_tr0,ptype,plo,phi,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: npl, n_tel, n_jrv
+  character, intent(in) :: fit_all(0:8*npl-1), fit_rvs(0:n_tel-1), fit_ldc(0:1), fit_trends(0:1)
+  double precision, intent(in) :: lims(0:2*8*npl-1), lims_rvs(0:2*n_tel-1), lims_ldc(0:3)
+  logical, intent(in) :: is_jit(0:1)
+  double precision, intent(in) :: e_rv0, e_tr0
+  character, intent(out), dimension(0:8*npl+n_tel+n_jrv+4) :: ptype
+  double precision, intent(out), dimension(0:8*npl+n_tel+n_jrv+4) :: plo, phi
+!Local variables
+  integer :: o
+
+  ptype(0:8*npl-1) = fit_all(:)
+  plo(0:8*npl-1) = lims(0::2)
+  phi(0:8*npl-1) = lims(1::2)
+  o = 8*npl
+  ptype(o:o+1) = fit_ldc(:)
+  plo(o:o+1) = lims_ldc(0::2)
+  phi(o:o+1) = lims_ldc(1::2)
+  o = o + 2
+  ptype(o:o+n_tel-1) = fit_rvs(:)
+  plo(o:o+n_tel-1) = lims_rvs(0::2)
+  phi(o:o+n_tel-1) = lims_rvs(1::2)
+  o = o + n_tel
+  ptype(o:o+1) = fit_trends(:)
+  plo(o:o+1) = -1.d-1
+  phi(o:o+1) =  1.d-1
+  where ( fit_trends == 'f' ) plo(o:o+1) = 0.d0
+  o = o + 2
+  ptype(o:o+n_jrv) = 'f'
+  plo(o:o+n_jrv) = 0.d0
+  phi(o:o+n_jrv-1) = e_rv0
+  phi(o+n_jrv) = e_tr0
+  if ( is_jit(0) ) ptype(o:o+n_jrv-1) = 'u'
+  if ( is_jit(1) ) ptype(o+n_jrv) = 'u'
+
+end subroutine
+
+!-----------------------------------------------------------
+! nested_point transforms the point u of the unit cube to the
+! parameters x with the priors and evaluates it. a/R* follows
+! the normal prior from the stellar parameters for the planets
+! with afk. pt = (ln posterior, chi2_rv, chi2_tr, ln L)
+!-----------------------------------------------------------
+subroutine nested_point(u,x,pt,ptype,plo,phi,wtf, &
+           x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+           fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,npl,n_tel,n_jrv,size_rv,size_tr)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: size_rv, size_tr, npl, n_tel, n_jrv
+  integer, intent(in), dimension(0:size_tr-1) :: n_cad
+  double precision, intent(in), dimension(0:8*npl+n_tel+n_jrv+4) :: u, plo, phi
+  character, intent(in), dimension(0:8*npl+n_tel+n_jrv+4) :: ptype
+  integer, intent(in), dimension(0:8*npl+n_tel+n_jrv+4) :: wtf
+  double precision, intent(out), dimension(0:8*npl+n_tel+n_jrv+4) :: x
+  double precision, intent(out), dimension(0:3) :: pt
+  double precision, intent(in), dimension(0:size_rv-1) :: x_rv, y_rv, e_rv
+  double precision, intent(in), dimension(0:size_tr-1) :: x_tr, y_tr, e_tr
+  integer, intent(in), dimension(0:size_rv-1) :: tlab, jrvlab
+  character, intent(in) :: fit_all(0:8*npl-1), fit_ldc(0:1)
+  double precision, intent(in) :: lims(0:2*8*npl-1), lims_ldc(0:3)
+  logical, intent(in) :: afk(0:npl-1), flags(0:7), tff(0:1)
+  double precision, intent(in) :: lin_pri(0:3*(n_tel+2+npl)-1)
+  double precision, intent(in) :: stellar_pars(0:3)
+  double precision, intent(in), dimension(0:size_tr-1) :: t_cad
+  double precision, intent(in) :: otab(0:*)
+  double precision, intent(in) :: cad_tol
+!Local variables
+  double precision :: pars(0:8*npl-1), rvs(0:n_tel-1), ldc(0:1), trends(0:1)
+  double precision :: jrv(0:n_jrv-1), jtr, priors(0:8*npl-1), priors_ldc(0:1)
+  double precision :: log_prior, a_mean, a_sigma, g
+  logical :: is_good
+  integer :: o, m
+  external :: unpack_walker
+
+  do o = 0, 8*npl+n_tel+n_jrv+4
+    if ( wtf(o) == 0 ) then
+      x(o) = plo(o)
+    else if ( ptype(o) == 'g' ) then
+      call inv_normal(u(o),g)
+      x(o) = plo(o) + phi(o) * g
+    else
+      x(o) = plo(o) + u(o) * ( phi(o) - plo(o) )
+    end if
+  end do
+
+  do m = 0, npl - 1
+    if ( afk(m) ) then
+      call get_a_err(stellar_pars(0),stellar_pars(1),stellar_pars(2),stellar_pars(3),&
+           x(1+8*m),a_mean,a_sigma)
+      call inv_normal(u(5+8*m),g)
+      x(5+8*m) = a_mean + a_sigma * g
+    end if
+  end do
+
+  call unpack_walker(x,pars,ldc,rvs,trends,jrv,jtr,npl,n_tel,n_jrv)
+  pt(1:2) = huge(0.d0)
+  call get_logpost(x_rv,y_rv,x_tr,y_tr,e_rv,e_tr,tlab,jrvlab,tff,flags,lin_pri,t_cad,n_cad,otab,cad_tol, &
+       fit_all,fit_ldc,lims,lims_ldc,afk,stellar_pars,pars,rvs,ldc,trends,jrv,jtr,  &
+       1.d0,-huge(0.d0),priors,priors_ldc,log_prior,pt(0),pt(1),pt(2),is_good,npl,n_tel,n_jrv,size_rv,size_tr)
+  pt(3) = -1.d300
+  if ( is_good ) pt(3) = max( pt(0) - log_prior, -1.d300 )
+
+end subroutine
+
+!-----------------------------------------------------------
+! write_nested_rows writes the dead points idx as the rows of
+! a chain file with nwalks walkers and nconv iterations
+!-----------------------------------------------------------
+subroutine write_nested_rows(unit,nbytes,dead,nrow,idx,nwalks,nconv,ndim,npl,n_tel,n_jrv)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: unit, nbytes, nrow, nwalks, nconv, ndim, npl, n_tel, n_jrv
+  double precision, intent(in), dimension(0:ndim+4,0:nrow-1) :: dead
+  integer, intent(in), dimension(0:nwalks*nconv-1) :: idx
+!Local variables
+  double precision, allocatable, dimension(:,:) :: loglike, chi2_rv, chi2_tr, jitter_tr
+  double precision, allocatable, dimension(:,:,:) :: pars, ldc, rvs, tds, jitter_rv
+  integer, allocatable, dimension(:) :: iters
+  integer :: n, nk, i
+  external :: unpack_walker, write_chain_block
+
+  allocate( loglike(0:nwalks-1,0:nconv-1), chi2_rv(0:nwalks-1,0:nconv-1),         &
+            chi2_tr(0:nwalks-1,0:nconv-1), jitter_tr(0:nwalks-1,0:nconv-1),       &
+            pars(0:nwalks-1,0:8*npl-1,0:nconv-1), ldc(0:nwalks-1,0:1,0:nconv-1),   &
+            rvs(0:nwalks-1,0:n_tel-1,0:nconv-1), tds(0:nwalks-1,0:1,0:nconv-1),    &
+            jitter_rv(0:nwalks-1,0:n_jrv-1,0:nconv-1), iters(0:nconv-1) )
+
+  do n = 0, nconv - 1
+    iters(n) = n
+    do nk = 0, nwalks - 1
+      i = idx(n*nwalks+nk)
+      call unpack_walker(dead(0:ndim-1,i),pars(nk,:,n),ldc(nk,:,n),rvs(nk,:,n), &
+           tds(nk,:,n),jitter_rv(nk,:,n),jitter_tr(nk,n),npl,n_tel,n_jrv)
+      loglike(nk,n) = dead(ndim,i)
+      chi2_rv(nk,n) = dead(ndim+1,i)
+      chi2_tr(nk,n) = dead(ndim+2,i)
+    end do
+  end do
+
+  call write_chain_block(unit,nbytes,nconv,iters,loglike,chi2_rv,chi2_tr, &
+       pars,ldc,rvs,tds,jitter_rv,jitter_tr,nwalks,nconv,npl,n_tel,n_jrv)
+
+  deallocate( loglike, chi2_rv, chi2_tr, jitter_tr, pars, ldc, rvs, tds, jitter_rv, iters )
+
+end subroutine
@@ -44,6 +44,8 @@ def plot_postiter():
 u1_val =best_value(u1_vec,maxloglike,get_value)
 u2_val =best_value(u2_vec,maxloglike,get_value)
 my_ldc = [u1_val,u2_val]
+is_power2 = ( ld_law == 'power2' )
+is_gauss = ( integration == 'gauss' )
 flag = [False]*4
 
 v_vec_val = [None]*nt
@@ -196,11 +198,7 @@ for m in range(0,nplanets):
 #Returns the pars_tr array for a given chain number
 def pars_tr_chain(params,nchain):
   ldc = [ params[4+8*nplanets][nchain], params[5+8*nplanets][nchain]]
-  q1_val = ldc[0]
-  q2_val = ldc[1]
-  u1_val = np.sqrt(q1_val)
-  u2_val = u1_val * (1.0 -2.0*q2_val)
-  u1_val = 2.0*u1_val*q2_val
+  u1_val, u2_val = ld_coefficients(ldc[0],ldc[1])
   flag = [False]*4
   my_ldc = [u1_val,u2_val]
 
@@ -284,16 +282,21 @@ def plot_transit_nice():
       xmodel_res = xtime
       mimax = abs(max(abs(min(xtime)),abs(max(xtime))))
       xmodel = np.arange(-mimax, mimax,1.0/20./24.)
+      #Cadence of the data, the model takes the one of the light curve
+      #with more points in the plot
+      lab_d = cadence_labels(local_time)
+      ncad_d, tcad_d = cadence_arrays(local_time,lab_d)
+      ncad_m, tcad_m = cadence_arrays(xmodel,np.bincount(lab_d).argmax())
       #Let us create the model
 
       #The model has T0 = 0
       dumtp = pti.find_tp(0.0,e_val[o],w_val[o],P_val[o])
       dparstr = np.concatenate([[dumtp],pars_tr[1:,o]])
-      fd_ub = pti.flux_tr(xmodel,dparstr,my_ldc,n_cad,t_cad)
+      fd_ub = pti.flux_tr(xmodel,dparstr,my_ldc,is_power2,is_gauss,ncad_m,tcad_m,otab,cad_tol)
       #Let us create an unbinned model plot
-      fd_ub_unbinned = pti.flux_tr(xmodel,dparstr,my_ldc,1,t_cad)
+      fd_ub_unbinned = pti.flux_tr(xmodel,dparstr,my_ldc,is_power2,is_gauss,[1]*len(xmodel),tcad_m,otab,cad_tol)
       #Calculate the flux to copute the residuals
-      fd_ub_res = pti.flux_tr(xmodel_res,dparstr,my_ldc,n_cad,t_cad)
+      fd_ub_res = pti.flux_tr(xmodel_res,dparstr,my_ldc,is_power2,is_gauss,ncad_d,tcad_d,otab,cad_tol)
 
 
 
@@ -316,8 +319,8 @@ def plot_transit_nice():
           dumtp = pti.find_tp(0.0,lpars_tr[2,o],lpars_tr[3,o],lpars_tr[1,o])
           dparstr = np.concatenate([[dumtp],lpars_tr[1:,o]])
           #This is the flux of the actual planet
-          flux_vector[l] = pti.flux_tr(xmodel,dparstr,my_ldc,n_cad,t_cad)
-          flux_vector_res[l] = pti.flux_tr(xmodel_res,dparstr,my_ldc,n_cad,t_cad)
+          flux_vector[l] = pti.flux_tr(xmodel,dparstr,my_ldc,is_power2,is_gauss,ncad_m,tcad_m,otab,cad_tol)
+          flux_vector_res[l] = pti.flux_tr(xmodel_res,dparstr,my_ldc,is_power2,is_gauss,ncad_d,tcad_d,otab,cad_tol)
 
         flux_vector = np.array(flux_vector)
         flux_vector_res = np.array(flux_vector_res)
@@ -334,7 +337,7 @@ def plot_transit_nice():
       for p in range(0,nplanets):
         if ( p != o ):
           #fd_ub_total stores the flux of a star for each independent
-          fd_ub_total = fd_ub_total + pti.flux_tr(local_time,pars_tr[:,p],my_ldc,n_cad,t_cad)
+          fd_ub_total = fd_ub_total + pti.flux_tr(local_time,pars_tr[:,p],my_ldc,is_power2,is_gauss,ncad_d,tcad_d,otab,cad_tol)
 
       #Remove extra planets from the data
       yflux_local = yflux - fd_ub_total
@@ -385,7 +388,7 @@ def plot_all_transits():
   global plot_tr_errorbars
 
   #Create the plot of the whole light
-  model_flux = pti.flux_tr(megax,pars_tr,my_ldc,n_cad,t_cad)
+  model_flux = pti.flux_tr(megax,pars_tr,my_ldc,is_power2,is_gauss,mega_ncad,mega_tcad,otab,cad_tol)
   res_flux = megay - model_flux
 
   for i in range(0,nplanets):
@@ -397,7 +400,8 @@ def plot_all_transits():
       if ( is_plot_all_tr[i] ):
         for j in range(0,len(xt)):
           xtm = np.arange(min(xt[j]),max(xt[j]),1./20./24.)
-          ytm = pti.flux_tr(xtm,pars_tr,my_ldc,n_cad,t_cad)
+          ncad_m, tcad_m = cadence_arrays(xtm)
+          ytm = pti.flux_tr(xtm,pars_tr,my_ldc,is_power2,is_gauss,ncad_m,tcad_m,otab,cad_tol)
 
           fname = outdir+'/'+star+plabels[i]+'_transit'+str(j)+'.pdf'
           n = xt[j][len(xt[j])-1] - xt[0][0]
@@ -417,9 +421,10 @@ def clean_transits(sigma=10):
 
     #Now we are ready to call the function in fortran
     #All the data is in megax, megay and megae
-    model_flux = pti.flux_tr(megax,pars_tr,my_ldc,n_cad,t_cad)
+    model_flux = pti.flux_tr(megax,pars_tr,my_ldc,is_power2,is_gauss,mega_ncad,mega_tcad,otab,cad_tol)
     xvec_model = np.arange(min(megax),max(megax),1./20./24.)
-    solution_flux = pti.flux_tr(xvec_model,pars_tr,my_ldc,n_cad,t_cad)
+    ncad_m, tcad_m = cadence_arrays(xvec_model)
+    solution_flux = pti.flux_tr(xvec_model,pars_tr,my_ldc,is_power2,is_gauss,ncad_m,tcad_m,otab,cad_tol)
 
     #Calcualte the residuals
     res_flux = megay - model_flux
@@ -428,7 +433,8 @@ def clean_transits(sigma=10):
     new_t, new_f = sigma_clip(megax,megay,res_flux,limit_sigma=sigma)
 
     #Recalculate the error bars
-    new_model_flux = pti.flux_tr(new_t,pars_tr,my_ldc,n_cad,t_cad)
+    ncad_m, tcad_m = cadence_arrays(new_t)
+    new_model_flux = pti.flux_tr(new_t,pars_tr,my_ldc,is_power2,is_gauss,ncad_m,tcad_m,otab,cad_tol)
     #New residuals
     new_res_flux = new_f - new_model_flux
     #Recompute the error bars from the std of the residuals
@@ -7,20 +7,6 @@
 
 nconv    = niter
 nwalkers = nchains
-#What transit data are we fitting
-if ( lc_data == 'kepler_lc' ):
-  n_cad = 10
-  t_cad = 29.425 / 60. / 24.0 #days
-elif ( lc_data == 'kepler_sc' ):
-  n_cad = 1
-  t_cad = 1.5 / 60. / 24.0 #days
-elif ( lc_data == 'tess_sc' ):
-  n_cad = 10
-  t_cad = 2.0 / 60. / 24.0 #days
-elif ( lc_data == 'free' ):
-  #values given by the user
-  n_cad = n_cad
-  t_cad = t_cad
 
 #-----------------------------------------------------------
 #                         RV DATA
@@ -172,6 +158,8 @@ if ( nplanets_tr > 0 ):
   megay = np.concatenate(yt)
   megae = np.concatenate(et)
   megap = [0]*len(megax)
+  #trlab has the label of the light curve of each point, as tlab for RV
+  trlab = np.concatenate([ [o]*len(xt[o]) for o in range(0,myn) ])
 
   total_tr_fit = True
 
@@ -180,11 +168,44 @@ else:
   megay = [1.]
   megae = [1.]
   megap = [0]
+  trlab = [0]
   total_tr_fit = False
   is_jitter_tr = False
   fit_q1 = 'f'
   fit_q2 = 'f'
 
+#What transit data are we fitting
+#lc_data, n_cad and t_cad can be given for each light curve in fname_tr
+nlc = max(trlab) + 1
+if ( type(lc_data) != list ):
+  lc_data = [lc_data]*nlc
+if ( type(n_cad) != list ):
+  n_cad = [n_cad]*nlc
+if ( type(t_cad) != list ):
+  t_cad = [t_cad]*nlc
+if ( len(lc_data) != nlc or len(n_cad) != nlc or len(t_cad) != nlc ):
+  print 'lc_data, n_cad and t_cad need one value for each file in fname_tr!'
+  sys.exit('')
+#The Gauss-Legendre rule needs fewer nodes than the uniform sub-divisions
+n_preset = 10
+if ( integration == 'gauss' ):
+  n_preset = 3
+for o in range(0,nlc):
+  if ( lc_data[o] == 'kepler_lc' ):
+    n_cad[o] = n_preset
+    t_cad[o] = 29.425 / 60. / 24.0 #days
+  elif ( lc_data[o] == 'kepler_sc' ):
+    n_cad[o] = 1
+    t_cad[o] = 1.5 / 60. / 24.0 #days
+  elif ( lc_data[o] == 'tess_sc' ):
+    n_cad[o] = n_preset
+    t_cad[o] = 2.0 / 60. / 24.0 #days
+  #lc_data = 'free' -> values given by the user
+
+#Cadence of each transit data point
+mega_ncad = [ n_cad[o] for o in trlab ]
+mega_tcad = [ t_cad[o] for o in trlab ]
+
 #TRANSIT DATA READY
 #Take care with span_tr
 if ( len(span_tr) == 1 and nplanets > 1): #The user did not change this option in input_file.py
@@ -2,18 +2,38 @@ from matplotlib import gridspec
 
 #Read the data
 #Dummy params vector contains
-#[0] -> i
-#[1] -> chain label
+#[0] -> iteration
+#[1] -> ln likelihood
 #[2] -> chi2_rv
 #[3] -> chi2_tr
 #[4-8*nplanets] -> parameters
 #[4+8*nplanets-+2] -> ldc
 #[4+8*nplanets+2-+ntelescopes] -> rvs
-newfile = outdir+'/'+star+'_all_data.dat'
-dparams = np.loadtxt(newfile, comments='#',unpack=True)
+newfile = outdir+'/'+star+'_all_data.bin'
+if ( os.path.isfile(newfile) ):
+  #Binary chain file, the columns are not read until they are used
+  chain_names, chains = read_chains(newfile)
+  #Skip the walker column, the old text files do not have it
+  nrv0 = 5 + 8*nplanets + 2
+  dparams = [chains[:,0]] + [ chains[:,o] for o in range(2,nrv0+nt) ]
+  dparams_trends = [ chains[:,o] for o in range(nrv0+nt,nrv0+nt+2) ]
+  dparams_jitter = [ chains[:,o] for o in range(nrv0+nt+2,len(chain_names)) ]
+else:
+  #Legacy text files, see is_text_chains
+  newfile = outdir+'/'+star+'_all_data.dat'
+  dparams = np.loadtxt(newfile, comments='#',unpack=True)
+  if ( is_jitter_rv or is_jitter_tr ):
+    newfile_jitter = outdir+'/'+star+'_jitter_data.dat'
+    dparams_jitter = np.loadtxt(newfile_jitter, comments='#',unpack=True)
+  if ( is_linear_trend != 'f' or is_quadratic_trend != 'f' ):
+    newfile_trends = outdir+'/'+star+'_trends_data.dat'
+    dparams_trends = np.loadtxt(newfile_trends, comments='#',unpack=True)
 
 
 #Let us do the clustering
+#The nested sampling samples are not chains, there are not stuck walkers to remove
+if ( method == 'nested' ):
+  is_clustering = False
 params = list(dparams)
 #par_likelihood = list(ldparams[2])
 params_jitter = [0.0]*2
@@ -30,16 +50,12 @@ if ( is_clustering ):
     params[o] = clustering_fast(dparams[o],good_index,nconv)
 
 if ( is_jitter_rv or is_jitter_tr ):
-  newfile_jitter = outdir+'/'+star+'_jitter_data.dat'
-  dparams_jitter = np.loadtxt(newfile_jitter, comments='#',unpack=True)
   params_jitter = list(dparams_jitter)
   if ( is_clustering ):
     for o in range(0,n_jrv+1):
       params_jitter[o] = clustering_fast(dparams_jitter[o],good_index,nconv)
 
 if ( is_linear_trend != 'f' or is_quadratic_trend != 'f' ):
-  newfile_trends = outdir+'/'+star+'_trends_data.dat'
-  dparams_trends = np.loadtxt(newfile_trends, comments='#',unpack=True)
   params_trends = list(dparams_trends)
   if ( is_clustering ):
     for o in range(0,2):
@@ -65,7 +81,8 @@ if ( len(plot_parameters) < 2):
   plot_parameters = []
 
   for o in range(0,len(fit_all)):
-      if ( fit_all[o] != 'f' ):
+      #The K marginalized in the likelihood are fixed for the sampler
+      if ( fit_all[o] != 'f' or ( o%8 == 7 and lin_pri[3*(nt+2+o/8)] > 0.0 ) ):
           npars = npars + 1
           plot_parameters.append(o)
 
@@ -111,14 +128,14 @@ if ( is_linear_trend != 'f' or is_quadratic_trend != 'f' ):
 #Calculate the final chi2 for each case
 log_like_rv, chi2tot_val_rv, dummy = \
   pti.get_loglike(mega_time,mega_rv,megax,megay,mega_err,megae,\
-                     tlab,jrvlab,[True,False],flags,t_cad, n_cad, \
-                     fit_pars,rvs_pars,ldc_pars,fit_trends,fit_jrv,fit_jtr \
+                     tlab,jrvlab,[True,False],flags,[0.0]*len(lin_pri),mega_tcad, mega_ncad, otab, cad_tol, \
+                     fit_pars,rvs_pars,ldc_pars,fit_trends,fit_jrv,fit_jtr,-np.inf \
                      )
 
 log_like_tr, dummy, chi2tot_val_tr = \
   pti.get_loglike(mega_time,mega_rv,megax,megay,mega_err,megae,\
-                     tlab,jrvlab,[False,True],flags,t_cad, n_cad, \
-                     fit_pars,rvs_pars,ldc_pars,fit_trends,fit_jrv,fit_jtr \
+                     tlab,jrvlab,[False,True],flags,[0.0]*len(lin_pri),mega_tcad, mega_ncad, otab, cad_tol, \
+                     fit_pars,rvs_pars,ldc_pars,fit_trends,fit_jrv,fit_jtr,-np.inf \
                      )
 
 log_like_total = log_like_rv + log_like_tr
@@ -137,7 +154,7 @@ else:
   s_factor = 1.0
 
 
-if ( method == 'mcmc' or method == 'plot' ):
+if ( method == 'mcmc' or method == 'resume' or method == 'nested' or method == 'plot' ):
 
   base = 4 #Where do the parameters start?
 #Fitted parameters
@@ -188,6 +205,29 @@ if ( method == 'mcmc' or method == 'plot' ):
   opars.write('ln likelihood    = %4.4f\n' %(log_like_total))
   opars.write('BIC              = %4.4f\n' %(bic_from_loglikelihood))
   opars.write('AIC              = %4.4f\n' %(aic_from_loglikelihood))
+  ti_file = outdir+'/'+star+'_ti.dat'
+  if ( ntemps > 1 and os.path.isfile(ti_file) ):
+    ln_z, ln_z_err = ti_evidence(ti_file)
+    opars.write('ln Z (TI)        = %4.4f +- %4.4f\n' %(ln_z,ln_z_err))
+  ns_file = outdir+'/'+star+'_nested.dat'
+  if ( method == 'nested' and os.path.isfile(ns_file) ):
+    f = open(ns_file,'r')
+    ln_z, ln_z_err = [ float(v) for v in f.readline().split()[4:7:2] ]
+    f.close()
+    opars.write('ln Z (NS)        = %4.4f +- %4.4f\n' %(ln_z,ln_z_err))
+  if ( method != 'nested' and os.path.isfile(outdir+'/'+star+'_all_data.bin') ):
+    #Effective sample size of the fitted parameters of the binary chain file
+    #The rows are ordered by iteration and walker
+    nsteps = chains.shape[0] / nwalkers
+    opars.write ('--------------------------------------------------------------\n')
+    opars.write ('        AUTOCORRELATION TIME AND EFFECTIVE SAMPLE SIZE\n')
+    opars.write ('--------------------------------------------------------------\n')
+    for o in range(5,len(chain_names)):
+      x = np.asarray(chains[:nsteps*nwalkers,o]).reshape(nsteps,nwalkers)
+      if ( np.ptp(x) > 0.0 ):
+        tau = integrated_time(x)
+        opars.write('%10s : tau = %10.1f iterations, ESS = %10.0f\n' \
+                    %(chain_names[o],tau*thin_factor,nsteps*nwalkers/tau))
   opars.write ('--------------------------------------------------------------\n')
   opars.write ('             INPUT STELLAR PARAMETERS\n')
   opars.write ('--------------------------------------------------------------\n')
@@ -379,12 +419,8 @@ if ( method == 'mcmc' or method == 'plot' ):
 q1_vec = params[base]
 q2_vec = params[base+1]
 
-u1_vec = np.sqrt(q1_vec)
-u2_vec = u1_vec * (1. - 2.*q2_vec)
-u1_vec = 2.*u1_vec*q2_vec
-
-u1_vec = np.asarray(u1_vec)
-u2_vec = np.asarray(u2_vec)
+#u1 and u2 are c and alpha for the power-2 law
+u1_vec, u2_vec = ld_coefficients(q1_vec,q2_vec)
 
 rv_vec = [None]*nt
 for o in range(0,nt):
@@ -394,8 +430,12 @@ opars.write ('--------------------  Other parameters -----------------------\n')
 if ( total_tr_fit ):
   print_values(q1_vec,'q1','qone','','')
   print_values(q2_vec,'q2','qtwo','','')
-  print_values(u1_vec,'u1','uone','','')
-  print_values(u2_vec,'u2','utwo','','')
+  if ( ld_law == 'power2' ):
+    print_values(u1_vec,'c','cpt','','')
+    print_values(u2_vec,'alpha','alphapt','','')
+  else:
+    print_values(u1_vec,'u1','uone','','')
+    print_values(u2_vec,'u2','utwo','','')
 if ( total_rv_fit ):
   for o in range(0,nt):
     print_values(rv_vec[o],'Sys. vel. '+telescopes_labels[o],telescopes_labels[o],'m/s','${\\rm m\,s^{-1}}$')
@@ -154,6 +154,343 @@ integer :: i
       return
       end
 
+subroutine occultquad_vec(z0,u1,u2,k,muo1,mu0,nz)
+!  Same as occultquad, for long arrays of z0. The points are first
+!  classified in the cases of Table 3 of Mandel & Agol (2002), in the
+!  same order as in occultquad, and then each case is computed for all
+!  its points at once with array operations (ellke_vec and rj_vec).
+!  The arithmetic is the same as in occultquad, the results only differ
+!  by the rounding of the vector versions of acos and log, amplified by
+!  the cancellations of some cases. The difference is below ~1e-12 (the
+!  largest one in a dense (z,p) grid is 2.9e-13).
+!  z0 is computed in blocks of nb points to keep the work arrays in cache
+implicit none
+integer, intent(in) :: nz
+double precision, intent(in) :: z0(nz),u1,u2,k
+double precision, intent(out) :: muo1(nz),mu0(nz)
+integer, parameter :: nb = 1024
+integer :: j, m
+external :: occultquad_blk
+
+  do j = 1, nz, nb
+    m = min(nb,nz-j+1)
+    call occultquad_blk(z0(j:j+m-1),u1,u2,k,muo1(j:j+m-1),mu0(j:j+m-1),m)
+  end do
+
+end subroutine
+
+!occultquad_vec for a block of z0
+subroutine occultquad_blk(z0,u1,u2,k,muo1,mu0,nz)
+implicit none
+integer, intent(in) :: nz
+double precision, intent(in) :: z0(nz),u1,u2,k
+double precision, intent(out) :: muo1(nz),mu0(nz)
+double precision :: lambdad(nz),etad(nz),lambdae(nz),kap0(nz),kap1(nz)
+double precision :: p,pi,z,omega,q,Kk,Ek,lam_c,ellec,ellk
+double precision, allocatable, dimension(:) :: zc,x1,x2,x3,qc,Kc,Ec,nc,Pc,rjc,lamc
+logical :: is_c(nz)
+integer :: icase(nz), i, c, m
+  p = k
+  if(abs(p-0.5d0).lt.1.d-3) p=0.5d0
+  omega=1.d0-u1/3.d0-u2/6.d0
+  pi=acos(-1.d0)
+
+  !Case of each point, 1 -> I, 2 -> II, 3 -> V, 4 -> VI, 5 -> III, 6 -> IV
+  do i = 1, nz
+    z = z0(i)
+    if ( z >= 1.d0 + p ) then
+      icase(i) = 1
+    else if ( p >= 1.d0 .and. z <= p - 1.d0 ) then
+      icase(i) = 2
+    else if ( abs(z-p) < 1.d-4*(z+p) ) then
+      icase(i) = 4
+      if ( z >= 0.5d0 ) icase(i) = 3
+    else if ( (z > 0.5d0+abs(p-0.5d0) .and. z < 1.d0+p) .or. &
+              (p > 0.5d0 .and. z > abs(1.d0-p)*1.0001d0 .and. z < p) ) then
+      icase(i) = 5
+    else if ( p <= 1.d0 .and. z <= (1.d0-p)*1.0001d0 ) then
+      icase(i) = 6
+    else
+      icase(i) = 0
+    end if
+  end do
+
+  lambdad(:) = 0.d0
+  etad(:) = 0.d0
+  lambdae(:) = 0.d0
+  kap0(:) = 0.d0
+  kap1(:) = 0.d0
+  where ( icase == 2 )
+    lambdad = 1.d0
+    etad = 1.d0
+    lambdae = 1.d0
+  end where
+
+! Equation (26), lambda_e of the points that cross the limb
+  is_c(:) = icase /= 1 .and. icase /= 2
+  where ( is_c .and. z0 >= abs(1.d0-p) .and. z0 <= 1.d0+p )
+    kap1=acos(min((1.d0-p*p+z0*z0)/2.d0/z0,1.d0))
+    kap0=acos(min((p*p+z0*z0-1.d0)/2.d0/p/z0,1.d0))
+    lambdae=p*p*kap0+kap1
+    lambdae=(lambdae-0.5d0*sqrt(max(4.d0*z0*z0-(1.d0+z0*z0-p*p)**2,0.d0)))/pi
+  end where
+  where ( is_c .and. z0 <= 1.d0-p ) lambdae=p*p
+
+! Table 3, Case V., lambda_3 does not depend on z
+  if ( any( icase == 3 ) ) then
+    q=0.5d0/p
+    Kk=ellk(q)
+    Ek=ellec(q)
+    lam_c=1.d0/3.d0+16.d0*p/9.d0/pi*(2.d0*p*p-1.d0)*Ek-(32.d0*p**4-20.d0*p*p+3.d0)/9.d0/pi/p*Kk
+    where ( icase == 3 )
+      lambdad=lam_c
+      etad=1.d0/2.d0/pi*(kap1+p*p*(p*p+2.d0*z0*z0)*kap0-(1.d0+5.d0*p*p+z0*z0)/4.d0* &
+           sqrt((1.d0-(p-z0)**2)*((p+z0)**2-1.d0)))
+    end where
+    if ( p == 0.5d0 ) then
+! Case VIII: p=1/2, z=1/2
+      where ( icase == 3 )
+        lambdad=1.d0/3.d0-4.d0/pi/9.d0
+        etad=3.d0/32.d0
+      end where
+    end if
+  end if
+
+! Table 3, Case VI., lambda_4 does not depend on z
+  if ( any( icase == 4 ) ) then
+    q=2.d0*p
+    Kk=ellk(q)
+    Ek=ellec(q)
+    lam_c=1.d0/3.d0+2.d0/9.d0/pi*(4.d0*(2.d0*p*p-1.d0)*Ek+ (1.d0-4.d0*p*p)*Kk)
+    where ( icase == 4 )
+      lambdad=lam_c
+      etad=p*p/2.d0*(p*p+2.d0*z0*z0)
+    end where
+  end if
+
+! Table 3, Cases III and IV, the points of each case are packed
+  do c = 5, 6
+    is_c(:) = icase == c
+    m = count(is_c)
+    if ( m == 0 ) cycle
+    allocate(zc(m),x1(m),x2(m),x3(m),qc(m),Kc(m),Ec(m),nc(m),Pc(m),rjc(m),lamc(m))
+    zc = pack(z0,is_c)
+    x1=(p-zc)**2
+    x2=(p+zc)**2
+    x3=p**2-zc**2
+    if ( c == 5 ) then
+      qc=sqrt((1.d0-(p-zc)**2)/4.d0/zc/p)
+      nc=1.d0/x1-1.d0
+    else
+      qc=sqrt((x2-x1)/(1.d0-x1))
+      nc=x2/x1-1.d0
+    end if
+    call ellke_vec(qc,Kc,Ec,m)
+    call rj_vec(0.d0*qc,1.d0-qc*qc,1.d0+0.d0*qc,1.d0+nc,rjc,m)
+    Pc=Kc-nc/3.d0*rjc
+    if ( c == 5 ) then
+! Equation 34, lambda_1:
+      lamc=1.d0/9.d0/pi/sqrt(p*zc)*(((1.d0-x2)*(2.d0*x2+x1-3.d0)-3.d0*x3*(x2-2.d0))*Kc+ &
+           4.d0*p*zc*(zc*zc+ 7.d0*p*p-4.d0)*Ec-3.d0*x3/x1*Pc)
+      where ( zc < p ) lamc=lamc+2.d0/3.d0
+      lambdad = unpack(lamc,is_c,lambdad)
+! Equation 34, eta_1:
+      where ( is_c )
+        etad=1.d0/2.d0/pi*(kap1+p*p*(p*p+2.d0*z0*z0)*kap0-(1.d0+5.d0*p*p+z0*z0)/4.d0* &
+             sqrt((1.d0-(p-z0)**2)*((p+z0)**2-1.d0)))
+      end where
+    else
+! Equation 34, lambda_2:
+      lamc=2.d0/9.d0/pi/sqrt(1.d0-x1)*((1.d0-5.d0*zc*zc+p*p+x3*x3)*Kc+(1.d0-x1)*(zc*zc+7.d0*p*p-4.d0)*Ec-3.d0*x3/x1*Pc)
+      where ( zc < p ) lamc=lamc+2.d0/3.d0
+      lam_c=2/3.d0/pi*acos(1.d0-2.d0*p)-4.d0/9.d0/pi*sqrt(p*(1.d0-p))*(3.d0+2.d0*p-8.d0*p*p)
+      where ( abs(p+zc-1.d0) <= 1.d-4 ) lamc=lam_c
+      lambdad = unpack(lamc,is_c,lambdad)
+! Equation 34, eta_2:
+      where ( is_c ) etad=p*p/2.d0*(p*p+2.d0*z0*z0)
+    end if
+    deallocate(zc,x1,x2,x3,qc,Kc,Ec,nc,Pc,rjc,lamc)
+  end do
+
+! Now, using equation (33):
+  muo1=1.d0-((1.d0-u1-2.d0*u2)*lambdae+(u1+2.d0*u2)*lambdad+u2*etad)/omega
+! Equation 25:
+  mu0=1.d0-lambdae
+
+end subroutine
+
+!ellk and ellec for an array of k
+subroutine ellke_vec(k,ellk,ellec,n)
+implicit none
+integer, intent(in) :: n
+double precision, intent(in) :: k(n)
+double precision, intent(out) :: ellk(n), ellec(n)
+double precision :: m1(n)
+  m1=1.d0-k*k
+  ellec=1.d0+m1*(0.44325141463d0+m1*(0.06260601220d0+m1*(0.04757383546d0+m1*0.01736506451d0))) &
+        +m1*(0.24998368310d0+m1*(0.09200180037d0+m1*(0.04069697526d0+m1*0.00526449639d0)))*log(1.d0/m1)
+  ellk=1.38629436112d0+m1*(0.09666344259d0+m1*(0.03590092383d0+m1*(0.03742563713d0+m1*0.01451196212d0))) &
+       -(0.5d0+m1*(0.12498593597d0+m1*(0.06880248576d0+m1*(0.03328355346d0+m1*0.00441787012d0))))*log(m1)
+end subroutine
+
+!rj for arrays of x, y, z and p > 0. The points are computed in blocks
+!of nb, each point stops its iterations at the same step as in rj. The
+!weight w is 1 while a point iterates and 0 after, w*a+(1-w)*b selects
+!without branches so that gfortran vectorizes the loops
+subroutine rj_vec(x,y,z,p,rj,n)
+implicit none
+integer, intent(in) :: n
+double precision, intent(in), dimension(n) :: x, y, z, p
+double precision, intent(out) :: rj(n)
+integer, parameter :: nb = 32
+double precision, parameter :: ERRTOL=.05d0,TINY=2.5d-13,BIG=9.d11,C1=3.d0/14.d0, &
+      C2=1.d0/3.d0,C3=3.d0/22.d0,C4=3.d0/26.d0,C5=.75d0*C3,C6=1.5d0*C4,C7=.5d0*C2,C8=C3+C3
+double precision, dimension(nb) :: alamb,alpha,ave,beta,delp,delx,dely,delz,ea,eb,ec,ed,ee, &
+      fac,pt,sum,xt,yt,zt,rcv,w
+double precision :: sqrtx,sqrty,sqrtz
+integer :: i, j, m
+  if(any(min(x,y,z).lt.0.d0.or.min(x+y,x+z,y+z,abs(p)).lt.TINY.or.max(x,y,z,abs(p)).gt.BIG.or.p.le.0.d0)) then
+    print *, 'invalid argumets in rj_vec'
+    stop
+  end if
+  do j = 0, n - 1, nb
+    m = min(nb,n-j)
+    sum=0.d0
+    fac=1.d0
+    xt=1.d0
+    yt=1.d0
+    zt=1.d0
+    pt=1.d0
+    xt(1:m)=x(j+1:j+m)
+    yt(1:m)=y(j+1:j+m)
+    zt(1:m)=z(j+1:j+m)
+    pt(1:m)=p(j+1:j+m)
+    w(:)=0.d0
+    w(1:m)=1.d0
+    do while ( any(w > 0.d0) )
+      do i = 1, nb
+        sqrtx=sqrt(xt(i))
+        sqrty=sqrt(yt(i))
+        sqrtz=sqrt(zt(i))
+        alamb(i)=sqrtx*(sqrty+sqrtz)+sqrty*sqrtz
+        alpha(i)=(pt(i)*(sqrtx+sqrty+sqrtz)+sqrtx*sqrty*sqrtz)**2
+        beta(i)=pt(i)*(pt(i)+alamb(i))**2
+      end do
+      call rc_vec(alpha,beta,w,rcv,nb)
+      do i = 1, nb
+        sum(i)=w(i)*(sum(i)+fac(i)*rcv(i))+(1.d0-w(i))*sum(i)
+        fac(i)=w(i)*(.25d0*fac(i))+(1.d0-w(i))*fac(i)
+        xt(i)=w(i)*(.25d0*(xt(i)+alamb(i)))+(1.d0-w(i))*xt(i)
+        yt(i)=w(i)*(.25d0*(yt(i)+alamb(i)))+(1.d0-w(i))*yt(i)
+        zt(i)=w(i)*(.25d0*(zt(i)+alamb(i)))+(1.d0-w(i))*zt(i)
+        pt(i)=w(i)*(.25d0*(pt(i)+alamb(i)))+(1.d0-w(i))*pt(i)
+        ave(i)=.2d0*(xt(i)+yt(i)+zt(i)+pt(i)+pt(i))
+        delx(i)=(ave(i)-xt(i))/ave(i)
+        dely(i)=(ave(i)-yt(i))/ave(i)
+        delz(i)=(ave(i)-zt(i))/ave(i)
+        delp(i)=(ave(i)-pt(i))/ave(i)
+        w(i)=w(i)*(1.d0-max(0.d0,sign(1.d0,ERRTOL-max(abs(delx(i)),abs(dely(i)),abs(delz(i)),abs(delp(i))))))
+      end do
+    end do
+    ea=delx*(dely+delz)+dely*delz
+    eb=delx*dely*delz
+    ec=delp**2
+    ed=ea-3.d0*ec
+    ee=eb+2.d0*delp*(ea-ec)
+    rj(j+1:j+m)=3.d0*sum(1:m)+fac(1:m)*(1.d0+ed(1:m)*(-C1+C5*ed(1:m)-C6*ee(1:m))+eb(1:m)*(C7+delp(1:m)* &
+    (-C8+delp(1:m)*C4))+delp(1:m)*ea(1:m)*(C2-delp(1:m)*C3)-C2*delp(1:m)*ec(1:m))/(ave(1:m)*sqrt(ave(1:m)))
+  end do
+end subroutine
+
+!rc for arrays of x and y > 0, only for the points with weight w = 1.
+!Each point stops its iterations at the same step as in rc
+subroutine rc_vec(x,y,w0,rc,n)
+implicit none
+integer, intent(in) :: n
+double precision, intent(in), dimension(n) :: x, y, w0
+double precision, intent(out) :: rc(n)
+double precision, parameter :: ERRTOL=.04d0,THIRD=1.d0/3.d0,C1=.3d0,C2=1.d0/7.d0,C3=.375d0,C4=9.d0/22.d0
+double precision, dimension(n) :: ave,s,xt,yt,w
+double precision :: alamb
+integer :: i
+  w=w0
+  xt=w*x+(1.d0-w)
+  yt=w*y+(1.d0-w)
+  do while ( any(w > 0.d0) )
+    do i = 1, n
+      alamb=2.d0*sqrt(xt(i))*sqrt(yt(i))+yt(i)
+      xt(i)=w(i)*(.25d0*(xt(i)+alamb))+(1.d0-w(i))*xt(i)
+      yt(i)=w(i)*(.25d0*(yt(i)+alamb))+(1.d0-w(i))*yt(i)
+      ave(i)=THIRD*(xt(i)+yt(i)+yt(i))
+      s(i)=(yt(i)-ave(i))/ave(i)
+      w(i)=w(i)*(1.d0-max(0.d0,sign(1.d0,ERRTOL-abs(s(i)))))
+    end do
+  end do
+  rc=1.d0*(1.d0+s*s*(C1+s*(C2+s*(C3+s*C4))))/sqrt(ave)
+end subroutine
+
+subroutine qpower2(z0,k,c,a,muo1,nz)
+!  This routine computes the lightcurve for occultation of a source
+!  with the power-2 limb-darkening law, I(mu) = 1 - c ( 1 - mu^a ),
+!  with the analytic approximation qpower2 of Maxted & Gill (2019),
+!  A&A 622, A33. The error is less than about 100 ppm for k < 0.2.
+!  Input: z0 impact parameter in units of the stellar radius,
+!  k radius ratio, c and a (alpha) coefficients of the law
+!  Output: muo1 fraction of flux at each z0
+implicit none
+integer, intent(in) :: nz
+double precision, intent(in) :: z0(nz), k, c, a
+double precision, intent(out) :: muo1(nz)
+double precision :: pi, i0, g, z, zt, s, c0, c2, d, ra, rb, sa, sb, q, w2, w
+double precision :: b0, b1, b2, a0, a1, aq, j1, j2, d0, d1, k1, k2, eps
+integer :: i
+
+  pi = acos(-1.d0)
+  eps = epsilon(1.d0)
+  i0 = ( a + 2.d0 ) / ( pi * ( a - c * a + 2.d0 ) )
+  g = 0.5d0 * a
+
+  do i = 1, nz
+    z = abs(z0(i))
+    if ( z >= 1.d0 + k ) then
+      muo1(i) = 1.d0
+    else if ( z <= 1.d0 - k ) then
+      !The planet is inside the stellar disk, Eq. (7)
+      zt = z
+      s = 1.d0 - zt * zt
+      c0 = 1.d0 - c + c * s**g
+      c2 = 0.5d0 * a * c * s**(g - 2.d0) * ( ( a - 1.d0 ) * zt * zt - 1.d0 )
+      muo1(i) = 1.d0 - i0 * pi * k * k * ( c0 + 0.25d0 * k * k * c2 - 0.125d0 * a * c * k * k * s**(g - 1.d0) )
+    else
+      !Ingress and egress, Eqs. (8)-(15)
+      d = min( max( ( z * z - k * k + 1.d0 ) / ( 2.d0 * z ), 0.d0 ), 1.d0 )
+      ra = 0.5d0 * ( z - k + d )
+      rb = 0.5d0 * ( 1.d0 + d )
+      sa = min( max( 1.d0 - ra * ra, eps ), 1.d0 )
+      sb = min( max( 1.d0 - rb * rb, eps ), 1.d0 )
+      q = min( max( ( z - d ) / k, -1.d0 ), 1.d0 )
+      w2 = k * k - ( d - z )**2
+      w = sqrt( min( max( w2, eps ), 1.d0 ) )
+      b0 = 1.d0 - c + c * sa**g
+      b1 = - a * c * ra * sa**(g - 1.d0)
+      b2 = 0.5d0 * a * c * sa**(g - 2.d0) * ( ( a - 1.d0 ) * ra * ra - 1.d0 )
+      a0 = b0 + b1 * ( z - ra ) + b2 * ( z - ra )**2
+      a1 = b1 + 2.d0 * b2 * ( z - ra )
+      aq = acos(q)
+      j1 = ( a0 * ( d - z ) - 2.d0 / 3.d0 * a1 * w2 + 0.25d0 * b2 * ( d - z ) * ( 2.d0 * ( d - z )**2 - k * k ) ) * w &
+           + ( a0 * k * k + 0.25d0 * b2 * k**4 ) * aq
+      j2 = a * c * sa**(g - 1.d0) * k**4 * ( 0.125d0 * aq + q * ( q * q - 2.5d0 ) * sqrt( max( 1.d0 - q * q, 0.d0 ) ) / 12.d0 )
+      d0 = 1.d0 - c + c * sb**g
+      d1 = - a * c * rb * sb**(g - 1.d0)
+      k1 = ( d0 - rb * d1 ) * acos(d) + ( ( rb * d + 2.d0 / 3.d0 * ( 1.d0 - d * d ) ) * d1 - d * d0 ) &
+           * sqrt( max( 1.d0 - d * d, 0.d0 ) )
+      k2 = c * a * sb**(g + 0.5d0) * ( 1.d0 - d ) / 3.d0
+      muo1(i) = 1.d0 - i0 * ( j1 - j2 + k1 - k2 )
+    end if
+  end do
+
+end subroutine
+
       FUNCTION rc(x,y)
       REAL*8 rc,x,y,ERRTOL,TINY,SQRTNY,BIG,TNBG,COMP1,COMP2,THIRD,C1,C2,C3,C4
       PARAMETER (ERRTOL=.04d0,TINY=1.69d-38,SQRTNY=1.3d-19,BIG=3.d37, &
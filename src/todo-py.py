@@ -234,6 +234,25 @@ def create_transit_data(time,flux,errs,planet=0,span=0.0):
 
   return lt_out, xt_out, yt_out, et_out
 
+#Label of the light curve of the closest data point in megax to each time in x
+def cadence_labels(x):
+  x = np.atleast_1d(np.asarray(x,dtype=float))
+  order = np.argsort(megax)
+  xs = np.asarray(megax,dtype=float)[order]
+  j = np.searchsorted(xs,x).clip(0,len(xs)-1)
+  i = ( j - 1 ).clip(0,len(xs)-1)
+  j = np.where( abs(x - xs[i]) <= abs(xs[j] - x), i, j )
+  return np.asarray(trlab)[order[j]]
+
+#n_cad and t_cad for the model times x, each time takes the cadence of the
+#light curve of the closest data point in megax, or of the light curves in lab
+def cadence_arrays(x,lab=None):
+  if ( lab is None ):
+    lab = cadence_labels(x)
+  else:
+    lab = np.zeros(len(np.atleast_1d(x)),dtype=int) + lab
+  return np.asarray(n_cad)[lab].astype(np.int32), np.asarray(t_cad,dtype=float)[lab]
+
 #-----------------------------------------------------------
 # find_vals_perc -> find the median and the errors within
 #  a 68% credible interval
@@ -450,6 +469,88 @@ def clustering_fast(par,good_index,nconv):
 
   return cluster_par
 
+#-----------------------------------------------------------
+#read_chains -> opens a binary chain file written by the
+#sampler (see write_chain_header in mcmc.f90)
+#input: fname -> name of the chain file
+#output: names  -> list with the name of each column
+#        chains -> np.memmap with shape (rows,columns), the
+#                  values are only read from disk when used
+#-----------------------------------------------------------
+def read_chains(fname):
+
+  f = open(fname,'rb')
+  if ( f.read(8) != 'PTICHAIN' ):
+    f.close()
+    sys.exit('The file '+fname+' is not a pyaneti chain file')
+  version, nbytes, ncols = np.fromfile(f,dtype=np.int32,count=3)
+  names = [ f.read(24).strip() for o in range(0,ncols) ]
+  f.close()
+
+  offset = 8 + 3*4 + 24*ncols
+  nrows = ( os.path.getsize(fname) - offset ) / ( nbytes * ncols )
+  dtype = np.float64
+  if ( nbytes == 4 ):
+    dtype = np.float32
+
+  chains = np.memmap(fname,dtype=dtype,mode='r',offset=offset,shape=(nrows,ncols))
+
+  return names, chains
+
+#-----------------------------------------------------------
+#integrated_time -> integrated autocorrelation time of an
+#ensemble of chains, Foreman-Mackey et al. (2013), with the
+#automatic window of Sokal (1997), as integrated_time in todo.f90
+#input: x -> array with shape (steps,walkers)
+#       c -> the window is the smallest m with m >= c tau(m)
+#output: tau -> autocorrelation time in steps
+#-----------------------------------------------------------
+def integrated_time(x,c=5.0):
+
+  n = x.shape[0]
+  nfft = 1
+  while ( nfft < 2*n ):
+    nfft = 2 * nfft
+
+  f = np.fft.rfft(x - np.mean(x,axis=0),n=nfft,axis=0)
+  acf = np.fft.irfft(f*np.conjugate(f),axis=0)[:n]
+  #A stuck walker has no variance
+  good = acf[0] > 0.0
+  if ( not np.any(good) ):
+    return float(n)
+  acf = np.mean(acf[:,good]/acf[0,good],axis=1)
+
+  taus = 2.0*np.cumsum(acf) - 1.0
+  window = np.arange(n) >= c*taus
+  if ( np.any(window) ):
+    return taus[np.argmax(window)]
+  return taus[-1]
+
+#-----------------------------------------------------------
+#ti_evidence -> ln of the evidence by thermodynamic integration
+#of the mean ln likelihood of the tempered chains over beta,
+#Gregory (2005), Bayesian Logical Data Analysis
+#input: fname -> file with beta and <ln likelihood> created by
+#                the sampler when ntemps > 1
+#output: lnz -> ln evidence
+#        lnz_err -> error, difference with the integral that
+#                   uses only half of the temperatures
+#-----------------------------------------------------------
+def ti_evidence(fname):
+
+  betas, lnl = np.loadtxt(fname,comments='#',usecols=(0,1),unpack=True)
+
+  def integral(b,l):
+    #The integral goes from beta = 0 to 1
+    b = np.append(b,0.0)
+    l = np.append(l,l[-1])
+    return - np.trapz(l,b)
+
+  lnz = integral(betas,lnl)
+  lnz_err = abs( lnz - integral(betas[::2],lnl[::2]) )
+
+  return lnz, lnz_err
+
 #-----------------------------------------------------------
 def print_values(vector,var,vartex,unit,unittex):
 #fname is the variable where we are writting the numbers
@@ -471,8 +572,12 @@ def print_values(vector,var,vartex,unit,unittex):
 #-----------------------------------------------------------
 #         FIT JOINT RV-TRANSIT DATA
 #-----------------------------------------------------------
-def joint_fit():
-  global fit_all, fit_ldc, fit_rvs, nt
+#fit_setup -> creates the flags and prior limits of the fit
+#from the input file variables, they are global variables
+#used by joint_fit and init_logpost
+#-----------------------------------------------------------
+def fit_setup():
+  global fit_all, fit_ldc, fit_rvs, fit_trends, nt
   global a_from_kepler, mstar_mean, rstar_mean, mstar_sigma_rstar_sigma
   global is_log_P, is_ew, is_b_factor, is_log_k, is_log_rv0
   global fit_t0, fit_P, fit_e, fit_w, fit_i, fit_a,fit_q1, fit_q2, fit_rp, fit_k,fit_v0
@@ -484,6 +589,7 @@ def joint_fit():
   global new_nwalkers, good_index, nwalkers
   global jrvo, jtro, total_fit_flag, flags
   global limits, priorf, priorl, limits_ldc, limits_rvs
+  global stellar_pars, is_jitter, lin_pri
 
 
   if ( is_ew ):
@@ -515,7 +621,14 @@ def joint_fit():
   #Let us check what do we want to fit
   total_fit_flag = [ total_rv_fit, total_tr_fit ]
 
-  flags = [is_log_P,is_ew,is_b_factor,is_den_a,is_log_k,is_log_rv0]
+  if ( ld_law not in ['quadratic','power2'] ):
+    sys.exit('ld_law has to be quadratic or power2')
+
+  if ( integration not in ['uniform','gauss'] ):
+    sys.exit('integration has to be uniform or gauss')
+
+  flags = [is_log_P,is_ew,is_b_factor,is_den_a,is_log_k,is_log_rv0,ld_law == 'power2', \
+           integration == 'gauss']
 
 
   vec_rv0_limits = []
@@ -540,18 +653,447 @@ def joint_fit():
   stellar_pars = [mstar_mean,mstar_sigma,rstar_mean,rstar_sigma]
   is_jitter = [is_jitter_rv, is_jitter_tr]
 
-  if ( method == 'mcmc' ):
+  #Linear parameters of the RV model marginalized in the likelihood (see rv_linear)
+  #rv0 of each telescope, alpha, beta and K of each planet. lin_pri has the prior
+  #of each one, 1 -> uniform (min,max), 2 -> normal (mean,sigma), 0 -> sampled.
+  #The marginalized parameters are fixed for the sampler
+  for o in marginalize_linear:
+    if ( o not in ['rv0','trends','K'] ):
+      sys.exit('marginalize_linear can only have rv0, trends and K')
+  lin_pri = [0.0]*3*(nt+2+nplanets)
+  lin_fit = fit_rvs + fit_trends + [ fit_all[8*o+7] for o in range(0,nplanets) ]
+  lin_lims = limits_rvs + [-0.1,0.1]*2 + \
+             sum([ limits[2*(8*o+7):2*(8*o+7)+2] for o in range(0,nplanets) ],[])
+  lin_marg = [ 'rv0' in marginalize_linear and not is_log_rv0 ]*nt + \
+             [ 'trends' in marginalize_linear ]*2 + \
+             [ 'K' in marginalize_linear and not is_log_k ]*nplanets
+  for o in range(0,nt+2+nplanets):
+    if ( lin_marg[o] and lin_fit[o] in ['u','g'] ):
+      lin_pri[3*o:3*o+3] = [ 1.0 + ( lin_fit[o] == 'g' ) ] + lin_lims[2*o:2*o+2]
+      if ( o < nt ):
+        fit_rvs[o] = 'f'
+      elif ( o < nt + 2 ):
+        fit_trends[o-nt] = 'f'
+      else:
+        fit_all[8*(o-nt-2)+7] = 'f'
+
+  occult_setup()
+
+#-----------------------------------------------------------
+#occult_setup -> creates otab, the table of the occultation
+#functions used by flux_tr instead of occultquad (see
+#occult_table in ftr.f90), for the range of Rp/R* of the priors.
+#The table is refined until its maximum error is smaller than
+#occult_tol out of the bands next to z = p and z = 1 - p (see
+#test_points). otab = [0] if occult_tol = 0, if the target cannot
+#be reached or with the power-2 law, then occultquad is used
+#-----------------------------------------------------------
+def occult_setup():
+  global otab, otab_key
+
+  #Range of Rp/R* of the priors, the table is only valid for p < 0.5
+  prange = []
+  for o in range(0,nplanets):
+    if ( fit_rp[o] == 'g' ):
+      prange += [min_rp[o] - 6.*max_rp[o], min_rp[o] + 6.*max_rp[o]]
+    elif ( fit_rp[o] == 'f' ):
+      prange += [min_rp[o]]
+    else:
+      prange += [min_rp[o], max_rp[o]]
+  pmin = max(min(prange),1e-5)
+  pmax = min(max(prange),0.45)
+  if ( pmax - pmin < 1e-2 ):
+    pmin = max(pmin - 5e-3,1e-5)
+    pmax = pmax + 5e-3
+
+  key = (occult_tol,ld_law,pmin,pmax)
+  if ( 'otab_key' in globals() and otab_key == key ):
+    return
+  otab_key = key
+  otab = np.zeros(1)
+
+  if ( occult_tol <= 0.0 or not total_tr_fit or ld_law != 'quadratic' ):
+    return
+
+  if ( pmin >= pmax ):
+    print 'The Rp/R* priors are out of the range of the occultation table'
+    print 'occultquad will be used'
+    return
+
+  #The table is compared with occultquad at its nodes and at the midpoints
+  #between them (in sqrt(p) and in the angle of the z nodes), where the
+  #interpolation is worst, and at points clustered just out of the bands
+  #|z-p| < 3e-4 (z+p) and 1 - p - 3e-4 < z < 1 - p. occultquad uses
+  #approximations in the inner part of these bands and it is not
+  #accurate to ~1e-5 in the rest, the table is not checked there
+  def test_points(ns,npp):
+    d = np.array([3e-4,4e-4,5e-4,7e-4,1e-3,2e-3,5e-3,1e-2,2e-2])
+    ptest = np.linspace(np.sqrt(pmin),np.sqrt(pmax),2*npp-1)**2
+    ztest = []
+    for p in ptest:
+      b = [0.,min(p,1.-p),max(p,1.-p),1.+p]
+      t = 0.5 * ( 1. - np.cos(np.pi*np.linspace(0.,1.,2*ns-1)) )
+      z = np.concatenate([b[g] + (b[g+1]-b[g])*t for g in range(0,3)] + \
+                         [p*(1.-d)/(1.+d),p*(1.+d)/(1.-d),1.-p-d,1.-p+d])
+      z = z[(z >= 0.) & (z < 1.+p)]
+      ztest.append(z[(abs(z-p) >= 2.99e-4*(z+p)) & ((z <= 1.-p-2.99e-4) | (z > 1.-p))])
+    return ptest, ztest
+
+  ldcs = [[0.,0.],[1.,0.],[0.,1.],[2.,-1.]]
+
+  print 'Occultation table for Rp/R* in [%4.5f,%4.5f]'%(pmin,pmax)
+  for ns, npp in [[32,8],[64,16],[128,32],[256,64],[256,128],[512,128]]:
+    table = pti.occult_table(pmin,pmax,ns,npp)
+    ptest, ztest = test_points(ns,npp)
+    error = 0.0
+    for p, z in zip(ptest,ztest):
+      for u1, u2 in ldcs:
+        fq = pti.occultquad(z,u1,u2,p)[0]
+        ft = pti.occult_interp(z,u1,u2,p,table)
+        error = max(error,max(abs(ft-fq)))
+    print '  %3d x %3d nodes (z x p), max error = %1.2e'%(ns,npp,error)
+    if ( error < occult_tol ):
+      otab = table
+      print 'The transit model will use this table'
+      return
+
+  print 'WARNING: the occultation table cannot reach occult_tol = %1.1e'%occult_tol
+  print 'occultquad will be used'
+
+#-----------------------------------------------------------
+#ld_coefficients -> coefficients of the limb darkening law
+#from the fitted q1 and q2
+#output: u1, u2 for ld_law = 'quadratic', Kipping (2013)
+#        c, alpha for ld_law = 'power2', Short et al. (2019)
+#-----------------------------------------------------------
+def ld_coefficients(q1,q2):
+
+  q1 = np.asarray(q1)
+  q2 = np.asarray(q2)
+  if ( ld_law == 'power2' ):
+    h2 = 1. - np.sqrt(q1)
+    c = 1. - np.sqrt(q1) * q2
+    return c, np.log2(c/h2)
+  else:
+    return 2. * np.sqrt(q1) * q2, np.sqrt(q1) * (1. - 2.*q2)
+
+#-----------------------------------------------------------
+#integration_error -> maximum error of the transit model of
+#each light curve (n_cad, t_cad and integration) against a
+#model with 500 uniform sub-divisions, for transits with the
+#parameters at the centre of the priors of each planet
+#output: list with the error of each light curve
+#-----------------------------------------------------------
+def integration_error():
+
+  #centre of a prior, min_x is the mean of the gaussian priors
+  def mid(f,lo,hi):
+    if ( f in ['f','g'] ):
+      return lo
+    return 0.5 * ( lo + hi )
+
+  errors = [0.0]*nlc
+  u1, u2 = ld_coefficients(mid(fit_q1,min_q1,max_q1),mid(fit_q2,min_q2,max_q2))
+  for o in range(0,nplanets):
+    if ( not fit_tr[o] ):
+      continue
+    P = mid(fit_P[o],min_P[o],max_P[o])
+    if ( is_log_P ):
+      P = 10.0**P
+    if ( is_ew ):
+      ew1 = mid(fit_ew1[o],min_ew1[o],max_ew1[o])
+      ew2 = mid(fit_ew2[o],min_ew2[o],max_ew2[o])
+      e, w = ew1**2 + ew2**2, np.arctan2(ew1,ew2)
+    else:
+      e, w = mid(fit_e[o],min_e[o],max_e[o]), mid(fit_w[o],min_w[o],max_w[o])
+    if ( is_den_a ):
+      a = pti.rhotoa(mid(fit_a[0],min_a[0],max_a[0]),[P])[0]
+    else:
+      a = mid(fit_a[o],min_a[o],max_a[o])
+    if ( is_b_factor ):
+      i = pti.btoi([mid(fit_b[o],min_b[o],max_b[o])],[a],[e],[w])[0]
+    else:
+      i = mid(fit_i[o],min_i[o],max_i[o])
+    rp = mid(fit_rp[o],min_rp[o],max_rp[o])
+    pars = [pti.find_tp(0.0,e,w,P),P,e,w,i,a,rp]
+    for m in range(0,nlc):
+      if ( n_cad[m] < 2 ):
+        continue
+      #Times around the transit, T0 = 0
+      span = ( 1. + rp ) * P / np.pi / a * ( 1. + e ) / np.sqrt(1. - e**2) + t_cad[m]
+      x = np.linspace(-span,span,2001)
+      f = pti.flux_tr(x,pars,[u1,u2],ld_law == 'power2',integration == 'gauss', \
+                      [n_cad[m]]*len(x),[t_cad[m]]*len(x),np.zeros(1),cad_tol)
+      fr = pti.flux_tr(x,pars,[u1,u2],ld_law == 'power2',False, \
+                       [500]*len(x),[t_cad[m]]*len(x),np.zeros(1),0.0)
+      errors[m] = max(errors[m],max(abs(f-fr)))
+
+  return errors
+
+#-----------------------------------------------------------
+#linear_posterior -> replaces the linear parameters marginalized
+#in the likelihood (see lin_pri in fit_setup) in a chain file by
+#draws of their posterior given the other parameters of each row
+#input: fname -> binary chain file
+#-----------------------------------------------------------
+def linear_posterior(fname):
+
+  if ( not os.path.isfile(fname) or max(lin_pri[0::3]) == 0.0 ):
+    return
+
+  names, chains = read_chains(fname)
+  chains = np.memmap(chains.filename,dtype=chains.dtype,mode='r+', \
+                     offset=chains.offset,shape=chains.shape)
+  rs = np.random.RandomState(seed if seed > 0 else None)
+  nlin = nt + 2 + nplanets
+  #In blocks, the chain files can be large
+  for i in range(0,chains.shape[0],100000):
+    x = np.asfortranarray(chains[i:i+100000,5:],dtype=float)
+    z = np.asfortranarray(rs.normal(size=(x.shape[0],nlin)))
+    pti.linear_draws(mega_time,mega_rv,mega_err,tlab,jrvlab,flags,lin_pri,x,z, \
+                     npl=nplanets,n_tel=nt,n_jrv=n_jrv)
+    chains[i:i+100000,5:] = x
+  chains.flush()
+  del chains
+
+#-----------------------------------------------------------
+#par_names -> names of the parameters of a walker, as in the
+#columns of the chain files after the first five
+#-----------------------------------------------------------
+def par_names():
+
+  pnames = ['T0','P','e','w','i','a','rp','K']
+  if ( is_log_P ): pnames[1] = 'log10P'
+  if ( is_ew ): pnames[2:4] = ['sqrte_sinw','sqrte_cosw']
+  if ( is_b_factor ): pnames[4] = 'b'
+  if ( is_den_a ): pnames[5] = 'rho^1/3'
+  if ( is_log_k ): pnames[7] = 'log10K'
+  names = []
+  for o in range(0,nplanets):
+    names = names + [ m+'_'+chr(ord('b')+o) for m in pnames ]
+  names = names + ['q1','q2'] + [ 'rv0_'+str(o) for o in range(0,nt) ] + ['alpha','beta']
+  names = names + [ 'jrv_'+str(o) for o in range(0,n_jrv) ] + ['jtr']
+
+  return names
+
+#-----------------------------------------------------------
+#warm_start -> initial walkers from the posterior of a
+#previous run. The samples are mapped by name onto the
+#parameters of this fit, changing the parametrization if it
+#is needed (log10P, sqrte_sinw, b, rho^1/3, log10K)
+#input: fname  -> binary chain file of the previous run
+#       nwalks -> number of walkers
+#output: x_init -> walkers with the parameters of par_names
+#        w_init -> 1 for the parameters taken from the previous
+#                  run, the others are drawn from the priors
+#-----------------------------------------------------------
+def warm_start(fname,nwalks):
+
+  old_names, chains = read_chains(fname)
+  rs = np.random.RandomState(seed if seed > 0 else None)
+  rows = rs.choice(chains.shape[0],nwalks,replace=(chains.shape[0] < nwalks))
+  old = dict( (n, np.asarray(chains[rows,o],dtype=float)) for o, n in enumerate(old_names) )
+
+  def col(n):
+    return old[n] if n in old else np.nan*np.ones(nwalks)
+
+  #a = rho^1/3 * ac(P), as in rhotoa
+  def ac(P):
+    return (6.67508e-11*1.e3*P*P*7464960000./3.0/np.pi)**(1./3.)
+
+  names = par_names()
+  x_init = np.array([ col(n) for n in names ]).T
+  old_err = np.seterr(all='ignore')
+  for m in range(0,nplanets):
+    l = '_'+chr(ord('b')+m)
+    #Physical parameters of the previous run
+    P = col('P'+l) if 'P'+l in old else 10**col('log10P'+l)
+    if ( 'e'+l in old ):
+      e, w = col('e'+l), col('w'+l)
+    else:
+      es, ec = col('sqrte_sinw'+l), col('sqrte_cosw'+l)
+      e, w = es*es + ec*ec, np.arctan2(es,ec)
+    a = col('a'+l) if 'a'+l in old else col('rho^1/3'+l)*ac(P)
+    if ( 'i'+l in old ):
+      i = col('i'+l)
+    else:
+      i = np.arccos(col('b'+l)/a*(1.+e*np.sin(w))/(1.-e*e))
+    K = col('K'+l) if 'K'+l in old else 10**col('log10K'+l)
+    #And in the parametrization of this fit
+    new = { 'P' : P, 'log10P' : np.log10(P), 'e' : e, 'w' : w,
+            'sqrte_sinw' : np.sqrt(e)*np.sin(w), 'sqrte_cosw' : np.sqrt(e)*np.cos(w),
+            'i' : i, 'b' : a*np.cos(i)*(1.-e*e)/(1.+e*np.sin(w)),
+            'a' : a, 'rho^1/3' : a/ac(P), 'K' : K, 'log10K' : np.log10(K) }
+    for o in range(8*m,8*m+8):
+      base = names[o][:-2]
+      if ( base in new ):
+        x_init[:,o] = new[base]
+  np.seterr(**old_err)
+
+  #The values outside the uniform priors of this fit are drawn again
+  fits = fit_all + fit_ldc + fit_rvs
+  lims = limits + limits_ldc + limits_rvs
+  for o in range(0,len(fits)):
+    if ( fits[o] == 'u' ):
+      bad = ( x_init[:,o] < lims[2*o] ) | ( x_init[:,o] > lims[2*o+1] )
+      x_init[bad,o] = np.nan
+
+  #A parameter fixed in the previous run would be the same for all the walkers,
+  #the stretch move cannot explore it
+  for o in range(0,len(names)):
+    if ( np.ptp(x_init[:,o]) == 0.0 ):
+      x_init[:,o] = np.nan
+
+  w_init = np.isfinite(x_init)
+  x_init[~w_init] = 0.0
+  is_free = [ o != 'f' for o in fits + fit_trends ] + [is_jitter_rv]*n_jrv + [is_jitter_tr]
+  missing = [ n for o, n in enumerate(names) if is_free[o] and not np.any(w_init[:,o]) ]
+  print 'Initial walkers from', fname
+  if ( len(missing) > 0 ):
+    print 'Parameters drawn from the priors:', ' '.join(missing)
+
+  return x_init, w_init.astype(int)
+
+#-----------------------------------------------------------
+#init_logpost -> converts the data and the configuration of
+#the fit to Fortran arrays once, and returns a function that
+#evaluates the ln posterior of many points with a single call
+#to get_logpost_batch (in parallel with the OpenMP build).
+#It allows to use the pyaneti models with other samplers
+#output: names   -> names of the free parameters
+#        logpost -> function logpost(x), x has shape
+#                   (n_points,len(names)), it returns the arrays
+#                   log_prior, loglike, chi2_rv and chi2_tr,
+#                   log_prior = loglike = -inf outside the priors
+#-----------------------------------------------------------
+def init_logpost():
+
+  fit_setup()
+
+  names = par_names()
+
+  #Fixed parameters take the lower limit, as in create_chains
+  fits = fit_all + fit_ldc + fit_rvs + fit_trends
+  lims = limits + limits_ldc + limits_rvs + [0.0]*4
+  x_fix = np.array(lims[0::2] + [0.0]*(n_jrv+1))
+  is_free = [ o != 'f' for o in fits ] + [is_jitter_rv]*n_jrv + [is_jitter_tr]
+  free = np.where(is_free)[0]
+
+  #The arrays are only created once
+  args = [ np.asarray(mega_time,dtype=float), np.asarray(mega_rv,dtype=float),
+           np.asarray(megax,dtype=float), np.asarray(megay,dtype=float),
+           np.asarray(mega_err,dtype=float), np.asarray(megae,dtype=float),
+           np.asarray(tlab,dtype=np.int32), np.asarray(jrvlab,dtype=np.int32),
+           np.asarray(total_fit_flag,dtype=np.int32), np.asarray(flags,dtype=np.int32),
+           np.asarray(lin_pri,dtype=float),
+           np.asarray(mega_tcad,dtype=float), np.asarray(mega_ncad,dtype=np.int32),
+           otab, cad_tol, np.asarray(fit_all,dtype='S1'), np.asarray(fit_ldc,dtype='S1'),
+           np.asarray(limits,dtype=float), np.asarray(limits_ldc,dtype=float),
+           np.asarray(a_from_kepler,dtype=np.int32), np.asarray(stellar_pars,dtype=float) ]
+
+  def logpost(x):
+    x = np.atleast_2d(x)
+    x_all = np.tile(x_fix,(x.shape[0],1))
+    x_all[:,free] = x
+    log_prior, loglike, chi2_rv, chi2_tr, is_good = \
+    pti.get_logpost_batch(*(args+[np.asfortranarray(x_all)]), \
+                          npl=nplanets,n_tel=nt,n_jrv=n_jrv)
+    log_prior[is_good == 0] = -np.inf
+    loglike[is_good == 0] = -np.inf
+    return log_prior, loglike, chi2_rv, chi2_tr
+
+  return [ names[o] for o in free ], logpost
+
+#-----------------------------------------------------------
+def joint_fit():
+  global nwalkers
+
+  fit_setup()
+
+  if ( method == 'mcmc' or method == 'resume' ):
 
     #Ensure nwalkers is divisible by 2
     if ( nwalkers%2 != 0):
          nwalkers = nwalkers + 1
 
+    chk_file = outdir+'/'+star+'_checkpoint.dat'
+    is_resume = ( method == 'resume' )
+    if ( is_resume and not os.path.isfile(chk_file) ):
+      print 'There is not a checkpoint file', chk_file
+      sys.exit('I cannot resume this run.')
+
+    #Remove the rows written after the checkpoint from the stream file
+    stream_file = outdir+'/'+star+'_chains.bin'
+    if ( is_resume and os.path.isfile(stream_file) ):
+      f = open(chk_file,'rb')
+      f.seek(5*4)
+      chain_size = np.fromfile(f,dtype=np.int64,count=1)[0]
+      f.close()
+      f = open(stream_file,'r+b')
+      f.truncate(chain_size)
+      f.close()
+
+    nbytes = 8
+    if ( chain_precision == 'single' ):
+      nbytes = 4
+
+    #Weights of the proposal moves, in the order expected by mcmc_stretch_move
+    move_names = ['stretch','de','walk','snooker']
+    for m in sampler_moves:
+      if ( m not in move_names ):
+        print 'The move', m, 'is not available, use', move_names
+        sys.exit('Check sampler_moves in your input file')
+    move_weights = [ sampler_moves.get(m,0.0) for m in move_names ]
+    if ( sum(move_weights) <= 0.0 or min(move_weights) < 0.0 ):
+      sys.exit('The weights of sampler_moves have to be positive')
+
+    #Convergence test, in the order expected by mcmc_stretch_move
+    cvg_names = ['gr','tau']
+    if ( convergence not in cvg_names ):
+      sys.exit('convergence has to be '+' or '.join(cvg_names))
+    cvg_test = cvg_names.index(convergence)
+
+    #Initial walkers from a previous run
+    ndim = 8*nplanets + 2 + nt + 2 + n_jrv + 1
+    x_init = np.zeros((nwalkers,ndim))
+    w_init = np.zeros((nwalkers,ndim),dtype=int)
+    if ( len(init_from) > 0 and not is_resume ):
+      init_file = init_from
+      if ( not os.path.isfile(init_file) ):
+        init_file = os.path.dirname(outdir)+'/'+init_from+'_out/'+init_from+'_all_data.bin'
+      if ( not os.path.isfile(init_file) ):
+        print 'There is not a chain file for', init_from
+        sys.exit('Set init_from to a _all_data.bin file or to the star of a previous run')
+      x_init, w_init = warm_start(init_file,nwalkers)
+
     pti.mcmc_stretch_move(\
     mega_time,mega_rv,megax,megay,mega_err,megae, \
-    tlab,jrvlab,stellar_pars,a_from_kepler,\
+    tlab,jrvlab,outdir+'/'+star,stellar_pars,a_from_kepler,\
     flags,total_fit_flag,is_jitter,fit_all,fit_rvs,fit_ldc,fit_trends, \
-    nwalkers,maxi,thin_factor,nconv, limits, limits_rvs, \
-    limits_ldc,n_cad, t_cad, npl=nplanets,n_tel=nt,n_jrv=n_jrv)
+    maxi,thin_factor,nconv, cvg_test, tau_factor, seed, move_weights, is_adapt_stretch, acceptance_band, stuck_factor, map_starts, x_init, w_init, ntemps, t_max, checkpoint_every, is_resume, is_stream_chains, \
+    is_text_chains, nbytes, \
+    limits, limits_rvs, limits_ldc, lin_pri, mega_ncad, mega_tcad, otab, cad_tol, nwalks=nwalkers,npl=nplanets,n_tel=nt,n_jrv=n_jrv)
+
+    linear_posterior(outdir+'/'+star+'_all_data.bin')
+
+  elif ( method == 'nested' ):
+
+    nbytes = 8
+    if ( chain_precision == 'single' ):
+      nbytes = 4
+
+    if ( nested_batch < 1 or nested_batch >= nlive ):
+      sys.exit('nested_batch has to be between 1 and nlive - 1')
+
+    pti.nested_sampling(\
+    mega_time,mega_rv,megax,megay,mega_err,megae, \
+    tlab,jrvlab,outdir+'/'+star,stellar_pars,a_from_kepler,\
+    flags,total_fit_flag,is_jitter,fit_all,fit_rvs,fit_ldc,fit_trends, \
+    nlive,nested_batch,nested_walks,dlogz,maxi,seed,nbytes,nwalkers,nconv, \
+    limits, limits_rvs, limits_ldc, lin_pri, mega_ncad, mega_tcad, otab, cad_tol, npl=nplanets,n_tel=nt,n_jrv=n_jrv)
+
+    linear_posterior(outdir+'/'+star+'_all_data.bin')
+    linear_posterior(outdir+'/'+star+'_nested.bin')
 
   elif ( method == 'plot' ):
     print 'I will only print the values and generate the plot'
@@ -559,6 +1101,8 @@ def joint_fit():
   else:
     print 'You did not choose a method!'
     print 'method = mcmc   -> Run the MCMC code'
+    print 'method = resume -> Continue a MCMC run from its checkpoint'
+    print 'method = nested -> Run nested sampling'
     print 'method = plot   -> Plot of a previous run'
     sys.exit('choose your favorite.')
 
@@ -597,9 +1141,13 @@ def print_init():
   oif.write ('fit Transit    = %s\n' %fit_tr)
   oif.write ('------------------------------\n')
   if ( total_tr_fit ):
-    oif.write ('LC data        = %s\n' %lc_data)
-    oif.write ('cadence time   =  %2.3f min\n'%(t_cad*60.*24))
-    oif.write ('n rebinning    = %d\n' %n_cad)
+    errors = integration_error()
+    for o in range(0,nlc):
+      oif.write ('LC data        = %s\n' %lc_data[o])
+      oif.write ('cadence time   =  %2.3f min\n'%(t_cad[o]*60.*24))
+      oif.write ('n rebinning    = %d\n' %n_cad[o])
+      if ( n_cad[o] > 1 ):
+        oif.write ('integration    = %s, error = %1.1e\n' %(integration,errors[o]))
     oif.write ('Stellar priors = %s\n' %a_from_kepler)
   for j in range(0,nplanets):
     oif.write ('------------------------------\n')
@@ -691,12 +1239,14 @@ def create_tango_input():
   tf.write(tango_params('a',ar_vec))
   tf.write(tango_params('inclination',i_vec))
   tf.write(tango_params('rp',rr_vec))
-  tf.write(tango_params('u1',[u1_vec],False))
-  tf.write(tango_params('u2',[u2_vec],False))
-
-##Integration time of the data
-  tf.write('t_cad = ' + str(t_cad) +' \n')
-  tf.write('n_cad = ' + str(n_cad) +' \n')
+  #tango only has the quadratic law
+  if ( ld_law == 'quadratic' ):
+    tf.write(tango_params('u1',[u1_vec],False))
+    tf.write(tango_params('u2',[u2_vec],False))
+
+##Integration time of the data, tango takes the one of the first light curve
+  tf.write('t_cad = ' + str(t_cad[0]) +' \n')
+  tf.write('n_cad = ' + str(n_cad[0]) +' \n')
 
   tf.write('\n')
 
@@ -7,21 +7,101 @@
 !              Date --> Feb  2016, Oscar Barragán
 !------------------------------------------------------------
 
-!http://stackoverflow.com/questions/18754438/generating-random-numbers-in-a-fortran-module
-subroutine init_random_seed()
+!Philox4x32-10 counter-based generator, Salmon et al., 2011
+!Parallel random numbers: as easy as 1, 2, 3, SC11
+!The 32-bit words are stored in 64-bit integers
+subroutine philox4x32(ctr,key,rnd)
+implicit none
+
+!In/Out variables
+  integer(kind=8), intent(in) :: ctr(0:3), key(0:1)
+  integer(kind=8), intent(out) :: rnd(0:3)
+!Local variables
+  integer(kind=8), parameter :: mask = 4294967295_8
+  integer(kind=8), parameter :: m0 = 3528531795_8, m1 = 3449720151_8
+  integer(kind=8), parameter :: w0 = 2654435769_8, w1 = 3144134277_8
+  integer(kind=8) :: k(0:1), hi0, lo0, hi1, lo1
+  integer :: i
+
+  rnd(:) = ctr(:)
+  k(:) = key(:)
+  do i = 1, 10
+    call mulhilo32(m0,rnd(0),hi0,lo0)
+    call mulhilo32(m1,rnd(2),hi1,lo1)
+    rnd(0) = ieor( ieor(hi1,rnd(1)), k(0) )
+    rnd(1) = lo1
+    rnd(2) = ieor( ieor(hi0,rnd(3)), k(1) )
+    rnd(3) = lo0
+    k(0) = iand( k(0) + w0, mask )
+    k(1) = iand( k(1) + w1, mask )
+  end do
+
+end subroutine
+
+!High and low 32-bit words of the product of two 32-bit words
+subroutine mulhilo32(a,b,hi,lo)
+implicit none
+
+!In/Out variables
+  integer(kind=8), intent(in) :: a, b
+  integer(kind=8), intent(out) :: hi, lo
+!Local variables
+  integer(kind=8), parameter :: mask = 4294967295_8, mask16 = 65535_8
+  integer(kind=8) :: t, mid
+
+  !Split b in two 16-bit words to avoid the overflow of the 64-bit product
+  mid = a * ishft(b,-16)
+  t = a * iand(b,mask16) + ishft(iand(mid,mask16),16)
+  hi = ishft(mid,-16) + ishft(t,-32)
+  lo = iand(t,mask)
+
+end subroutine
+
+!Random streams: rng(0:1) is the key (seed, stream) and rng(2:5)
+!the counter (block, iteration, 0, 0) of philox4x32. The numbers
+!of a stream only depend on the seed, the stream and the iteration,
+!so each walker has its own stream and the runs are reproducible
+!for any number of threads
+subroutine rng_init(rng,seed,stream,iter)
+implicit none
 
-      INTEGER :: i, n, clock
-      INTEGER, DIMENSION(:), ALLOCATABLE :: seed
+!In/Out variables
+  integer, intent(in) :: seed, stream, iter
+  integer(kind=8), intent(out) :: rng(0:5)
+!Local variables
+  integer(kind=8), parameter :: mask = 4294967295_8
 
-      CALL RANDOM_SEED(size = n)
-      ALLOCATE(seed(n))
+  rng(0) = iand( int(seed,8), mask )
+  rng(1) = int(stream,8)
+  rng(2) = 0
+  rng(3) = int(iter,8)
+  rng(4:5) = 0
 
-      CALL SYSTEM_CLOCK(COUNT=clock)
+end subroutine
 
-      seed = clock + 37 * (/ (i - 1, i = 1, n) /)
-      CALL RANDOM_SEED(PUT = seed)
+!n uniform numbers in (0,1) with 53 random bits from the stream rng
+subroutine rng_uniform(rng,u,n)
+implicit none
 
-      DEALLOCATE(seed)
+!In/Out variables
+  integer, intent(in) :: n
+  integer(kind=8), intent(inout) :: rng(0:5)
+  double precision, intent(out) :: u(0:n-1)
+!Local variables
+  integer(kind=8) :: rnd(0:3)
+  double precision, parameter :: two26 = 67108864.d0, two53 = 9007199254740992.d0
+  integer :: i
+
+  do i = 0, n - 1
+    !Each block of four words gives two numbers
+    if ( mod(i,2) == 0 ) then
+      call philox4x32(rng(2:5),rng(0:1),rnd)
+      rng(2) = rng(2) + 1
+      u(i) = ( dble(ishft(rnd(0),-5)) * two26 + dble(ishft(rnd(1),-6)) + 0.5d0 ) / two53
+    else
+      u(i) = ( dble(ishft(rnd(2),-5)) * two26 + dble(ishft(rnd(3),-6)) + 0.5d0 ) / two53
+    end if
+  end do
 
 end subroutine
 
@@ -53,12 +133,87 @@ end subroutine
 
 !------------------------------------------------------------
 !This subroutine finds the true anomaly of an eccentric orbit
-!by using the Newton-Raphson (NR)  algorithm
+!The eccentric anomaly is found with the starter of Markley (1995),
+!CeMDA, 63, 101, and one fifth-order correction, this gives
+!|E - e sin E - M| ~ 1e-14 for e <= 0.99 (~2e-13 for e = 0.9999) with a
+!fixed number of operations (see find_anomaly_tp_nr for the Newton-Raphson
+!version)
 !The input parameters are:
-! man -> mean anomaly, ec -> eccentricity, delta -> NR limit
-! imax -> iteration limit for NR, dman -> man dimension
+! t -> time stamps, tp -> time of periastron, e -> eccentricity
+! P -> period, dt -> t dimension
 !The output parameters are:
-! ta -> True anomaly (vector with the same dimension that man)
+! ta -> True anomaly (vector with the same dimension that t)
+!------------------------------------------------------------
+subroutine find_anomaly_tp(t,tp,e,P,ta,dt)
+implicit none
+!In/Out variables
+  integer, intent(in) :: dt
+  double precision, intent(in) , dimension(0:dt-1) :: t
+  double precision, intent(out), dimension(0:dt-1) :: ta
+  double precision, intent(in) :: tp, e, P
+!Local variables
+  double precision, dimension(0:dt-1) :: ma, ea, sgn, alpha, d, r, q, w
+  double precision, dimension(0:dt-1) :: f0, f1, f2, d3, d4, se, ce
+  double precision :: pi = 3.1415926535897932384626d0
+  double precision :: ome, fac1, fac2
+  double precision :: small = 1.d-5
+!
+  !Calculate the mean anomaly
+  ma = 2.d0 * pi * ( t - tp ) / P
+
+  if ( e > small ) then !You have to calcuate your true anomaly, your orbit is not circular!
+
+    !The mean anomaly goes to [0,pi], the other half of the orbit is symmetric
+    !The array operations are kept apart so that sin and cos are vectorized
+    ma(:) = ma(:) - 2.d0 * pi * anint( ma(:) / ( 2.d0 * pi ) )
+    sgn(:) = sign(1.d0,ma(:))
+    ma(:) = abs(ma(:))
+
+    !Starter, Eq. (20) of Markley (1995)
+    ome = 1.d0 - e
+    fac1 = 3.d0 * pi / ( pi - 6.d0 / pi )
+    fac2 = 1.6d0 / ( pi - 6.d0 / pi )
+    alpha(:) = fac1 + fac2 * ( pi - ma(:) ) / ( 1.d0 + e )
+    d(:) = 3.d0 * ome + alpha(:) * e
+    r(:) = ( 3.d0 * alpha(:) * d(:) * ( d(:) - ome ) + ma(:) * ma(:) ) * ma(:)
+    q(:) = 2.d0 * alpha(:) * d(:) * ome - ma(:) * ma(:)
+    w(:) = ( abs(r(:)) + sqrt( q(:) * q(:) * q(:) + r(:) * r(:) ) )**(2.d0/3.d0)
+    ea(:) = ( 2.d0 * r(:) * w(:) / ( w(:) * w(:) + w(:) * q(:) + q(:) * q(:) ) + ma(:) ) / d(:)
+
+    !Fifth-order correction, Eqs. (21)-(25), f3 = 1 - f1 = e cos(ea)
+    se(:) = sin(ea(:))
+    ce(:) = cos(ea(:))
+    f0(:) = ea(:) - e * se(:) - ma(:)
+    f1(:) = 1.d0 - e * ce(:)
+    f2(:) = e * se(:)
+    d3(:) = - f0(:) / ( f1(:) - 0.5d0 * f0(:) * f2(:) / f1(:) )
+    d4(:) = - f0(:) / ( f1(:) + 0.5d0 * d3(:) * f2(:) + d3(:) * d3(:) * e * ce(:) / 6.d0 )
+    ea(:) = ea(:) - f0(:) / ( f1(:) + 0.5d0 * d4(:) * f2(:) + d4(:) * d4(:) * e * ce(:) / 6.d0 &
+            - d4(:) * d4(:) * d4(:) * f2(:) / 24.d0 )
+
+    !calculate the true anomaly
+    !tan(ta) = sqrt(1-e^2) sin (ea) / ( cos(ea) - e ) https://en.wikipedia.org/wiki/True_anomaly
+    se(:) = sin(ea(:))
+    ce(:) = cos(ea(:))
+    ta(:) = sgn(:) * atan2( sqrt(1.d0 - e*e) * se(:), ce(:) - e )
+
+  else
+
+    !If your orbit is cirular, your true anomaly is the mean anomaly ;)
+    ta(:) = ma(:)
+
+  end if
+
+end subroutine
+
+!------------------------------------------------------------
+!This subroutine finds the true anomaly of an eccentric orbit
+!from the time of transit t0 with find_anomaly_tp
+!The input parameters are:
+! t -> time stamps, t0 -> time of transit, e -> eccentricity
+! w -> periastron, P -> period, dt -> t dimension
+!The output parameters are:
+! ta -> True anomaly (vector with the same dimension that t)
 !------------------------------------------------------------
 subroutine find_anomaly(t,t0,e,w,P,ta,dt)
 implicit none
@@ -78,13 +233,14 @@ end subroutine
 !------------------------------------------------------------
 !This subroutine finds the true anomaly of an eccentric orbit
 !by using the Newton-Raphson (NR)  algorithm
+!It is the reference of find_anomaly_tp, that is faster
 !The input parameters are:
 ! man -> mean anomaly, ec -> eccentricity, delta -> NR limit
 ! imax -> iteration limit for NR, dman -> man dimension
 !The output parameters are:
 ! ta -> True anomaly (vector with the same dimension that man)
 !------------------------------------------------------------
-subroutine find_anomaly_tp(t,tp,e,P,ta,dt)
+subroutine find_anomaly_tp_nr(t,tp,e,P,ta,dt)
 implicit none
 !In/Out variables
   integer, intent(in) :: dt
@@ -224,21 +380,136 @@ implicit none
 
 end subroutine
 
+!Integrated autocorrelation time of an ensemble of chains
+!The autocorrelation function of each chain is computed by FFT
+!and averaged over the chains, the sum is cut with the automatic
+!window of Sokal (1997) as in Foreman-Mackey et al., 2013
+!tau is given in steps of the chains
+subroutine integrated_time(par_chains,nchains,nconv,tau)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: nchains, nconv
+  double precision, intent(in), dimension(0:nchains-1,0:nconv-1) :: par_chains
+  double precision, intent(out) :: tau
+!Local variables
+  complex(kind=8), allocatable, dimension(:) :: f
+  double precision, dimension(0:nconv-1) :: acf, taus
+  double precision :: mu, c = 5.d0
+  integer :: i, m, nfft, ngood
+
+  !zero padding to avoid the circular correlation
+  nfft = 1
+  do while ( nfft < 2*nconv )
+    nfft = 2 * nfft
+  end do
+  allocate( f(0:nfft-1) )
+
+  acf(:) = 0.d0
+  ngood = 0
+  do i = 0, nchains - 1
+    mu = sum(par_chains(i,:)) / nconv
+    f(:) = (0.d0,0.d0)
+    f(0:nconv-1) = par_chains(i,:) - mu
+    call fft(f,nfft,-1)
+    f(:) = f(:) * conjg(f(:))
+    call fft(f,nfft,1)
+    !A stuck chain has no variance
+    if ( dble(f(0)) > 0.d0 ) then
+      acf(:) = acf(:) + dble(f(0:nconv-1)) / dble(f(0))
+      ngood = ngood + 1
+    end if
+  end do
+
+  deallocate(f)
+
+  if ( ngood == 0 ) then
+    tau = dble(nconv)
+    return
+  end if
+
+  acf(:) = acf(:) / ngood
+  taus(0) = 1.d0
+  do m = 1, nconv - 1
+    taus(m) = taus(m-1) + 2.d0 * acf(m)
+  end do
+
+  !Smallest window m with m >= c * tau(m)
+  tau = taus(nconv-1)
+  do m = 1, nconv - 1
+    if ( dble(m) >= c * taus(m) ) then
+      tau = taus(m)
+      exit
+    end if
+  end do
+
+end subroutine
+
+!In place radix-2 fast Fourier transform, n has to be a power of 2
+!isign = -1 for the forward transform, isign = 1 for the
+!inverse one (without the 1/n normalization)
+subroutine fft(f,n,isign)
+implicit none
+
+!In/Out variables
+  integer, intent(in) :: n, isign
+  complex(kind=8), intent(inout), dimension(0:n-1) :: f
+!Local variables
+  double precision, parameter :: pi = 3.1415926535897932384626d0
+  complex(kind=8) :: w, wm, t
+  integer :: i, j, k, m, half
+
+  !bit reversal permutation
+  j = 0
+  do i = 0, n - 2
+    if ( i < j ) then
+      t = f(i)
+      f(i) = f(j)
+      f(j) = t
+    end if
+    k = n / 2
+    do while ( k <= j )
+      j = j - k
+      k = k / 2
+    end do
+    j = j + k
+  end do
+
+  !butterflies
+  m = 2
+  do while ( m <= n )
+    half = m / 2
+    wm = exp( cmplx(0.d0,isign*2.d0*pi/m,kind=8) )
+    do k = 0, n - 1, m
+      w = (1.d0,0.d0)
+      do j = 0, half - 1
+        t = w * f(k+j+half)
+        f(k+j+half) = f(k+j) - t
+        f(k+j) = f(k+j) + t
+        w = w * wm
+      end do
+    end do
+    m = 2 * m
+  end do
+
+end subroutine
+
 !Subroutine to get Z <- g(z)
 !Goodman & Weare, 2010 paper
-subroutine find_gz(a,z)
+subroutine find_gz(a,z,rng)
 implicit none
 
 !In/Out variables
   double precision, intent(out) :: z
   double precision, intent(in) :: a
+  integer(kind=8), intent(inout) :: rng(0:5)
 !Internal variables
-  double precision :: x
+  double precision :: x(0:0)
 
   !Thesis of Kaiser, Alexander D
   !Computational Experiments in Markov Chain Monte Carlo
-  call random_number(x)
-  z = ( a - 2.d0 + 1.d0/a ) * x*x + 2.d0 * (1.d0 - 1.d0/a ) * x + 1.d0/a
+  call rng_uniform(rng,x,1)
+  z = ( a - 2.d0 + 1.d0/a ) * x(0)*x(0) + 2.d0 * (1.d0 - 1.d0/a ) * x(0) + 1.d0/a
 
 end subroutine
 
@@ -272,41 +543,64 @@ implicit none
 
 end subroutine
 
+!c and alpha of the power-2 law from q1 and q2 of Short et al. (2019),
+!h2 = 1 - sqrt(q1), h1 = h2 + q2 sqrt(q1), c = 1 - h1 + h2, alpha = log2(c/h2)
+!The physical solutions have q1 and q2 between 0 and 1
+subroutine qtoc_p2(q1,q2,c,alpha,is_good)
+implicit none
+
+  double precision, intent(in) :: q1, q2
+  double precision, intent(out) :: c, alpha
+  logical, intent(out) :: is_good
+
+  double precision :: h2
+
+  is_good = ( q1 >= 0.d0 .and. q1 < 1.d0 .and. q2 >= 0.d0 .and. q2 <= 1.d0 )
+
+  h2 = 1.d0 - sqrt( max( q1, 0.d0 ) )
+  c = 1.d0 - sqrt( max( q1, 0.d0 ) ) * q2
+  alpha = 0.d0
+  if ( is_good .and. c > 0.d0 ) alpha = log( c / h2 ) / log(2.d0)
+
+end subroutine
+
 !Subroutine to create random integers between 0 and n
-subroutine random_int(r_int,mnv,mxv)
+subroutine random_int(r_int,mnv,mxv,rng)
 implicit none
 
   !In/Out variables
   integer, intent(in) :: mnv,mxv
   integer, intent(out), dimension(0:mxv-mnv-1) :: r_int
+  integer(kind=8), intent(inout) :: rng(0:5)
   !Local variables
-  real :: r_real
+  double precision :: r_real(0:0)
   integer :: i, j
 
   do i = mnv, mxv
     j = i-mnv
     r_int(j) = i
     do while ( r_int(j) == i )
-      call random_number(r_real)
-      r_int(j) =  mnv + int ( r_real * ( 1 + mxv - mnv ) )
+      call rng_uniform(rng,r_real,1)
+      r_int(j) =  mnv + int ( r_real(0) * ( 1 + mxv - mnv ) )
     end do
   end do
 
 end subroutine
 
 !Create a normal distribution based on Box-Muller
-subroutine gauss_random_bm(mu,sigma,valor,n)
+subroutine gauss_random_bm(mu,sigma,valor,n,rng)
 implicit none
 
   !In/Out variables
   integer, intent(in) :: n
   double precision, intent(in) :: mu, sigma
   double precision, intent(out), dimension(0:n-1) :: valor
+  integer(kind=8), intent(inout) :: rng(0:5)
   !Local variables
   double precision, dimension(0:2*n-1) :: r_real
   double precision  :: two_pi = 2.d0*3.1415926535897932384626d0
 
-  call random_number(r_real)
+  call rng_uniform(rng,r_real,2*n)
 
   valor(:) = sqrt( - 2.d0 * log(r_real(0:n-1)) ) * &
              cos( two_pi * r_real(n:2*n-1))
@@ -315,6 +609,52 @@ implicit none
 
 end subroutine
 
+!Inverse of the normal cumulative distribution function,
+!rational approximation by P. J. Acklam with one Halley step
+subroutine inv_normal(p,x)
+implicit none
+
+  !In/Out variables
+  double precision, intent(in) :: p
+  double precision, intent(out) :: x
+  !Local variables
+  double precision, dimension(6) :: a, c
+  double precision, dimension(5) :: b
+  double precision, dimension(4) :: d
+  double precision :: q, r, e, u
+  double precision :: p_low = 0.02425d0
+  double precision  :: two_pi = 2.d0*3.1415926535897932384626d0
+
+  a = (/ -3.969683028665376d+01, 2.209460984245205d+02, -2.759285104469687d+02, &
+          1.383577518672690d+02, -3.066479806614716d+01, 2.506628277459239d+00 /)
+  b = (/ -5.447609879822406d+01, 1.615858368580409d+02, -1.556989798598866d+02, &
+          6.680131188771972d+01, -1.328068155288572d+01 /)
+  c = (/ -7.784894002430293d-03, -3.223964580411365d-01, -2.400758277161838d+00, &
+         -2.549732539343734d+00,  4.374664141464968d+00,  2.938163982698783d+00 /)
+  d = (/  7.784695709041462d-03,  3.224671290700398d-01,  2.445134137142996d+00, &
+          3.754408661907416d+00 /)
+
+  if ( p < p_low ) then
+    q = sqrt( - 2.d0 * log(p) )
+    x = (((((c(1)*q+c(2))*q+c(3))*q+c(4))*q+c(5))*q+c(6)) / &
+         ((((d(1)*q+d(2))*q+d(3))*q+d(4))*q+1.d0)
+  else if ( p <= 1.d0 - p_low ) then
+    q = p - 0.5d0
+    r = q * q
+    x = (((((a(1)*r+a(2))*r+a(3))*r+a(4))*r+a(5))*r+a(6))*q / &
+        (((((b(1)*r+b(2))*r+b(3))*r+b(4))*r+b(5))*r+1.d0)
+  else
+    q = sqrt( - 2.d0 * log(1.d0 - p) )
+    x = - (((((c(1)*q+c(2))*q+c(3))*q+c(4))*q+c(5))*q+c(6)) / &
+           ((((d(1)*q+d(2))*q+d(3))*q+d(4))*q+1.d0)
+  end if
+
+  e = 0.5d0 * erfc( - x / sqrt(2.d0) ) - p
+  u = e * sqrt(two_pi) * exp( 0.5d0 * x * x )
+  x = x - u / ( 1.d0 + 0.5d0 * x * u )
+
+end subroutine
+
 
 
 subroutine get_a_err(mstar_mean,mstar_sigma,rstar_mean,rstar_sigma,P,amean,aerr)
@@ -371,52 +711,79 @@ implicit none
 
 end subroutine
 
-subroutine uniform_chains(pars,npars,wtf,lims,pars_out)
+!Acceptance rate of each walker in the last n_prop iterations
+subroutine print_acceptance(n_acc,n_prop,a_factor,n)
+implicit none
+  integer, intent(in) :: n, n_prop
+  integer, intent(in) :: n_acc(0:n-1)
+  double precision, intent(in) :: a_factor
+  double precision :: rate(0:n-1)
+  character(LEN=20) :: fto = "(A,F10.2)"
+  character(LEN=20) :: fti = "(A,I10)"
+
+  rate(:) = dble(n_acc(:)) / max(n_prop,1)
+
+  write(*,*) '=================================='
+  write(*,*) '     Acceptance statistics      '
+  write(*,*) '=================================='
+  write(*,*) 'chain |  acceptance rate '
+  write(*,fto) ' best  : ',maxval(rate)
+  write(*,fto) ' worst : ',minval(rate)
+  write(*,fto) ' mean  : ', sum(rate) / n
+  write(*,fti) ' stuck : ', count(n_acc == 0)
+  write(*,fto) ' a     : ', a_factor
+  write(*,*) '=================================='
+
+end subroutine
+
+subroutine uniform_chains(pars,npars,wtf,lims,pars_out,rng)
 implicit none
 
   integer, intent(in) :: npars
+  integer(kind=8), intent(inout) :: rng(0:5)
   integer, intent(in), dimension(0:npars-1) :: wtf
   double precision, intent(in), dimension(0:2*npars-1) :: lims
   double precision, intent(in), dimension(0:npars-1) :: pars
   double precision, intent(out), dimension(0:npars-1) :: pars_out
 !Local
   integer :: n, j
-  double precision :: r_real
+  double precision :: r_real(0:0)
 
   j = 0
   do n = 0,  npars - 1
     if ( wtf(n) == 0 ) then
       pars_out(n) = pars(n)
     else
-      call random_number(r_real)
+      call rng_uniform(rng,r_real,1)
       pars_out(n) = lims(j+1) - lims(j)
-      pars_out(n) = lims(j) + r_real * pars_out(n)
+      pars_out(n) = lims(j) + r_real(0) * pars_out(n)
     end if
     j = j + 2
   end do
 
 end subroutine
 
-subroutine create_chains(fit_pars,lims,pars_out,npars)
+subroutine create_chains(fit_pars,lims,pars_out,npars,rng)
 implicit none
 
   integer, intent(in) :: npars
+  integer(kind=8), intent(inout) :: rng(0:5)
   double precision, intent(in), dimension(0:2*npars-1) :: lims
   double precision, intent(out), dimension(0:npars-1) :: pars_out
   character, intent(in), dimension(0:npars-1) :: fit_pars
 !Local
   integer :: j
-  double precision :: r_real
+  double precision :: r_real(0:0)
 
   do j = 0, npars - 1
     if ( fit_pars(j) == 'f' ) then
        pars_out(j) = lims(j*2)
     else if ( fit_pars(j) == 'u' ) then
-      call random_number(r_real)
+      call rng_uniform(rng,r_real,1)
       pars_out(j) = lims(2*j+1) - lims(2*j)
-      pars_out(j) = lims(2*j) + r_real * pars_out(j)
+      pars_out(j) = lims(2*j) + r_real(0) * pars_out(j)
     else if ( fit_pars(j) == 'g' ) then
-      call gauss_random_bm(lims(2*j),lims(2*j+1),pars_out(j),1)
+      call gauss_random_bm(lims(2*j),lims(2*j+1),pars_out(j),1,rng)
     end if
   end do
 
@@ -461,3 +828,43 @@ implicit none
   i(:) = acos( b(:) / a(:) * ( 1.d0 + e(:) * sin(w(:)) ) / ( 1.d0 - e(:)*e(:) ) )
 
 end subroutine
+
+!------------------------------------------------------------
+!Nodes x and weights w of the n-point Gauss-Legendre rule in
+![-1,1], the roots of P_n are found by Newton-Raphson from the
+!estimate cos(pi (i + 3/4) / (n + 1/2)), sum(w) = 2
+!------------------------------------------------------------
+subroutine gauss_legendre(n,x,w)
+implicit none
+
+  !In/Out variables
+  integer, intent(in) :: n
+  double precision, intent(out), dimension(0:n-1) :: x, w
+  !Local variables
+  double precision :: pi = 3.1415926535897932384626d0
+  double precision :: z, z1, p1, p2, p3, pp
+  integer :: i, j, it
+
+  do i = 0, (n+1)/2 - 1
+    z = cos( pi * ( i + 0.75d0 ) / ( n + 0.5d0 ) )
+    do it = 1, 100
+      !P_n(z) from the recurrence, pp is its derivative
+      p1 = 1.d0
+      p2 = 0.d0
+      do j = 1, n
+        p3 = p2
+        p2 = p1
+        p1 = ( ( 2.d0*j - 1.d0 ) * z * p2 - ( j - 1.d0 ) * p3 ) / j
+      end do
+      pp = n * ( z * p1 - p2 ) / ( z * z - 1.d0 )
+      z1 = z
+      z  = z1 - p1 / pp
+      if ( abs(z - z1) < 1.d-15 ) exit
+    end do
+    x(i) = - z
+    x(n-1-i) = z
+    w(i) = 2.d0 / ( ( 1.d0 - z * z ) * pp * pp )
+    w(n-1-i) = w(i)
+  end do
+
+end subroutine